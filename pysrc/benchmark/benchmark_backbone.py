@@ -0,0 +1,81 @@
+import glob
+import os
+
+import torch
+
+import sys
+sys.path.append('../')
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import network_mod
+from common import dataloader_mod
+from common import benchmark_mod
+
+def findWeights(weights_dir, method_name, backbone_name):
+    ## the latest weights saved by train.py: str_hyperparameter starts with method_name + "_" + backbone_name + "_"
+    list_path = glob.glob(os.path.join(weights_dir, method_name + "_" + backbone_name + "_*.pth"))
+    if not list_path:
+        return None
+    return max(list_path, key=os.path.getmtime)
+
+def main():
+    ## hyperparameters
+    list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
+    csv_name = "imu_camera.csv"
+    resize = 224
+    mean_element = 0.5
+    std_element = 0.5
+    batch_size = 1  #on-robot: one frame at a time
+    num_threads = None  #None: torch default
+    list_dim_fc_out = [100, 18, 3]  #[100, 18, 9] for mle
+    weights_dir = "../../weights"
+    list_backbone = [
+        #backbone_name, weights_path (trained with the same backbone_name, None: the latest of train.py in weights_dir, missing: fps only)
+        ("vgg16", "../../weights/regression.pth"),
+        ("mobilenet_v3_small", None),
+        ("mobilenet_v3_large", None),
+        ("resnet18", None),
+        ("efficientnet_b0", None)
+    ]
+    ## dataset
+    dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element])
+        ),
+        phase="val"
+    )
+    dataloader = dataloader_mod.DataloaderConfig().getDataloader(dataset, batch_size, shuffle=False)
+    ## on CPU
+    device = torch.device("cpu")
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    print("num_threads = ", torch.get_num_threads())
+    ## benchmark
+    list_dict_result = []
+    for backbone_name, weights_path in list_backbone:
+        print("-----", backbone_name, "-----")
+        net = network_mod.Network(resize, list_dim_fc_out=list_dim_fc_out, dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+        if weights_path is None:
+            weights_path = findWeights(weights_dir, "regression", backbone_name)
+        is_trained = (weights_path is not None) and os.path.isfile(weights_path)
+        if is_trained:
+            net.load_state_dict(torch.load(weights_path, map_location=device))
+        else:
+            print("not found: ", weights_path, " -> mae of untrained weights")
+        net.to(device)
+        net.eval()
+        dict_result = {
+            "params[M]": sum(param_value.numel() for param_value in net.parameters()) / 1e6,
+            "fc_params[M]": sum(param_value.numel() for param_value in net.fc.parameters()) / 1e6,
+            "is_trained": float(is_trained)
+        }
+        dict_result.update(benchmark_mod.evaluateNetwork(net, dataloader, device))
+        list_dict_result.append(dict_result)
+    benchmark_mod.printTable([backbone[0] for backbone in list_backbone], list_dict_result)
+
+if __name__ == '__main__':
+    main()
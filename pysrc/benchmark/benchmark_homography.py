@@ -0,0 +1,55 @@
+import numpy as np
+import math
+import random
+import time
+
+import sys
+sys.path.append('../')
+from common import data_transform_mod
+
+def main():
+    ## hyperparameters
+    resize = 224
+    mean_element = 0.5
+    std_element = 0.5
+    hor_fov_deg = 70
+    hom_resolution_deg = 0.01
+    (w, h) = (672, 376)
+    num_samples = 10000
+    ## transform
+    transform_table = data_transform_mod.DataTransform(resize, ([mean_element]*3), ([std_element]*3), hor_fov_deg=hor_fov_deg, hom_resolution_deg=hom_resolution_deg)
+    transform_direct = data_transform_mod.DataTransform(resize, ([mean_element]*3), ([std_element]*3), hor_fov_deg=hor_fov_deg, hom_resolution_deg=-1)
+    list_angle_rad = [random.uniform(-10.0, 10.0) / 180.0 * math.pi for _ in range(num_samples)]
+    ## find_coeffs (least squares per sample)
+    def getCoeffsLeastSquares(angle_rad):
+        points_after, points_before = transform_direct.getHomographyPoints(w, h, angle_rad)
+        return transform_direct.find_coeffs(points_after, points_before)
+    ## table is built before timing, as it is shared by all samples
+    start_clock = time.perf_counter()
+    transform_table.getHomographyTable(w, h)
+    print("table build [ms]: ", (time.perf_counter() - start_clock) * 1000.0)
+    list_mode = [
+        ("find_coeffs", getCoeffsLeastSquares),
+        ("direct", lambda angle_rad: transform_direct.getHomographyCoeffs(w, h, angle_rad)[1]),
+        ("table", lambda angle_rad: transform_table.getHomographyCoeffs(w, h, angle_rad)[1])
+    ]
+    ## corner displacement against find_coeffs at the exact angle
+    array_corner = np.array([[0, 0, 1], [w, 0, 1], [0, h, 1], [w, h, 1]], dtype=np.float64).T
+    def mapCorners(array_coeffs):
+        mat = np.concatenate([array_coeffs, np.ones((len(array_coeffs), 1))], 1).reshape(-1, 3, 3)
+        points = mat @ array_corner
+        return points[:, :2] / points[:, 2:]
+    ## benchmark
+    list_coeffs_ref = None
+    print("name | time[us/sample] | max_corner_diff[px]")
+    for name, function in list_mode:
+        start_clock = time.perf_counter()
+        list_coeffs = [function(angle_rad) for angle_rad in list_angle_rad]
+        time_per_sample = (time.perf_counter() - start_clock) / num_samples * 1e6
+        if list_coeffs_ref is None:
+            list_coeffs_ref = np.array(list_coeffs)
+        max_corner_diff = np.abs(mapCorners(np.array(list_coeffs)) - mapCorners(list_coeffs_ref)).max()
+        print(name, "|", "{:.2f}".format(time_per_sample), "|", "{:.3g}".format(max_corner_diff))
+
+if __name__ == '__main__':
+    main()
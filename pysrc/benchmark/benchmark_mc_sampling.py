@@ -0,0 +1,109 @@
+import numpy as np
+import math
+import time
+from tqdm import tqdm
+
+import torch
+import torch.nn as nn
+
+import sys
+sys.path.append('../')
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import network_mod
+from common import dataloader_mod
+from common import attitude_error_mod
+from common import mc_sampling_mod
+
+def sampleFixed(net, features, num_mcsampling):
+    ## the loop of regression/mc_dropout.py (use_cached_feature=True)
+    accumulator = mc_sampling_mod.McAccumulator(features.size(0), 3, features.device)
+    accumulator.update(slice(None), net.forwardFcMcSampling(features, num_mcsampling)[:, :, :3])
+    return accumulator.mean, accumulator.getCov()
+
+def main():
+    ## hyperparameters
+    list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
+    csv_name = "imu_camera.csv"
+    resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
+    mean_element = 0.5
+    std_element = 0.5
+    batch_size = 10
+    weights_path = "../../weights/regression.pth"
+    num_mcsampling = 50
+    th_mul_std = 0.001
+    is_full_forward_timed = True    #also time use_cached_feature=False (num_mcsampling full forwards per batch: slow)
+    ## dataset
+    dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element])
+        ),
+        phase="val"
+    )
+    dataloader = dataloader_mod.DataloaderConfig().getDataloader(dataset, batch_size, shuffle=False)
+    ## network with dropout enabled
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    net.load_state_dict(torch.load(weights_path, map_location=device))
+    net.to(device)
+    net.eval()
+    for module in net.modules():
+        if isinstance(module, nn.Dropout):
+            module.train()
+    criterion = nn.MSELoss()
+    sampler = mc_sampling_mod.AdaptiveMcSampler(max_samples=num_mcsampling, th_mul_std=th_mul_std)
+    sampler_full = mc_sampling_mod.AdaptiveMcSampler(max_samples=num_mcsampling, th_mul_std=th_mul_std)
+    ## benchmark
+    list_mean = {"fixed": [], "adaptive": []}
+    list_cov = {"fixed": [], "adaptive": []}
+    dict_time = {"cnn": 0.0, "fixed": 0.0, "adaptive": 0.0, "fixed_full": 0.0, "adaptive_full": 0.0}
+    with torch.set_grad_enabled(False):
+        for inputs, labels in tqdm(dataloader):
+            inputs = inputs.to(device)
+            labels = labels.to(device)
+            ## backbone: common to both
+            start_clock = time.perf_counter()
+            features = net.forwardCnn(inputs)
+            dict_time["cnn"] += time.perf_counter() - start_clock
+            ## fixed
+            start_clock = time.perf_counter()
+            mean, cov = sampleFixed(net, features, num_mcsampling)
+            list_mean["fixed"].append(mean.cpu().numpy())
+            list_cov["fixed"].append(cov.cpu().numpy())
+            dict_time["fixed"] += time.perf_counter() - start_clock
+            ## adaptive
+            start_clock = time.perf_counter()
+            mean, cov, _, _, _ = sampler.sample(net, inputs, labels, lambda outputs, labels: (criterion(outputs, labels), None), features=features)
+            list_mean["adaptive"].append(mean.cpu().numpy())
+            list_cov["adaptive"].append(cov.cpu().numpy())
+            dict_time["adaptive"] += time.perf_counter() - start_clock
+            ## use_cached_feature=False: every draw is a full forward
+            if is_full_forward_timed:
+                start_clock = time.perf_counter()
+                for _ in range(num_mcsampling):
+                    net(inputs)
+                dict_time["fixed_full"] += time.perf_counter() - start_clock
+                start_clock = time.perf_counter()
+                sampler_full.sample(net, inputs, labels, lambda outputs, labels: (criterion(outputs, labels), None), use_cached_feature=False)
+                dict_time["adaptive_full"] += time.perf_counter() - start_clock
+    ## compare
+    array_mean = {key: np.concatenate(value) for key, value in list_mean.items()}
+    array_mul_std = {key: attitude_error_mod.computeMulStd(np.concatenate(value)) for key, value in list_cov.items()}
+    array_diff_deg = attitude_error_mod.getAngleBetweenVectors(array_mean["fixed"], array_mean["adaptive"]) / math.pi * 180.0
+    array_is_same = (array_mul_std["fixed"] < th_mul_std) == (array_mul_std["adaptive"] < th_mul_std)
+    print("average #draws: fixed ", num_mcsampling, ", adaptive ", sampler.getAverageDraws())
+    print("sampling time [s]: fixed ", dict_time["fixed"], ", adaptive ", dict_time["adaptive"], " -> speedup ", dict_time["fixed"] / dict_time["adaptive"])
+    print("with the backbone (", dict_time["cnn"], " [s]) -> speedup ", (dict_time["cnn"] + dict_time["fixed"]) / (dict_time["cnn"] + dict_time["adaptive"]))
+    if is_full_forward_timed:
+        print("use_cached_feature=False: fixed ", dict_time["fixed_full"], " [s], adaptive ", dict_time["adaptive_full"], " [s] (", sampler_full.getAverageDraws(), " draws) -> speedup ", dict_time["fixed_full"] / dict_time["adaptive_full"])
+    print("mean: fixed vs adaptive [deg]: ave ", np.mean(array_diff_deg), ", max ", np.max(array_diff_deg))
+    print("mul_std: median ratio adaptive/fixed ", np.median(array_mul_std["adaptive"] / array_mul_std["fixed"]))
+    print("same selection (mul_std < th_mul_std): ", np.sum(array_is_same), " / ", len(array_is_same))
+
+if __name__ == '__main__':
+    main()
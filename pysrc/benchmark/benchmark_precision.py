@@ -0,0 +1,59 @@
+import torch
+
+import sys
+sys.path.append('../')
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import network_mod
+from common import dataloader_mod
+from common import benchmark_mod
+
+def main():
+    ## hyperparameters
+    list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
+    csv_name = "imu_camera.csv"
+    resize = 224
+    mean_element = 0.5
+    std_element = 0.5
+    batch_size = 10
+    weights_path = "../../weights/regression.pth"
+    list_dim_fc_out = [100, 18, 3]  #[100, 18, 9] for mle
+    list_mode = [
+        #name, is_channels_last, autocast_dtype
+        ("float32", False, None),
+        ("channels_last", True, None),
+        ("bfloat16", False, torch.bfloat16),
+        ("channels_last+bfloat16", True, torch.bfloat16)
+    ]
+    ## dataset
+    dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element])
+        ),
+        phase="val"
+    )
+    dataloader = dataloader_mod.DataloaderConfig().getDataloader(dataset, batch_size, shuffle=False)
+    ## network
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    net = network_mod.Network(resize, list_dim_fc_out=list_dim_fc_out, dropout_rate=0.1, use_pretrained_vgg=False)
+    net.load_state_dict(torch.load(weights_path, map_location=device))
+    net.to(device)
+    net.eval()
+    ## benchmark
+    list_dict_result = []
+    for name, is_channels_last, autocast_dtype in list_mode:
+        print("-----", name, "-----")
+        net.setInferenceMode(is_channels_last, autocast_dtype)
+        list_dict_result.append(benchmark_mod.evaluateNetwork(net, dataloader, device))
+    ## delta against float32
+    for dict_result in list_dict_result:
+        for key in ["mae_r[deg]", "mae_p[deg]", "mae_g_angle[deg]"]:
+            dict_result["delta_" + key] = dict_result[key] - list_dict_result[0][key]
+    benchmark_mod.printTable([mode[0] for mode in list_mode], list_dict_result)
+
+if __name__ == '__main__':
+    main()
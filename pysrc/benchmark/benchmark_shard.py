@@ -0,0 +1,83 @@
+import numpy as np
+import time
+import os
+
+import sys
+sys.path.append('../')
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import shard_mod
+from common import dataloader_mod
+from common import benchmark_mod
+
+def measureFileRead(data_index, seed=0):
+    ## one small file per sample, in the shuffled order of a training epoch
+    start_clock = time.perf_counter()
+    num_bytes = 0
+    for index in np.random.default_rng(seed).permutation(len(data_index)):
+        with open(data_index.getPath(index), "rb") as f:
+            num_bytes += len(f.read())
+    return len(data_index) / (time.perf_counter() - start_clock), num_bytes
+
+def measureShardRead(shard_dir):
+    dataset = shard_mod.ShardDataset(shard_dir, None, "val")
+    start_clock = time.perf_counter()
+    num_samples = 0
+    num_bytes = 0
+    for shard_path in dataset.list_shard_path:
+        for img_bytes, _ in shard_mod.readShard(shard_path):
+            num_samples += 1
+            num_bytes += len(img_bytes)
+    return num_samples / (time.perf_counter() - start_clock), num_bytes
+
+def measureLoad(dataset, batch_size, num_workers):
+    ## decoding + DataTransform as in training
+    dataloader = dataloader_mod.DataloaderConfig(num_workers=num_workers, persistent_workers=False).getDataloader(dataset, batch_size, shuffle=True)
+    start_clock = time.perf_counter()
+    num_samples = 0
+    for inputs, _ in dataloader:
+        num_samples += inputs.size(0)
+    return num_samples / (time.perf_counter() - start_clock)
+
+def main():
+    ## hyperparameters
+    list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
+    csv_name = "imu_camera.csv"
+    shard_dir = "../../shards/train"    #packed here first if it has no manifest.json
+    num_samples_per_shard = 1000
+    shuffle_buffer_size = 1000
+    resize = 224
+    mean_element = 0.5
+    std_element = 0.5
+    hor_fov_deg = 70
+    batch_size = 50
+    list_num_workers = [0, 4]
+    ## the first run after "sync; echo 3 > /proc/sys/vm/drop_caches" (root) shows the disk, the later ones the page cache
+    ## data
+    data_index = data_index_mod.makeDataIndex(list_rootpath, csv_name)
+    if not os.path.isfile(os.path.join(shard_dir, "manifest.json")):
+        shard_mod.packShards(data_index, shard_dir, num_samples_per_shard=num_samples_per_shard)
+    transform = data_transform_mod.DataTransform(
+        resize,
+        ([mean_element, mean_element, mean_element]),
+        ([std_element, std_element, std_element]),
+        hor_fov_deg=hor_fov_deg
+    )
+    ## raw read
+    list_name = ["files", "shards"]
+    list_dict_result = [{}, {}]
+    for dict_result, (images_per_sec, num_bytes) in zip(list_dict_result, [measureFileRead(data_index), measureShardRead(shard_dir)]):
+        dict_result["read[img/s]"] = images_per_sec
+        dict_result["read[MB/s]"] = images_per_sec * num_bytes / len(data_index) / 1e6
+    ## training input pipeline
+    for num_workers in list_num_workers:
+        key = "load_workers" + str(num_workers) + "[img/s]"
+        list_dict_result[0][key] = measureLoad(dataset_mod.OriginalDataset(data_index, transform, "train"), batch_size, num_workers)
+        list_dict_result[1][key] = measureLoad(shard_mod.ShardDataset(shard_dir, transform, "train", shuffle_buffer_size=shuffle_buffer_size), batch_size, num_workers)
+    for dict_result in list_dict_result:
+        dict_result["speedup_read"] = dict_result["read[img/s]"] / list_dict_result[0]["read[img/s]"]
+    benchmark_mod.printTable(list_name, list_dict_result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import numpy as np
+
+## all functions work on whole arrays: acc (N, 3), angles (N, ...), cov (N, 3, 3)
+
+def accToRP(acc):
+    acc = np.asarray(acc, dtype=np.float64)
+    r = np.arctan2(acc[..., 1], acc[..., 2])
+    p = np.arctan2(-acc[..., 0], np.sqrt(acc[..., 1]*acc[..., 1] + acc[..., 2]*acc[..., 2]))
+    rp = np.stack([r, p], axis=-1)
+    return rp
+
+def computeAngleDiff(angle1, angle2):
+    diff = np.arctan2(np.sin(angle1 - angle2), np.cos(angle1 - angle2))
+    return diff
+
+def getAngleBetweenVectors(v1, v2):
+    v1 = np.asarray(v1, dtype=np.float64)
+    v2 = np.asarray(v2, dtype=np.float64)
+    cos = np.sum(v1*v2, axis=-1) / np.linalg.norm(v1, ord=2, axis=-1) / np.linalg.norm(v2, ord=2, axis=-1)
+    ## clip rounding errors out of the domain of acos
+    return np.arccos(np.clip(cos, -1.0, 1.0))
+
+def computeMAE(x):
+    return np.mean(np.abs(x), axis=0)
+
+def computeVar(x):
+    return np.var(x, axis=0)
+
+def computeMulStd(cov):
+    cov = np.asarray(cov, dtype=np.float64)
+    mul_std = np.sqrt(cov[:, 0, 0]) * np.sqrt(cov[:, 1, 1]) * np.sqrt(cov[:, 2, 2])
+    return mul_std
+
+def computeWeightedMAE(x, weights):
+    weighted_mae = np.sum(np.abs(x) * weights[:, np.newaxis], axis=0) / np.sum(weights)
+    return weighted_mae
@@ -0,0 +1,168 @@
+import numpy as np
+import math
+import time
+
+import torch
+
+from common import attitude_error_mod
+
+def getSkewMatrix(v):
+    return np.array([
+        [0.0, -v[2], v[1]],
+        [v[2], 0.0, -v[0]],
+        [-v[1], v[0], 0.0]
+    ])
+
+def getRotationMatrix(rotvec):
+    ## Rodrigues
+    angle = np.linalg.norm(rotvec)
+    if angle < 1e-12:
+        return np.eye(3) + getSkewMatrix(rotvec)
+    K = getSkewMatrix(rotvec / angle)
+    return np.eye(3) + math.sin(angle) * K + (1.0 - math.cos(angle)) * K @ K
+
+class GravityEKF:
+    ## state: unit gravity direction g in the camera frame, covariance P (3x3)
+    def __init__(self, gyro_noise=0.01, random_walk_noise=0.5, measurement_var=0.01, th_skip_var=None, th_mahalanobis=None):
+        self.gyro_noise = gyro_noise                #[rad/s/sqrt(Hz)] angular random walk of the gyro
+        self.random_walk_noise = random_walk_noise  #[1/sqrt(s)] motion model without gyro
+        self.measurement_var = measurement_var      #network variance when no covariance is given (regression)
+        self.th_skip_var = th_skip_var              #the network is skipped while trace(P) is below this, None: never skipped
+        self.th_mahalanobis = th_mahalanobis        #e.g. 11.34 (chi2, 3 dof, 99%): measurements beyond are rejected, None: all accepted
+        self.g = None
+        self.P = None
+
+    def isInitialized(self):
+        return self.g is not None
+
+    def initialize(self, mean, cov=None):
+        self.g = np.asarray(mean, dtype=np.float64) / np.linalg.norm(mean)
+        self.P = self.getMeasurementCov(cov)
+
+    def getMeasurementCov(self, cov):
+        if cov is None:
+            return self.measurement_var * np.eye(3)
+        return np.asarray(cov, dtype=np.float64)
+
+    def predict(self, dt, gyro=None):
+        if not self.isInitialized():
+            return
+        if gyro is None:
+            ## random walk on the sphere (tangent directions only)
+            F = np.eye(3)
+            Q = self.random_walk_noise**2 * dt * (np.eye(3) - np.outer(self.g, self.g))
+        else:
+            ## the camera rotates by gyro*dt, so gravity seen from it rotates by -gyro*dt
+            F = getRotationMatrix(-np.asarray(gyro, dtype=np.float64) * dt)
+            G = getSkewMatrix(self.g)
+            Q = self.gyro_noise**2 * dt * (G @ G.T)
+        self.g = F @ self.g
+        self.P = F @ self.P @ F.T + Q
+
+    def update(self, mean, cov=None):
+        ## returns False when the measurement is rejected
+        z = np.asarray(mean, dtype=np.float64) / np.linalg.norm(mean)
+        R = self.getMeasurementCov(cov)
+        if not self.isInitialized():
+            self.initialize(z, R)
+            return True
+        y = z - self.g
+        S = self.P + R
+        S_inv = np.linalg.inv(S)
+        if (self.th_mahalanobis is not None) and (y @ S_inv @ y > self.th_mahalanobis):
+            return False
+        K = self.P @ S_inv
+        I_K = np.eye(3) - K
+        self.g = self.g + K @ y
+        self.g = self.g / np.linalg.norm(self.g)
+        self.P = I_K @ self.P @ I_K.T + K @ R @ K.T  #Joseph form: stays symmetric positive definite
+        return True
+
+    def isEstimationNeeded(self):
+        if (not self.isInitialized()) or (self.th_skip_var is None):
+            return True
+        return np.trace(self.P) > self.th_skip_var
+
+    def getRP(self):
+        return attitude_error_mod.accToRP(self.g)
+
+class FilteredInference:
+    ## frames in CSV order: acc_x, acc_y, acc_z, image, [timestamp [s], gyro_x, gyro_y, gyro_z [rad/s]]
+    def __init__(self, dataset, net, weights_path, criterion, ekf, camera_rate_hz=10.0):
+        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        print("self.device = ", self.device)
+        self.dataset = dataset
+        self.net = self.getSetNetwork(net, weights_path)
+        self.criterion = criterion  #mle: covariance of each estimate, None: ekf.measurement_var
+        self.ekf = ekf
+        self.camera_rate_hz = camera_rate_hz    #dt without timestamps
+        ## results
+        num_data = len(dataset)
+        self.array_labels = np.empty((num_data, 3), dtype=np.float64)
+        self.array_filtered = np.empty((num_data, 3), dtype=np.float64)
+        self.array_is_estimated = np.zeros(num_data, dtype=bool)
+        self.array_est = np.full((num_data, 3), np.nan, dtype=np.float64)
+
+    def getSetNetwork(self, net, weights_path):
+        net.to(self.device)
+        net.eval()
+        ## load
+        loaded_weights = torch.load(weights_path, map_location=self.device)
+        print("Loaded: ", weights_path)
+        net.load_state_dict(loaded_weights)
+        return net
+
+    def getTimestampAndGyro(self, index):
+        ## columns after the image
+        extra = self.dataset.data_list.getExtraColumns(index)
+        timestamp = float(extra[0]) if len(extra) > 0 else index / self.camera_rate_hz
+        gyro = np.array([float(num) for num in extra[1:4]]) if len(extra) > 3 else None
+        return timestamp, gyro
+
+    def infer(self):
+        start_clock = time.time()
+        network_time = 0.0
+        last_timestamp = None
+        for index in range(len(self.dataset)):
+            timestamp, gyro = self.getTimestampAndGyro(index)
+            ## predict
+            if last_timestamp is not None:
+                self.ekf.predict(timestamp - last_timestamp, gyro)
+            last_timestamp = timestamp
+            ## update: the image is loaded only when the network runs
+            if self.ekf.isEstimationNeeded():
+                network_clock = time.time()
+                inputs, labels = self.dataset[index]
+                mean, cov = self.estimate(inputs)
+                network_time += time.time() - network_clock
+                self.ekf.update(mean, cov)
+                self.array_is_estimated[index] = True
+                self.array_est[index] = mean
+            else:
+                labels = self.dataset.data_list.labels[index].astype(np.float64)
+            self.array_labels[index] = np.asarray(labels) / np.linalg.norm(labels)
+            self.array_filtered[index] = self.ekf.g
+        self.showResult(time.time() - start_clock, network_time)
+
+    def estimate(self, inputs):
+        with torch.set_grad_enabled(False):
+            outputs = self.net(inputs.unsqueeze(0).to(self.device))
+            cov = None if self.criterion is None else self.criterion.getCovMatrix(outputs)[0].cpu().numpy()
+        mean = outputs[0, :3].cpu().numpy()
+        return mean, cov
+
+    def computeMAE(self, array_est, array_labels):
+        error_rp = attitude_error_mod.computeAngleDiff(attitude_error_mod.accToRP(array_est), attitude_error_mod.accToRP(array_labels))
+        error_g_angle = attitude_error_mod.getAngleBetweenVectors(array_est, array_labels)
+        return attitude_error_mod.computeMAE(error_rp/math.pi*180.0), attitude_error_mod.computeMAE(error_g_angle/math.pi*180.0)
+
+    def showResult(self, total_time, network_time):
+        num_estimated = np.count_nonzero(self.array_is_estimated)
+        print("-----")
+        print("frames: ", len(self.dataset), ", network calls: ", num_estimated, " (", 100.0 * (1.0 - num_estimated / len(self.dataset)), " [%] skipped)")
+        print("time: ", total_time, " [s] (network ", network_time, " [s], filter ", total_time - network_time, " [s])")
+        mae_rp, mae_g_angle = self.computeMAE(self.array_filtered, self.array_labels)
+        print("filtered: mae_rp [deg] = ", mae_rp, ", mae_g_angle [deg] = ", mae_g_angle)
+        if num_estimated > 0:
+            mae_rp, mae_g_angle = self.computeMAE(self.array_est[self.array_is_estimated], self.array_labels[self.array_is_estimated])
+            print("network (estimated frames only): mae_rp [deg] = ", mae_rp, ", mae_g_angle [deg] = ", mae_g_angle)
@@ -0,0 +1,212 @@
+import numpy as np
+import math
+
+import torch
+import torch.nn.functional as F
+
+from common import data_transform_mod
+
+class BatchDataTransform(data_transform_mod.DataTransform):
+    def __init__(self, resize, mean, std, hor_fov_deg=-1, is_antialiased=True):
+        super(BatchDataTransform, self).__init__(resize, mean, std, hor_fov_deg=hor_fov_deg)
+        self.is_antialiased = is_antialiased   #low-pass like transforms.Resize before the warp when downscaling
+
+    def __call__(self, img_pil, acc_numpy, phase="train"):  #overwrite
+        if phase != "train":
+            return super(BatchDataTransform, self).__call__(img_pil, acc_numpy, phase=phase)
+        ## augmentation is done by augmentBatch: raw uint8 (ch, h, w) and raw acc
+        img_tensor = torch.from_numpy(np.asarray(img_pil.convert("RGB")).transpose((2, 0, 1)).copy())
+        acc_tensor = torch.from_numpy(acc_numpy.astype(np.float32))
+        return img_tensor, acc_tensor
+
+    def prebuildHomographyTable(self, w, h):   #overwrite
+        ## augmentBatch computes the homographies of a batch on the device: no table
+        return
+
+    def augmentBatch(self, imgs, accs):
+        batch_size = imgs.size(0)
+        is_mirror = torch.rand(batch_size) < 0.5
+        if 0 < self.hor_fov_rad < math.pi:
+            angle_hom_rad = (torch.rand(batch_size, dtype=torch.float64) * 20.0 - 10.0) / 180.0 * math.pi
+        else:
+            angle_hom_rad = torch.zeros(batch_size, dtype=torch.float64)
+        angle_rot_rad = (torch.rand(batch_size, dtype=torch.float64) * 20.0 - 10.0) / 180.0 * math.pi
+        return self.warpBatch(imgs, accs, is_mirror, angle_hom_rad, angle_rot_rad)
+
+    def warpBatch(self, imgs, accs, is_mirror, angle_hom_rad, angle_rot_rad):
+        ## same order as DataTransform: mirror -> homography -> rotation -> Resize -> CenterCrop
+        device = imgs.device
+        (h, w) = imgs.shape[2:]
+        is_mirror = is_mirror.to(device)
+        angle_hom_rad = angle_hom_rad.to(device)
+        angle_rot_rad = angle_rot_rad.to(device)
+        ## output pixel -> input pixel (3x3 per sample)
+        mat = self.getMirrorMatrix(w, is_mirror) @ self.getHomographyMatrix(w, h, angle_hom_rad) \
+            @ self.getRotationMatrix(w, h, angle_rot_rad) @ self.getCropMatrix(w, h, angle_rot_rad)
+        grid = self.getGrid(mat, w, h)
+        ## image
+        imgs = imgs.float() / 255.0
+        if self.is_antialiased and min(w, h) > self.resize:
+            imgs = F.interpolate(imgs, size=self.getResizedSize(w, h)[::-1], mode="bilinear", align_corners=False, antialias=True)
+        imgs = F.grid_sample(imgs, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+        mean = torch.tensor(self.mean, dtype=imgs.dtype, device=device).view(1, -1, 1, 1)
+        std = torch.tensor(self.std, dtype=imgs.dtype, device=device).view(1, -1, 1, 1)
+        imgs = (imgs - mean) / std
+        ## acc
+        rot = self.getRotationMatrixRoll(-angle_rot_rad) @ self.getRotationMatrixPitch(-angle_hom_rad) @ self.getMirrorMatrixAcc(is_mirror)
+        accs = (rot @ accs.to(rot.dtype).unsqueeze(-1)).squeeze(-1)
+        accs = (accs / accs.norm(dim=1, keepdim=True)).float()
+        return imgs, accs
+
+    def getResizedSize(self, w, h):
+        ## size after transforms.Resize(resize)
+        if w <= h:
+            return (self.resize, int(self.resize * h / w))
+        return (int(self.resize * w / h), self.resize)
+
+    def getCropMatrix(self, w, h, angle_rad):
+        (w_resized, h_resized) = self.getResizedSize(w, h)
+        left = int(round((w_resized - self.resize) / 2.0))
+        top = int(round((h_resized - self.resize) / 2.0))
+        mat = angle_rad.new_tensor([
+            [w / w_resized, 0, left * w / w_resized],
+            [0, h / h_resized, top * h / h_resized],
+            [0, 0, 1]
+        ])
+        return mat.expand(angle_rad.size(0), 3, 3)
+
+    def getRotationMatrix(self, w, h, angle_rad):
+        ## same as img_pil.rotate(angle_deg): counterclockwise around the image center
+        cos = torch.cos(angle_rad)
+        sin = torch.sin(angle_rad)
+        zeros = torch.zeros_like(angle_rad)
+        ones = torch.ones_like(angle_rad)
+        mat = torch.stack([
+            torch.stack([cos, -sin, w / 2 * (1 - cos) + h / 2 * sin], dim=1),
+            torch.stack([sin, cos, h / 2 * (1 - cos) - w / 2 * sin], dim=1),
+            torch.stack([zeros, zeros, ones], dim=1)
+        ], dim=1)
+        return mat
+
+    def getMirrorMatrix(self, w, is_mirror):
+        mat = torch.eye(3, dtype=torch.float64, device=is_mirror.device).repeat(is_mirror.size(0), 1, 1)
+        mat[is_mirror, 0, 0] = -1
+        mat[is_mirror, 0, 2] = w
+        return mat
+
+    def getHomographyMatrix(self, w, h, angle_rad):
+        if not (0 < self.hor_fov_rad < math.pi):
+            return torch.eye(3, dtype=torch.float64, device=angle_rad.device).expand(angle_rad.size(0), 3, 3)
+        ## same points as DataTransform.randomHomography
+        ver_fov_rad = h / w * self.hor_fov_rad
+        d = h / 2 / math.tan(ver_fov_rad / 2)
+        l = h / 2 / math.sin(ver_fov_rad / 2)
+        abs_angle_rad = angle_rad.abs()
+        l_small = d / torch.cos(ver_fov_rad / 2 - abs_angle_rad)
+        d_small = l_small * math.cos(ver_fov_rad / 2)
+        d_large = l * torch.cos(ver_fov_rad / 2 - abs_angle_rad)
+        h_small = h / 2 - d * torch.tan(ver_fov_rad / 2 - abs_angle_rad)
+        w_small = d / d_large * w
+        w_large = d / d_small * w
+        zeros = torch.zeros_like(angle_rad)
+        ## (batch, 4, 2)
+        points_before_pos = torch.stack([
+            torch.stack([zeros, h_small], dim=1), torch.stack([zeros + w, h_small], dim=1),
+            torch.stack([zeros, zeros + h], dim=1), torch.stack([zeros + w, zeros + h], dim=1)
+        ], dim=1)
+        points_after_pos = torch.stack([
+            torch.stack([(w - w_large) / 2, zeros], dim=1), torch.stack([(w + w_large) / 2, zeros], dim=1),
+            torch.stack([(w - w_small) / 2, h - h_small], dim=1), torch.stack([(w + w_small) / 2, h - h_small], dim=1)
+        ], dim=1)
+        points_before_neg = torch.stack([
+            torch.stack([zeros, zeros], dim=1), torch.stack([zeros + w, zeros], dim=1),
+            torch.stack([zeros, h - h_small], dim=1), torch.stack([zeros + w, h - h_small], dim=1)
+        ], dim=1)
+        points_after_neg = torch.stack([
+            torch.stack([(w - w_small) / 2, h_small], dim=1), torch.stack([(w + w_small) / 2, h_small], dim=1),
+            torch.stack([(w - w_large) / 2, zeros + h], dim=1), torch.stack([(w + w_large) / 2, zeros + h], dim=1)
+        ], dim=1)
+        is_pos = (angle_rad > 0).view(-1, 1, 1)
+        points_before = torch.where(is_pos, points_before_pos, points_before_neg)
+        points_after = torch.where(is_pos, points_after_pos, points_after_neg)
+        return self.solveHomography(points_after, points_before)
+
+    def solveHomography(self, pa, pb):
+        ## batched version of DataTransform.find_coeffs: pa -> pb, (batch, 4, 2)
+        x = pa[:, :, 0]
+        y = pa[:, :, 1]
+        u = pb[:, :, 0]
+        v = pb[:, :, 1]
+        ones = torch.ones_like(x)
+        zeros = torch.zeros_like(x)
+        rows_u = torch.stack([x, y, ones, zeros, zeros, zeros, -u*x, -u*y], dim=2)
+        rows_v = torch.stack([zeros, zeros, zeros, x, y, ones, -v*x, -v*y], dim=2)
+        A = torch.stack([rows_u, rows_v], dim=2).view(-1, 8, 8)
+        B = torch.stack([u, v], dim=2).view(-1, 8, 1)
+        coeffs = torch.linalg.solve(A, B).squeeze(-1)
+        mat = torch.cat([coeffs, torch.ones_like(coeffs[:, :1])], dim=1).view(-1, 3, 3)
+        return mat
+
+    def getGrid(self, mat, w, h):
+        ## pixel centers of the output image
+        device = mat.device
+        coords = (torch.arange(self.resize, dtype=torch.float64, device=device) + 0.5)
+        v, u = torch.meshgrid(coords, coords, indexing="ij")
+        points = torch.stack([u, v, torch.ones_like(u)], dim=2).view(1, -1, 3, 1)
+        points = (mat.unsqueeze(1) @ points).squeeze(-1)
+        xy = points[:, :, :2] / points[:, :, 2:]
+        ## pixel -> [-1, 1] (align_corners=False)
+        scale = xy.new_tensor([2.0 / w, 2.0 / h])
+        grid = xy * scale - 1.0
+        return grid.view(-1, self.resize, self.resize, 2).float()
+
+    def getMirrorMatrixAcc(self, is_mirror):
+        mat = torch.eye(3, dtype=torch.float64, device=is_mirror.device).repeat(is_mirror.size(0), 1, 1)
+        mat[is_mirror, 1, 1] = -1
+        return mat
+
+    def getRotationMatrixPitch(self, angle_rad):
+        cos = torch.cos(angle_rad)
+        sin = torch.sin(angle_rad)
+        zeros = torch.zeros_like(angle_rad)
+        ones = torch.ones_like(angle_rad)
+        mat = torch.stack([
+            torch.stack([cos, zeros, sin], dim=1),
+            torch.stack([zeros, ones, zeros], dim=1),
+            torch.stack([-sin, zeros, cos], dim=1)
+        ], dim=1)
+        return mat
+
+    def getRotationMatrixRoll(self, angle_rad):
+        cos = torch.cos(angle_rad)
+        sin = torch.sin(angle_rad)
+        zeros = torch.zeros_like(angle_rad)
+        ones = torch.ones_like(angle_rad)
+        mat = torch.stack([
+            torch.stack([ones, zeros, zeros], dim=1),
+            torch.stack([zeros, cos, -sin], dim=1),
+            torch.stack([zeros, sin, cos], dim=1)
+        ], dim=1)
+        return mat
+
+##### test #####
+# from PIL import Image
+# import matplotlib.pyplot as plt
+# ## image
+# img_path = "../../../dataset_image_to_gravity/AirSim/example/camera_0.jpg"
+# img_pil = Image.open(img_path)
+# ## label
+# acc_numpy = np.array([0, 0, -1])
+# ## transform
+# transform = BatchDataTransform(224, ([0.5, 0.5, 0.5]), ([0.5, 0.5, 0.5]), hor_fov_deg=70)
+# img_raw, acc_raw = transform(img_pil, acc_numpy, phase="train")
+# imgs_trans, accs_trans = transform.augmentBatch(img_raw.unsqueeze(0), acc_raw.unsqueeze(0))
+# print("accs_trans = ", accs_trans)
+# ## imshow
+# img_trans_numpy = np.clip(imgs_trans[0].numpy().transpose((1, 2, 0)) * 0.5 + 0.5, 0, 1)
+# plt.figure()
+# plt.subplot(2, 1, 1)
+# plt.imshow(img_pil)
+# plt.subplot(2, 1, 2)
+# plt.imshow(img_trans_numpy)
+# plt.show()
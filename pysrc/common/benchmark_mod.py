@@ -0,0 +1,57 @@
+import numpy as np
+import math
+import time
+from tqdm import tqdm
+
+import torch
+
+from common import attitude_error_mod
+
+def evaluateNetwork(net, dataloader, device, num_warmup=1):
+    ## warm up
+    with torch.set_grad_enabled(False):
+        for i, (inputs, _) in enumerate(dataloader):
+            if i >= num_warmup:
+                break
+            net(inputs.to(device))
+    ## measure only the forward pass
+    list_labels = []
+    list_est = []
+    forward_time = 0.0
+    with torch.set_grad_enabled(False):
+        for inputs, labels in tqdm(dataloader):
+            inputs = inputs.to(device)
+            synchronize(device)
+            start_clock = time.perf_counter()
+            outputs = net(inputs)
+            synchronize(device)
+            forward_time += time.perf_counter() - start_clock
+            list_labels.append(labels.numpy())
+            list_est.append(outputs[:, :3].float().cpu().numpy())
+    array_labels = np.concatenate(list_labels)
+    array_est = np.concatenate(list_est)
+    ## error
+    array_error_rp = attitude_error_mod.computeAngleDiff(attitude_error_mod.accToRP(array_est), attitude_error_mod.accToRP(array_labels))
+    array_error_g_angle = attitude_error_mod.getAngleBetweenVectors(array_labels, array_est)
+    dict_result = {
+        "fps": len(array_labels) / forward_time,
+        "latency[ms/frame]": forward_time / len(array_labels) * 1000.0,
+        "mae_r[deg]": attitude_error_mod.computeMAE(array_error_rp/math.pi*180.0)[0],
+        "mae_p[deg]": attitude_error_mod.computeMAE(array_error_rp/math.pi*180.0)[1],
+        "var_r[deg^2]": attitude_error_mod.computeVar(array_error_rp/math.pi*180.0)[0],
+        "var_p[deg^2]": attitude_error_mod.computeVar(array_error_rp/math.pi*180.0)[1],
+        "mae_g_angle[deg]": attitude_error_mod.computeMAE(array_error_g_angle/math.pi*180.0)
+    }
+    return dict_result
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+def printTable(list_name, list_dict_result):
+    list_key = list(list_dict_result[0].keys())
+    width = max([len(name) for name in list_name] + [len("name")])
+    print(" | ".join(["name".ljust(width)] + list_key))
+    for name, dict_result in zip(list_name, list_dict_result):
+        list_str_value = ["{:.4g}".format(dict_result[key]).rjust(len(key)) for key in list_key]
+        print(" | ".join([name.ljust(width)] + list_str_value))
@@ -0,0 +1,75 @@
+import numpy as np
+import random
+import os
+import glob
+
+import torch
+
+class CheckpointManager:
+    def __init__(self, save_dir, checkpoint_interval=1, num_kept=3):
+        self.save_dir = save_dir
+        self.checkpoint_interval = checkpoint_interval  #[epoch], <=0: no checkpoint
+        self.num_kept = num_kept                        #latest ones kept in addition to best.pth
+        self.best_loss = float("inf")
+
+    def isSaveEpoch(self, epoch, num_epochs):
+        return ((epoch + 1) % self.checkpoint_interval == 0) or (epoch + 1 == num_epochs)
+
+    def save(self, dict_state, epoch, num_epochs, val_loss=None):
+        if self.checkpoint_interval <= 0:
+            return
+        is_best = (val_loss is not None) and (val_loss < self.best_loss)
+        is_save_epoch = self.isSaveEpoch(epoch, num_epochs)
+        if not (is_best or is_save_epoch):
+            return
+        if is_best:
+            self.best_loss = val_loss
+        os.makedirs(self.save_dir, exist_ok=True)
+        dict_state["epoch"] = epoch
+        dict_state["best_loss"] = self.best_loss
+        dict_state["rng_state"] = getRngState()
+        ## best by val loss
+        if is_best:
+            saveAtomically(dict_state, os.path.join(self.save_dir, "best.pth"))
+        ## latest
+        if is_save_epoch:
+            save_path = os.path.join(self.save_dir, "epoch{:04d}.pth".format(epoch))
+            saveAtomically(dict_state, save_path)
+            print("Saved: ", save_path)
+            self.removeOld()
+
+    def removeOld(self):
+        list_path = sorted(glob.glob(os.path.join(self.save_dir, "epoch*.pth")))
+        for path in list_path[:max(len(list_path) - self.num_kept, 0)]:
+            os.remove(path)
+
+    def load(self, load_path):
+        ## on CPU: RNG states must stay there, load_state_dict moves the rest
+        dict_state = torch.load(load_path, map_location="cpu", weights_only=False)
+        print("Loaded: ", load_path)
+        self.best_loss = dict_state["best_loss"]
+        setRngState(dict_state["rng_state"])
+        return dict_state
+
+def saveAtomically(obj, save_path):
+    ## a preempted write leaves only the .tmp file
+    tmp_path = save_path + ".tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, save_path)
+
+def getRngState():
+    dict_rng_state = {
+        "torch": torch.get_rng_state(),
+        "numpy": np.random.get_state(),
+        "random": random.getstate()
+    }
+    if torch.cuda.is_available():
+        dict_rng_state["cuda"] = torch.cuda.get_rng_state_all()
+    return dict_rng_state
+
+def setRngState(dict_rng_state):
+    torch.set_rng_state(dict_rng_state["torch"])
+    np.random.set_state(dict_rng_state["numpy"])
+    random.setstate(dict_rng_state["random"])
+    if ("cuda" in dict_rng_state) and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(dict_rng_state["cuda"])
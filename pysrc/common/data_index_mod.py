@@ -0,0 +1,171 @@
+import numpy as np
+import csv
+import os
+
+class DataIndex:
+    ## columnar data list: labels (N, 3) float32, image paths and extra CSV columns as offset-encoded utf-8 tables
+    ## a few numpy arrays instead of N python lists: cheap to pickle into DataLoader workers
+    def __init__(self, labels, path_bytes, path_offsets, extra_bytes, extra_offsets, root_ids, list_rootpath):
+        self.labels = labels                #(N, 3) float32, acc_x, acc_y, acc_z
+        self.path_bytes = path_bytes        #uint8, image paths relative to their root, concatenated
+        self.path_offsets = path_offsets    #(N + 1) int64, path i = path_bytes[path_offsets[i]:path_offsets[i + 1]]
+        self.extra_bytes = extra_bytes      #uint8, columns after the image (e.g. timestamp, gyro) joined with ","
+        self.extra_offsets = extra_offsets  #(N + 1) int64
+        self.root_ids = root_ids            #(N) int32, index of list_rootpath
+        self.list_rootpath = list_rootpath
+
+    @staticmethod
+    def fromRows(data_list):
+        ## rows of make_datalist_mod.makeDataList: acc_x, acc_y, acc_z, image (joined with its root), ...
+        labels = np.array([[float(num) for num in row[:3]] for row in data_list], dtype=np.float32).reshape(-1, 3)
+        path_bytes, path_offsets = encodeStrings([row[3] for row in data_list])
+        extra_bytes, extra_offsets = encodeStrings([",".join(row[4:]) for row in data_list])
+        root_ids = np.zeros(len(data_list), dtype=np.int32)
+        return DataIndex(labels, path_bytes, path_offsets, extra_bytes, extra_offsets, root_ids, [""])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def getPath(self, index):
+        rel_path = self.path_bytes[self.path_offsets[index]:self.path_offsets[index + 1]].tobytes().decode()
+        return os.path.join(self.list_rootpath[self.root_ids[index]], rel_path)
+
+    def getPaths(self):
+        return [self.getPath(index) for index in range(len(self))]
+
+    def getExtraColumns(self, index):
+        str_extra = self.extra_bytes[self.extra_offsets[index]:self.extra_offsets[index + 1]].tobytes().decode()
+        return str_extra.split(",") if str_extra else []
+
+    def getInputsPath(self, index):
+        ## = row[3:] of the data list
+        return [self.getPath(index)] + self.getExtraColumns(index)
+
+    def getRow(self, index):
+        ## the old string row, for code that still indexes data_list[index][i]
+        return [str(num) for num in self.labels[index].tolist()] + self.getInputsPath(index)
+
+    def __getitem__(self, index):
+        return self.getRow(index)
+
+    def updateHasher(self, hasher):
+        ## identity of the whole list without touching every row in python
+        hasher.update("\n".join(self.list_rootpath).encode())
+        for array in [self.labels, self.path_bytes, self.path_offsets, self.extra_bytes, self.extra_offsets, self.root_ids]:
+            hasher.update(np.ascontiguousarray(array).tobytes())
+
+def encodeStrings(list_str):
+    list_bytes = [string.encode() for string in list_str]
+    offsets = np.zeros(len(list_bytes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in list_bytes])
+    return np.frombuffer(b"".join(list_bytes), dtype=np.uint8).copy(), offsets
+
+def concatenate(list_index, list_rootpath):
+    ## list_index[i]: relative to list_rootpath[i]
+    if len(list_index) == 1:
+        index = list_index[0]
+        return DataIndex(index.labels, index.path_bytes, index.path_offsets, index.extra_bytes, index.extra_offsets, index.root_ids, list(list_rootpath))
+    labels = np.concatenate([index.labels for index in list_index]).reshape(-1, 3)
+    path_bytes, path_offsets = concatenateTables([(index.path_bytes, index.path_offsets) for index in list_index])
+    extra_bytes, extra_offsets = concatenateTables([(index.extra_bytes, index.extra_offsets) for index in list_index])
+    root_ids = np.concatenate([np.full(len(index), i, dtype=np.int32) for i, index in enumerate(list_index)])
+    return DataIndex(labels, path_bytes, path_offsets, extra_bytes, extra_offsets, root_ids, list(list_rootpath))
+
+def concatenateTables(list_table):
+    list_offsets = [np.zeros(1, dtype=np.int64)]
+    base = 0
+    for table_bytes, offsets in list_table:
+        list_offsets.append(offsets[1:] + base)
+        base += len(table_bytes)
+    return np.concatenate([table_bytes for table_bytes, _ in list_table]).astype(np.uint8), np.concatenate(list_offsets)
+
+class CsvIndexFile:
+    ## binary index saved next to the CSV (imu_camera.csv -> imu_camera.index), rebuilt when the CSV changes
+    ## the arrays are stored one after another in the .npy format and memory-mapped when loaded
+    version = 1
+    list_name = ["labels", "path_bytes", "path_offsets", "extra_bytes", "extra_offsets"]
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.index_path = os.path.splitext(csv_path)[0] + ".index"
+
+    def getCsvStat(self):
+        stat = os.stat(self.csv_path)
+        return np.array([self.version, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def load(self):
+        csv_stat = self.getCsvStat()
+        index = self.read(csv_stat)
+        if index is None:
+            index = self.build()
+            self.write(index, csv_stat)
+        return index
+
+    def read(self, csv_stat):
+        ## None: missing, old format or another CSV
+        if not os.path.isfile(self.index_path):
+            return None
+        try:
+            with open(self.index_path, "rb") as f:
+                if not np.array_equal(np.lib.format.read_array(f), csv_stat):
+                    return None
+                dict_array = {name: self.mapArray(f) for name in self.list_name}
+        except (OSError, ValueError, EOFError) as error:
+            print("Rebuild ", self.index_path, ": ", error)
+            return None
+        num_data = len(dict_array["labels"])
+        return DataIndex(**dict_array, root_ids=np.zeros(num_data, dtype=np.int32), list_rootpath=[""])
+
+    def mapArray(self, f):
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        num_bytes = int(np.prod(shape)) * dtype.itemsize
+        f.seek(offset + num_bytes)
+        if num_bytes == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.index_path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+    def build(self):
+        list_acc = []
+        list_path = []
+        list_extra = []
+        with open(self.csv_path) as csvfile:
+            reader = csv.reader(csvfile)
+            for row in reader:
+                list_acc.append((float(row[0]), float(row[1]), float(row[2])))
+                list_path.append(row[3])
+                list_extra.append(",".join(row[4:]))
+        labels = np.array(list_acc, dtype=np.float32).reshape(-1, 3)
+        path_bytes, path_offsets = encodeStrings(list_path)
+        extra_bytes, extra_offsets = encodeStrings(list_extra)
+        return DataIndex(labels, path_bytes, path_offsets, extra_bytes, extra_offsets, np.zeros(len(labels), dtype=np.int32), [""])
+
+    def write(self, index, csv_stat):
+        ## atomic; a read-only dataset directory only costs the rebuild next time
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.lib.format.write_array(f, csv_stat)
+                for name in self.list_name:
+                    np.lib.format.write_array(f, np.ascontiguousarray(getattr(index, name)))
+            os.replace(tmp_path, self.index_path)
+            print("Built: ", self.index_path)
+        except OSError as error:
+            print("Cannot save ", self.index_path, ": ", error)
+
+def makeDataIndex(list_rootpath, csv_name):
+    ## same rows as make_datalist_mod.makeDataList
+    list_index = [CsvIndexFile(os.path.join(rootpath, csv_name)).load() for rootpath in list_rootpath]
+    return concatenate(list_index, list_rootpath)
+
+##### test #####
+# list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
+# csv_name = "imu_camera.csv"
+# train_index = makeDataIndex(list_rootpath, csv_name)
+# print("len(train_index) = ", len(train_index))
+# print("example0: ", train_index.labels[0], train_index.getInputsPath(0))
+# print("example1: ", train_index.labels[1], train_index.getInputsPath(1))
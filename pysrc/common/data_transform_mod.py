@@ -8,7 +8,7 @@ import torch
 from torchvision import transforms
 
 class DataTransform():
-    def __init__(self, resize, mean, std, hor_fov_deg=-1):
+    def __init__(self, resize, mean, std, hor_fov_deg=-1, hom_resolution_deg=0.01):
         self.resize = resize
         self.mean = mean
         self.std = std
@@ -19,6 +19,10 @@ class DataTransform():
             transforms.Normalize(mean, std)
         ])
         self.hor_fov_rad = hor_fov_deg / 180.0 * math.pi
+        ## homography coefficients: table on a quantized angle grid (hom_resolution_deg > 0) or closed-form per sample (<= 0)
+        self.max_hom_angle_rad = 10.0 / 180.0 * math.pi
+        self.hom_resolution_rad = hom_resolution_deg / 180.0 * math.pi
+        self.dict_hom_table = {}    #(w, h) -> (num_angle, 8)
 
     def __call__(self, img_pil, acc_numpy, phase="train"):
         ## augemntation
@@ -33,12 +37,28 @@ class DataTransform():
             # ## rotation
             img_pil, acc_numpy = self.randomRotation(img_pil, acc_numpy)
         ## img: numpy -> tensor
-        img_tensor = self.img_transform(img_pil)
+        img_tensor = self.transformImage(img_pil)
         ## acc: numpy -> tensor
+        acc_tensor = self.accToTensor(acc_numpy)
+        return img_tensor, acc_tensor
+
+    def transformImage(self, img_pil):
+        ## val path without a label, e.g. for camera frames
+        return self.img_transform(img_pil)
+
+    def transformCached(self, img_numpy, acc_numpy):
+        ## img: resized & cropped uint8 (h, w, ch) -> tensor (ch, h, w), equivalent to self.img_transform
+        img_tensor = torch.from_numpy(img_numpy.transpose((2, 0, 1)).astype(np.float32) / 255.0)
+        img_tensor = transforms.functional.normalize(img_tensor, self.mean, self.std)
+        ## acc: numpy -> tensor
+        acc_tensor = self.accToTensor(acc_numpy)
+        return img_tensor, acc_tensor
+
+    def accToTensor(self, acc_numpy):
         acc_numpy = acc_numpy.astype(np.float32)
         acc_numpy = acc_numpy / np.linalg.norm(acc_numpy)
         acc_tensor = torch.from_numpy(acc_numpy)
-        return img_tensor, acc_tensor
+        return acc_tensor
 
     def mirror(self, img_pil, acc_numpy):
         ## image
@@ -52,6 +72,39 @@ class DataTransform():
         # print("hom: angle_rad/math.pi*180.0 = ", angle_rad/math.pi*180.0)
         ## image
         (w, h) = img_pil.size
+        angle_rad, coeffs = self.getHomographyCoeffs(w, h, angle_rad)
+        img_pil = img_pil.transform(img_pil.size, Image.PERSPECTIVE, coeffs, Image.BILINEAR)
+        ## acc
+        acc_numpy = self.rotateVectorPitch(acc_numpy, -angle_rad)
+        return img_pil, acc_numpy
+
+    def getHomographyCoeffs(self, w, h, angle_rad):
+        ## continuous
+        if self.hom_resolution_rad <= 0:
+            points_after, points_before = self.getHomographyPoints(w, h, angle_rad)
+            return angle_rad, self.solveHomography(points_after, points_before)
+        ## table: the angle is snapped to the grid, so that the label is rotated consistently
+        index = int(round((angle_rad + self.max_hom_angle_rad) / self.hom_resolution_rad))
+        angle_rad = index * self.hom_resolution_rad - self.max_hom_angle_rad
+        return angle_rad, self.getHomographyTable(w, h)[index]
+
+    def prebuildHomographyTable(self, w, h):
+        ## called in the main process by the datasets: the DataLoader workers receive the table with the dataset instead of each building it
+        if (0 < self.hor_fov_rad < math.pi) and (self.hom_resolution_rad > 0):
+            self.getHomographyTable(w, h)
+
+    def getHomographyTable(self, w, h):
+        ## built once per image size; a size that was not prebuilt is built in each DataLoader worker
+        if (w, h) not in self.dict_hom_table:
+            num_angle = int(round(2 * self.max_hom_angle_rad / self.hom_resolution_rad)) + 1
+            table = np.empty((num_angle, 8))
+            for i in range(num_angle):
+                points_after, points_before = self.getHomographyPoints(w, h, i * self.hom_resolution_rad - self.max_hom_angle_rad)
+                table[i] = self.solveHomography(points_after, points_before)
+            self.dict_hom_table[(w, h)] = table
+        return self.dict_hom_table[(w, h)]
+
+    def getHomographyPoints(self, w, h, angle_rad):
         ver_fov_rad = h / w * self.hor_fov_rad
         d = h / 2 / math.tan(ver_fov_rad / 2)
         l = h / 2 / math.sin(ver_fov_rad / 2)
@@ -69,11 +122,48 @@ class DataTransform():
             points_after = [((w - w_small) / 2, h_small), ((w + w_small) / 2, h_small), ((w - w_large) / 2, h), ((w + w_large) / 2, h)]
         # print("points_before = ", points_before)
         # print("points_after = ", points_after)
-        coeffs = self.find_coeffs(points_after, points_before)
-        img_pil = img_pil.transform(img_pil.size, Image.PERSPECTIVE, coeffs, Image.BILINEAR)
-        ## acc
-        acc_numpy = self.rotateVectorPitch(acc_numpy, -angle_rad)
-        return img_pil, acc_numpy
+        return points_after, points_before
+
+    def solveHomography(self, pa, pb):
+        ## closed-form 4-point solver (pa -> pb) replacing find_coeffs: H = S(pb) * adj(S(pa))
+        mat = self.multiplyMatrix(self.getSquareToQuad(pb), self.getAdjugate(self.getSquareToQuad(pa)))
+        coeffs = np.array(mat[:8]) / mat[8]
+        return coeffs
+
+    def getSquareToQuad(self, points):
+        ## Heckbert, "Fundamentals of Texture Mapping and Image Warping": (0,0),(1,0),(1,1),(0,1) -> points
+        ## points: top-left, top-right, bottom-left, bottom-right
+        (x0, y0), (x1, y1), (x3, y3), (x2, y2) = points
+        dx1 = x1 - x2
+        dx2 = x3 - x2
+        dx3 = x0 - x1 + x2 - x3
+        dy1 = y1 - y2
+        dy2 = y3 - y2
+        dy3 = y0 - y1 + y2 - y3
+        det = dx1 * dy2 - dx2 * dy1
+        g = (dx3 * dy2 - dx2 * dy3) / det
+        h = (dx1 * dy3 - dx3 * dy1) / det
+        return (
+            x1 - x0 + g * x1, x3 - x0 + h * x3, x0,
+            y1 - y0 + g * y1, y3 - y0 + h * y3, y0,
+            g, h, 1.0
+        )
+
+    def getAdjugate(self, mat):
+        ## inverse up to scale (3x3, row-major tuple)
+        (a, b, c, d, e, f, g, h, i) = mat
+        return (
+            e * i - f * h, c * h - b * i, b * f - c * e,
+            f * g - d * i, a * i - c * g, c * d - a * f,
+            d * h - e * g, b * g - a * h, a * e - b * d
+        )
+
+    def multiplyMatrix(self, mat_a, mat_b):
+        ## 3x3, row-major tuple
+        return tuple(
+            sum(mat_a[3 * row + k] * mat_b[3 * k + col] for k in range(3))
+            for row in range(3) for col in range(3)
+        )
 
     ## copy-pasted from "http://stackoverflow.com/questions/14177744/how-does-perspective-transformation-work-in-pil"
     def find_coeffs(self, pa, pb):
@@ -81,7 +171,7 @@ class DataTransform():
         for p1, p2 in zip(pa, pb):
             matrix.append([p1[0], p1[1], 1, 0, 0, 0, -p2[0]*p1[0], -p2[0]*p1[1]])
             matrix.append([0, 0, 0, p1[0], p1[1], 1, -p2[1]*p1[0], -p2[1]*p1[1]])
-        A = np.matrix(matrix, dtype=np.float)
+        A = np.matrix(matrix, dtype=np.float64)
         B = np.array(pb).reshape(8)
         res = np.dot(np.linalg.inv(A.T * A) * A.T, B)
         ret = np.array(res).reshape(8)
@@ -0,0 +1,81 @@
+import numpy as np
+import random
+import os
+
+import torch
+
+from common import distributed_mod
+
+class DataloaderConfig:
+    def __init__(self, num_workers=None, prefetch_factor=2, persistent_workers=True, pin_memory=None, seed=None):
+        if num_workers is None:
+            num_workers = self.getDefaultNumWorkers()
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor          #batches loaded in advance by each worker
+        self.persistent_workers = persistent_workers    #keep workers alive between epochs
+        self.pin_memory = pin_memory
+        self.seed = seed                                #None: nondeterministic shuffling
+        print("num_workers = ", self.num_workers)
+
+    def getDefaultNumWorkers(self):
+        if hasattr(os, "sched_getaffinity"):
+            num_cpu = len(os.sched_getaffinity(0))
+        else:
+            num_cpu = os.cpu_count() or 1
+        ## leave one core to the main process (forward/backward)
+        return min(max(num_cpu - 1, 0), 8)
+
+    def getDataloader(self, dataset, batch_size, shuffle):
+        generator = None
+        if self.seed is not None:
+            ## per rank: the worker seeds (augmentation) differ between ranks
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + distributed_mod.getRank())
+        ## e.g. shard_mod.ShardDataset: it shuffles and splits itself over the ranks and the workers (no sampler)
+        if isinstance(dataset, torch.utils.data.IterableDataset):
+            if hasattr(dataset, "setBatchSize"):
+                dataset.setBatchSize(batch_size)
+            shuffle = False
+        ## DDP: each rank loads its own shard, shuffled with a seed common to all ranks (call set_epoch every epoch)
+        sampler = None
+        if distributed_mod.isInitialized() and not isinstance(dataset, torch.utils.data.IterableDataset):
+            if shuffle:
+                sampler = torch.utils.data.distributed.DistributedSampler(dataset, shuffle=shuffle, seed=self.seed if self.seed is not None else 0)
+            else:
+                sampler = UnpaddedSampler(dataset)
+            shuffle = False
+        dataloader = torch.utils.data.DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=shuffle,
+            sampler=sampler,
+            num_workers=self.num_workers,
+            pin_memory=self.pin_memory,
+            prefetch_factor=self.prefetch_factor if self.num_workers > 0 else None,
+            persistent_workers=self.persistent_workers and self.num_workers > 0,
+            worker_init_fn=seedWorker,
+            generator=generator
+        )
+        return dataloader
+
+class UnpaddedSampler(torch.utils.data.Sampler):
+    ## DDP evaluation: indices[rank::world_size], every sample exactly once over all ranks
+    ## (DistributedSampler pads with repeated samples so that the ranks have the same length, which biases the summed loss)
+    def __init__(self, dataset):
+        self.num_samples = len(dataset)
+        self.rank = distributed_mod.getRank()
+        self.world_size = distributed_mod.getWorldSize()
+
+    def __iter__(self):
+        return iter(range(self.rank, self.num_samples, self.world_size))
+
+    def __len__(self):
+        return len(range(self.rank, self.num_samples, self.world_size))
+
+def seedWorker(worker_id):
+    ## torch gives every worker its own seed; derive the python/numpy seeds used by DataTransform from it
+    seed = torch.initial_seed() % 2**32
+    random.seed(seed)
+    np.random.seed(seed)
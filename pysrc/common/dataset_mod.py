@@ -5,35 +5,62 @@ import numpy as np
 import torch
 
 class OriginalDataset(data.Dataset):
-    def __init__(self, data_list, transform, phase):
+    def __init__(self, data_list, transform, phase, cache_rootpath=None):
+        ## data_index_mod.DataIndex (a list of string rows is converted)
+        ## the siblings are imported where they are needed: this module is also imported from common/ (test_dataloader.py)
+        if isinstance(data_list, list):
+            from common import data_index_mod
+            data_list = data_index_mod.DataIndex.fromRows(data_list)
         self.data_list = data_list
         self.transform = transform
         self.phase = phase
+        self.tensor_cache = self.getTensorCache(cache_rootpath)
+        self.prebuildTransform()
+
+    def prebuildTransform(self):
+        ## e.g. the homography table of DataTransform for the size of the first image
+        if (self.phase != "train") or (len(self.data_list) == 0) or (not hasattr(self.transform, "prebuildHomographyTable")):
+            return
+        with Image.open(self.data_list.getPath(0)) as img_pil:
+            self.transform.prebuildHomographyTable(*img_pil.size)
+
+    def getTensorCache(self, cache_rootpath):
+        if cache_rootpath is None:
+            return None
+        ## augmentation needs the original images
+        if self.phase == "train":
+            print("TensorCache is not used in the train phase")
+            return None
+        from common import tensor_cache_mod
+        return tensor_cache_mod.TensorCache(cache_rootpath, self.data_list, self.transform.resize)
 
     def __len__(self):
         return len(self.data_list)
 
     def __getitem__(self, index):
+        ## cache
+        if self.tensor_cache is not None:
+            img_numpy, acc_numpy = self.tensor_cache[index]
+            img_trans, acc_trans = self.transform.transformCached(img_numpy, acc_numpy)
+            return img_trans, acc_trans
         ## divide list
-        img_path = self.data_list[index][3]
-        acc_str_list = self.data_list[index][:3]
-        acc_list = [float(num) for num in acc_str_list]
+        img_path = self.data_list.getPath(index)
         ## to numpy
         img_pil = Image.open(img_path)
-        acc_numpy = np.array(acc_list)
+        acc_numpy = self.data_list.labels[index].astype(np.float64)
         ## tansform
         img_trans, acc_trans = self.transform(img_pil, acc_numpy, phase=self.phase)
         return img_trans, acc_trans
 
 ##### test #####
-# import make_datalist_mod
+# import data_index_mod
 # import data_transform_mod
 # ## list
 # list_train_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
 # list_val_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
 # csv_name = "imu_camera.csv"
-# train_list = make_datalist_mod.makeDataList(list_train_rootpath, csv_name)
-# val_list = make_datalist_mod.makeDataList(list_val_rootpath, csv_name)
+# train_list = data_index_mod.makeDataIndex(list_train_rootpath, csv_name)
+# val_list = data_index_mod.makeDataIndex(list_val_rootpath, csv_name)
 # ## trans param
 # resize = 224
 # mean = ([0.5, 0.5, 0.5])
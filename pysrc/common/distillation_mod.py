@@ -0,0 +1,149 @@
+import torch.utils.data as data
+import matplotlib.pyplot as plt
+
+import torch
+import torch.nn as nn
+
+from common import trainer_mod
+from common import distributed_mod
+from common import feature_cache_mod
+from common import dataloader_mod
+from common import benchmark_mod
+from common import report_mod
+
+class TeacherCache(feature_cache_mod.FeatureCache):
+    ## outputs of the whole teacher network, computed once and memory-mapped
+    def __init__(self, cache_rootpath, dataset, teacher_net, device, batch_size=50):
+        ## the cached outputs must belong to the images the student sees
+        if dataset.phase == "train":
+            raise ValueError("TeacherCache needs a deterministic dataset (phase=\"val\"): random augmentation would not match the cached outputs")
+        super(TeacherCache, self).__init__(cache_rootpath, dataset, teacher_net, device, batch_size=batch_size)
+
+    def getKeyPrefix(self): #overwrite
+        return "teacher_"
+
+    def getCachedModule(self, net): #overwrite
+        return net
+
+    def computeOutputs(self, net, inputs):  #overwrite
+        return net(inputs).float()
+
+class DistillationDataset(data.Dataset):
+    ## labels: (acc (3), teacher outputs (3 or 9))
+    def __init__(self, dataset, teacher_cache):
+        self.dataset = dataset
+        self.teacher_cache = teacher_cache
+        ## for Trainer.getStrHyperparameter etc.
+        self.data_list = dataset.data_list
+        self.transform = dataset.transform
+        self.phase = dataset.phase
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        img_trans, acc_trans = self.dataset[index]
+        teacher_outputs_numpy, _ = self.teacher_cache[index]
+        labels = torch.cat([acc_trans, torch.from_numpy(teacher_outputs_numpy)])
+        return img_trans, labels
+
+class DistillationCriterion:
+    ## (1 - alpha)*criterion(student, acc) + alpha*MSE(student gravity, teacher gravity)
+    def __init__(self, criterion, alpha=0.5):
+        self.criterion = criterion  #ground-truth loss, e.g. nn.MSELoss()
+        self.alpha = alpha          #weight of the teacher term
+        self.mse = nn.MSELoss()
+
+    def __call__(self, outputs, labels):
+        acc = labels[:, :3]
+        teacher_outputs = labels[:, 3:]
+        loss = (1.0 - self.alpha) * self.criterion(outputs, acc) + self.alpha * self.computeTeacherLoss(outputs, teacher_outputs)
+        return loss
+
+    def computeTeacherLoss(self, outputs, teacher_outputs):
+        return self.mse(outputs[:, :3], teacher_outputs[:, :3])
+
+class GaussianDistillationCriterion(DistillationCriterion):
+    ## teacher term: KL(N_teacher || N_student) with the covariance of mle/criterion_mod.Criterion
+    def computeTeacherLoss(self, outputs, teacher_outputs):    #overwrite
+        ## Criterion.getCovMatrix(x) = L*L^T, the triangular factors are used directly
+        L_s = self.criterion.getTriangularMatrix(outputs)
+        L_t = self.criterion.getTriangularMatrix(teacher_outputs)
+        ## tr(S_s^-1 S_t) = |L_s^-1 L_t|_F^2
+        trace = torch.linalg.solve_triangular(L_s, L_t, upper=False).pow(2).sum((1, 2))
+        ## (mu_t - mu_s)^T S_s^-1 (mu_t - mu_s) = |L_s^-1 (mu_t - mu_s)|^2
+        diff = (teacher_outputs[:, :3] - outputs[:, :3]).unsqueeze(-1)
+        mahalanobis = torch.linalg.solve_triangular(L_s, diff, upper=False).pow(2).sum((1, 2))
+        ## log det(L*L^T) = 2*sum(log diag(L))
+        log_det_s = (outputs[:, 3:9] * self.criterion.diag_mask).sum(1)
+        log_det_t = (teacher_outputs[:, 3:9] * self.criterion.diag_mask).sum(1)
+        kl = 0.5 * (trace + mahalanobis - 3.0) + log_det_s - log_det_t
+        return kl.mean()
+
+class DistillationTrainer(trainer_mod.Trainer):
+    def __init__(self,  #overwrite
+            method_name,
+            train_dataset, val_dataset,
+            net, teacher_net, teacher_weights_path, criterion,
+            optimizer_name, lr_cnn, lr_fc,
+            batch_size, num_epochs,
+            dataloader_config=None,
+            resume_path=None, checkpoint_interval=1, num_kept_checkpoints=3,
+            autocast_dtype=None, num_accumulation_steps=1,
+            val_scheduler=None,
+            teacher_cache_rootpath="../../cache"):
+        self.setDistributed()
+        self.device = distributed_mod.getDevice()
+        ## teacher: run once over both datasets, then only the cached outputs are used
+        teacher_net = self.getSetTeacherNetwork(teacher_net, teacher_weights_path)
+        train_cache = TeacherCache(teacher_cache_rootpath, train_dataset, teacher_net, self.device, batch_size=batch_size)
+        val_cache = TeacherCache(teacher_cache_rootpath, val_dataset, teacher_net, self.device, batch_size=batch_size)
+        super(DistillationTrainer, self).__init__(
+            method_name,
+            DistillationDataset(train_dataset, train_cache), DistillationDataset(val_dataset, val_cache),
+            net, criterion,
+            optimizer_name, lr_cnn, lr_fc,
+            batch_size, num_epochs,
+            dataloader_config=dataloader_config,
+            resume_path=resume_path, checkpoint_interval=checkpoint_interval, num_kept_checkpoints=num_kept_checkpoints,
+            autocast_dtype=autocast_dtype, num_accumulation_steps=num_accumulation_steps,
+            val_scheduler=val_scheduler
+        )
+
+    def getSetTeacherNetwork(self, teacher_net, teacher_weights_path):
+        teacher_net.to(self.device)
+        teacher_net.eval()
+        ## load
+        loaded_weights = torch.load(teacher_weights_path, map_location=self.device)
+        print("Loaded teacher: ", teacher_weights_path)
+        teacher_net.load_state_dict(loaded_weights)
+        return teacher_net
+
+    def saveGraph(self, record_loss_train, record_loss_val, record_epoch_val):    #overwrite
+        graph = plt.figure()
+        plt.plot(range(1, len(record_loss_train) + 1), record_loss_train, label="Training")
+        plt.plot(record_epoch_val, record_loss_val, label="Validation")
+        plt.legend()
+        plt.xlabel("Epoch")
+        plt.ylabel("Distillation loss")
+        plt.title("loss: train=" + str(record_loss_train[-1]) + ", val=" + str(record_loss_val[-1]))
+        graph.savefig("../../graph/" + self.str_hyperparameter + ".jpg")
+        report_mod.showFigures()
+
+def compareWithTeacher(student_net, teacher_net, dataset, batch_size, device):
+    ## latency and attitude error of both networks on the same data
+    dataloader = dataloader_mod.DataloaderConfig().getDataloader(dataset, batch_size, shuffle=False)
+    list_name = ["teacher", "student"]
+    list_dict_result = []
+    for net in [teacher_net, student_net]:
+        net.to(device)
+        net.eval()
+        dict_result = {"params[M]": sum(param_value.numel() for param_value in net.parameters()) / 1e6}
+        dict_result.update(benchmark_mod.evaluateNetwork(net, dataloader, device))
+        list_dict_result.append(dict_result)
+    ## student against teacher
+    for dict_result in list_dict_result:
+        dict_result["speedup"] = dict_result["fps"] / list_dict_result[0]["fps"]
+        dict_result["delta_mae_g_angle[deg]"] = dict_result["mae_g_angle[deg]"] - list_dict_result[0]["mae_g_angle[deg]"]
+    benchmark_mod.printTable(list_name, list_dict_result)
+    return list_dict_result
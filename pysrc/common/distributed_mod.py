@@ -0,0 +1,59 @@
+import numpy as np
+import random
+import os
+
+import torch
+import torch.distributed as dist
+
+## set by torchrun
+def isDistributed():
+    return int(os.environ.get("WORLD_SIZE", 1)) > 1
+
+def initProcessGroup(backend="gloo"):
+    if isDistributed() and not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+        print("rank ", getRank(), "/", getWorldSize(), " (", backend, ")")
+
+def destroyProcessGroup():
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+def isInitialized():
+    return dist.is_available() and dist.is_initialized()
+
+def getRank():
+    if isInitialized():
+        return dist.get_rank()
+    return int(os.environ.get("RANK", 0))
+
+def getWorldSize():
+    if isInitialized():
+        return dist.get_world_size()
+    return int(os.environ.get("WORLD_SIZE", 1))
+
+def isMainProcess():
+    return getRank() == 0
+
+def getDevice():
+    if not torch.cuda.is_available():
+        return torch.device("cpu")
+    return torch.device("cuda:" + os.environ.get("LOCAL_RANK", "0"))
+
+def barrier():
+    if isInitialized():
+        dist.barrier()
+
+def seedRank(seed):
+    ## different augmentation on each rank
+    seed = seed + getRank()
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+
+def allReduceSum(list_value):
+    ## e.g. [loss_sum, num_samples] over all ranks
+    if not isInitialized():
+        return list_value
+    tensor = torch.tensor(list_value, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
@@ -0,0 +1,74 @@
+import json
+
+import torch
+import torch.nn as nn
+
+class ExportNetwork(nn.Module):
+    def __init__(self, net, criterion=None):
+        super(ExportNetwork, self).__init__()
+        self.net = net
+        self.criterion = criterion  #mle: builds the covariance with criterion.getCovMatrix
+
+    def forward(self, x):
+        outputs = self.net(x)
+        mean = outputs[:, :3]   #L2-normalized in self.net
+        if self.criterion is None:
+            return mean
+        cov = self.criterion.getCovMatrix(outputs)
+        return mean, cov
+
+class Exporter:
+    def __init__(self, net, weights_path, criterion, resize, mean, std):
+        self.device = torch.device("cpu")
+        net = self.getSetNetwork(net, weights_path)
+        self.export_net = ExportNetwork(net, criterion)
+        self.export_net.eval()
+        ## preprocessing parameters, stored in the exported files for runtime_mod
+        self.config = {
+            "backbone_name": net.backbone_name,
+            "resize": resize,
+            "mean": list(mean),
+            "std": list(std),
+            "has_cov": criterion is not None
+        }
+        self.example_inputs = torch.zeros(1, 3, resize, resize)
+
+    def getSetNetwork(self, net, weights_path):
+        net.to(self.device)
+        net.eval()
+        ## load
+        loaded_weights = torch.load(weights_path, map_location=self.device)
+        print("Loaded [-> CPU]: ", weights_path)
+        net.load_state_dict(loaded_weights)
+        return net
+
+    def getListOutputName(self):
+        if self.config["has_cov"]:
+            return ["mean", "cov"]
+        return ["mean"]
+
+    def exportTorchScript(self, save_path):
+        with torch.set_grad_enabled(False):
+            scripted_net = torch.jit.trace(self.export_net, self.example_inputs)
+        torch.jit.save(scripted_net, save_path, _extra_files={"config.json": json.dumps(self.config)})
+        print("Saved: ", save_path)
+
+    def exportOnnx(self, save_path, opset_version=17):
+        list_output_name = self.getListOutputName()
+        dict_dynamic_axes = {name: {0: "batch"} for name in ["inputs"] + list_output_name}
+        torch.onnx.export(
+            self.export_net,
+            (self.example_inputs,),
+            save_path,
+            input_names=["inputs"],
+            output_names=list_output_name,
+            dynamic_axes=dict_dynamic_axes,
+            opset_version=opset_version,
+            dynamo=False
+        )
+        ## config -> metadata
+        import onnx
+        model = onnx.load(save_path)
+        model.metadata_props.add(key="config.json", value=json.dumps(self.config))
+        onnx.save(model, save_path)
+        print("Saved: ", save_path)
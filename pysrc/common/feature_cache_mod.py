@@ -0,0 +1,151 @@
+import torch.utils.data as data
+import numpy as np
+import hashlib
+import random
+import os
+from tqdm import tqdm
+
+import torch
+import torch.nn as nn
+
+from common import dataloader_mod
+from common import batch_augmentation_mod
+from common import distributed_mod
+
+class FeatureCache:
+    def __init__(self, cache_rootpath, dataset, net, device, batch_size=50, num_copies=1, seed=0):
+        ## dataset.phase == "train": num_copies augmented copies with a fixed seed, otherwise num_copies should be 1
+        self.cache_path = os.path.join(cache_rootpath, self.getKeyPrefix() + self.getKey(dataset, net, num_copies, seed))
+        self.features_path = os.path.join(self.cache_path, "features.npy")
+        self.labels_path = os.path.join(self.cache_path, "labels.npy")
+        ## DDP: built by rank 0 only
+        if distributed_mod.isMainProcess() and not (os.path.isfile(self.features_path) and os.path.isfile(self.labels_path)):
+            self.build(dataset, net, device, batch_size, num_copies, seed)
+        distributed_mod.barrier()
+        ## opened lazily so that each DataLoader worker maps the files by itself
+        self.features = None
+        self.labels = None
+        print(type(self).__name__ + ": ", self.cache_path)
+
+    def getKeyPrefix(self):
+        return "feature_"
+
+    def getCachedModule(self, net):
+        ## the module whose outputs are cached: its weights are a part of the key
+        return net.cnn
+
+    def computeOutputs(self, net, inputs):
+        return net.forwardCnn(inputs).float()
+
+    def getKey(self, dataset, net, num_copies, seed):
+        hasher = hashlib.sha1()
+        transform = dataset.transform
+        hasher.update(str((type(transform).__name__, transform.resize, transform.mean, transform.std, transform.hor_fov_rad)).encode())
+        hasher.update(str((dataset.phase, num_copies, seed)).encode())
+        dataset.data_list.updateHasher(hasher)
+        ## the features depend on the weights
+        for name, value in self.getCachedModule(net).state_dict().items():
+            hasher.update(name.encode())
+            hasher.update(value.detach().cpu().numpy().tobytes())
+        return hasher.hexdigest()
+
+    def build(self, dataset, net, device, batch_size, num_copies, seed):
+        ## fixed augmentation: the global random states are seeded for the build and restored afterwards
+        ## (otherwise the training that follows would depend on whether this rank built the cache)
+        random_state = random.getstate()
+        numpy_random_state = np.random.get_state()
+        with torch.random.fork_rng(devices=[device.index] if device.type == "cuda" else []):
+            random.seed(seed)
+            np.random.seed(seed)
+            torch.manual_seed(seed)
+            try:
+                self.write(dataset, net, device, batch_size, num_copies, seed)
+            finally:
+                random.setstate(random_state)
+                np.random.set_state(numpy_random_state)
+
+    def write(self, dataset, net, device, batch_size, num_copies, seed):
+        os.makedirs(self.cache_path, exist_ok=True)
+        ## the whole dataset (no DistributedSampler)
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+        dataloader = torch.utils.data.DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=False,
+            num_workers=dataloader_mod.DataloaderConfig().num_workers,
+            worker_init_fn=dataloader_mod.seedWorker,
+            generator=generator
+        )
+        is_batch_augmentation = (dataset.phase == "train") and isinstance(dataset.transform, batch_augmentation_mod.BatchDataTransform)
+        net.eval()
+        num_data = len(dataset) * num_copies
+        features = None
+        tmp_features_path = self.features_path + ".tmp"
+        tmp_labels_path = self.labels_path + ".tmp"
+        labels = np.lib.format.open_memmap(tmp_labels_path, mode="w+", dtype=np.float32, shape=(num_data, 3))
+        begin = 0
+        with torch.set_grad_enabled(False):
+            for _ in range(num_copies):
+                for inputs, acc in tqdm(dataloader):
+                    inputs = inputs.to(device)
+                    acc = acc.to(device)
+                    if is_batch_augmentation:
+                        inputs, acc = dataset.transform.augmentBatch(inputs, acc)
+                    outputs = self.computeOutputs(net, inputs)
+                    if features is None:
+                        features = np.lib.format.open_memmap(tmp_features_path, mode="w+", dtype=np.float32, shape=(num_data, outputs.size(1)))
+                    end = begin + outputs.size(0)
+                    features[begin:end] = outputs.cpu().numpy()
+                    labels[begin:end] = acc.cpu().numpy()
+                    begin = end
+        features.flush()
+        labels.flush()
+        del features, labels
+        ## atomic: a killed build never leaves a half-written cache behind
+        os.replace(tmp_labels_path, self.labels_path)
+        os.replace(tmp_features_path, self.features_path)
+        print("Built: ", self.cache_path)
+
+    def open(self):
+        self.features = np.load(self.features_path, mmap_mode="r")
+        self.labels = np.load(self.labels_path, mmap_mode="r")
+
+    def __len__(self):
+        if self.labels is None:
+            self.open()
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        if self.features is None:
+            self.open()
+        feature_numpy = np.array(self.features[index])
+        acc_numpy = np.array(self.labels[index])
+        return feature_numpy, acc_numpy
+
+    def __getstate__(self):
+        ## do not pickle the mapped arrays into DataLoader workers
+        state = self.__dict__.copy()
+        state["features"] = None
+        state["labels"] = None
+        return state
+
+class FeatureDataset(data.Dataset):
+    def __init__(self, feature_cache):
+        self.feature_cache = feature_cache
+
+    def __len__(self):
+        return len(self.feature_cache)
+
+    def __getitem__(self, index):
+        feature_numpy, acc_numpy = self.feature_cache[index]
+        return torch.from_numpy(feature_numpy), torch.from_numpy(acc_numpy)
+
+class HeadNetwork(nn.Module):
+    ## Network.fc on cached features (Network.cnn is frozen)
+    def __init__(self, net):
+        super(HeadNetwork, self).__init__()
+        self.net = net
+
+    def forward(self, x):
+        return self.net.forwardFc(x)
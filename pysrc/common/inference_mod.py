@@ -9,16 +9,19 @@ import torch
 from torchvision import models
 import torch.nn as nn
 
+from common import dataloader_mod
+from common import attitude_error_mod
+from common import report_mod
+
 class Sample:
     def __init__(self,
             index,
-            inputs_path, inputs, label, mean,
+            inputs_path, label, mean,
             label_r, label_p, output_r, output_p, error_r, error_p):
         self.index = index              #int
         self.inputs_path = inputs_path  #list
-        self.inputs = inputs            #ndarray
-        self.label = label              #list
-        self.mean = mean                #list
+        self.label = label              #ndarray
+        self.mean = mean                #ndarray
         self.label_r = label_r          #float
         self.label_p = label_p          #float
         self.output_r = output_r        #float
@@ -29,8 +32,6 @@ class Sample:
     def printData(self):
         print("-----", self.index, "-----")
         print("inputs_path: ", self.inputs_path)
-        # print("inputs: ", self.inputs)
-        print("inputs.shape: ", self.inputs.shape)
         print("label: ", self.label)
         print("mean: ", self.mean)
         print("l_r[deg]: ", self.label_r/math.pi*180.0, ", l_p[deg]: ", self.label_p/math.pi*180.0)
@@ -41,27 +42,36 @@ class Inference:
     def __init__(self,
             dataset,
             net, weights_path, criterion,
-            batch_size):
+            batch_size,
+            dataloader_config=None, reporter=None,
+            is_channels_last=False, autocast_dtype=None):
         self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
         print("self.device = ", self.device)
-        self.dataloader = self.getDataloader(dataset, batch_size)
+        self.dataloader = self.getDataloader(dataset, batch_size, dataloader_config)
         self.net = self.getSetNetwork(net, weights_path)
+        if not isinstance(self.net, torch.jit.ScriptModule):
+            self.net.setInferenceMode(is_channels_last, autocast_dtype)
         self.criterion = criterion
-        ## list
-        self.list_samples = []
-        self.list_inputs = []
-        self.list_labels = []
-        self.list_est = []
-
-    def getDataloader(self, dataset, batch_size):
-        dataloader = torch.utils.data.DataLoader(
-            dataset,
-            batch_size=batch_size,
-            shuffle=False
-        )
+        self.reporter = reporter if reporter is not None else report_mod.Reporter()
+        ## preallocated results: the inputs are not kept, so memory does not grow with the inputs
+        num_data = len(self.dataloader.dataset)
+        self.array_labels = np.empty((num_data, 3), dtype=np.float32)
+        self.array_est = np.empty((num_data, 3), dtype=np.float32)
+        self.num_stored = 0
+
+    def getDataloader(self, dataset, batch_size, dataloader_config):
+        if dataloader_config is None:
+            dataloader_config = dataloader_mod.DataloaderConfig()
+        dataloader = dataloader_config.getDataloader(dataset, batch_size, shuffle=False)
         return dataloader
 
     def getSetNetwork(self, net, weights_path):
+        ## TorchScript (e.g. INT8 model from quantize.py)
+        if net is None:
+            net = torch.jit.load(weights_path, map_location=self.device)
+            net.eval()
+            print("Loaded [TorchScript]: ", weights_path)
+            return net
         print(net)
         net.to(self.device)
         net.eval()
@@ -81,8 +91,8 @@ class Inference:
         ## data load
         loss_all = 0.0
         for inputs, labels in tqdm(self.dataloader):
-            inputs = inputs.to(self.device)
-            labels = labels.to(self.device)
+            inputs = inputs.to(self.device, non_blocking=True)
+            labels = labels.to(self.device, non_blocking=True)
             with torch.set_grad_enabled(False):
                 ## forward
                 outputs = self.net(inputs)
@@ -90,10 +100,8 @@ class Inference:
                 ## add loss
                 loss_all += loss_batch.item() * inputs.size(0)
                 # print("loss_batch.item() = ", loss_batch.item())
-            ## append
-            self.list_inputs += list(inputs.cpu().detach().numpy())
-            self.list_labels += labels.cpu().detach().numpy().tolist()
-            self.list_est += outputs.cpu().detach().numpy().tolist()
+            ## store
+            self.storeBatch(labels.cpu().detach().numpy(), outputs.cpu().detach().numpy()[:, :3])
         ## compute error
         mae_rp, var_rp, mae_g_angle, var_g_angle = self.computeAttitudeError()
         ## sort
@@ -113,91 +121,76 @@ class Inference:
         print("var_rp [deg^2] = ", var_rp)
         print("mae_g_angle [deg] = ", mae_g_angle)
         print("var_g_angle [deg^2] = ", var_g_angle)
+        ## save
+        self.reporter.saveMetrics("metrics.json", {
+            "loss": loss_all,
+            "mae_rp[deg]": mae_rp, "var_rp[deg^2]": var_rp,
+            "mae_g_angle[deg]": mae_g_angle, "var_g_angle[deg^2]": var_g_angle
+        })
         ## graph
-        plt.tight_layout()
-        plt.show()
+        self.reporter.show()
 
     def computeLoss(self, outputs, labels):
         loss = self.criterion(outputs, labels)
         return loss
 
+    def storeBatch(self, labels, est):
+        begin = self.num_stored
+        end = begin + labels.shape[0]
+        self.array_labels[begin:end] = labels
+        self.array_est[begin:end] = est
+        self.num_stored = end
+        return begin, end
+
     def computeAttitudeError(self):
-        list_errors_rp = []
-        list_errors_g_angle = []
-        for i in range(len(self.list_labels)):
-            ## error in roll and pitch
-            label_r, label_p = self.accToRP(self.list_labels[i])
-            output_r, output_p = self.accToRP(self.list_est[i])
-            error_r = self.computeAngleDiff(output_r, label_r)
-            error_p = self.computeAngleDiff(output_p, label_p)
-            list_errors_rp.append([error_r, error_p])
-            ## error in angle of g
-            error_g_angle = self.getAngleBetweenVectors(self.list_labels[i], self.list_est[i])
-            list_errors_g_angle.append(error_g_angle)
-            ## register
-            sample = Sample(
-                i,
-                self.dataloader.dataset.data_list[i][3:], self.list_inputs[i], self.list_labels[i], self.list_est[i],
-                label_r, label_p, output_r, output_p, error_r, error_p
-            )
-            self.list_samples.append(sample)
-        mae_rp = self.computeMAE(np.array(list_errors_rp)/math.pi*180.0)
-        var_rp = self.computeVar(np.array(list_errors_rp)/math.pi*180.0)
-        mae_g_angle = self.computeMAE(np.array(list_errors_g_angle)/math.pi*180.0)
-        var_g_angle = self.computeVar(np.array(list_errors_g_angle)/math.pi*180.0)
+        ## error in roll and pitch
+        self.array_label_rp = attitude_error_mod.accToRP(self.array_labels)
+        self.array_output_rp = attitude_error_mod.accToRP(self.array_est)
+        self.array_error_rp = attitude_error_mod.computeAngleDiff(self.array_output_rp, self.array_label_rp)
+        ## error in angle of g
+        self.array_error_g_angle = attitude_error_mod.getAngleBetweenVectors(self.array_labels, self.array_est)
+        mae_rp = attitude_error_mod.computeMAE(self.array_error_rp/math.pi*180.0)
+        var_rp = attitude_error_mod.computeVar(self.array_error_rp/math.pi*180.0)
+        mae_g_angle = attitude_error_mod.computeMAE(self.array_error_g_angle/math.pi*180.0)
+        var_g_angle = attitude_error_mod.computeVar(self.array_error_g_angle/math.pi*180.0)
         return mae_rp, var_rp, mae_g_angle, var_g_angle
 
-    def accToRP(self, acc):
-        r = math.atan2(acc[1], acc[2])
-        p = math.atan2(-acc[0], math.sqrt(acc[1]*acc[1] + acc[2]*acc[2]))
-        return r, p
-
-    def computeAngleDiff(self, angle1, angle2):
-        diff = math.atan2(math.sin(angle1 - angle2), math.cos(angle1 - angle2))
-        return diff
-
-    def getAngleBetweenVectors(self, v1, v2):
-        return math.acos(np.dot(v1, v2)/np.linalg.norm(v1, ord=2)/np.linalg.norm(v2, ord=2))
-
-    def computeMAE(self, x):
-        return np.mean(np.abs(x), axis=0)
-
-    def computeVar(self, x):
-        return np.var(x, axis=0)
+    def getSample(self, index):
+        sample = Sample(
+            index,
+            self.dataloader.dataset.data_list.getInputsPath(index), self.array_labels[index], self.array_est[index],
+            self.array_label_rp[index, 0], self.array_label_rp[index, 1],
+            self.array_output_rp[index, 0], self.array_output_rp[index, 1],
+            self.array_error_rp[index, 0], self.array_error_rp[index, 1]
+        )
+        return sample
 
     def sortSamples(self):
-        list_sum_error_rp = [abs(sample.error_r) + abs(sample.error_p) for sample in self.list_samples]
+        array_sum_error_rp = np.sum(np.abs(self.array_error_rp), axis=1)
         ## get indicies
-        sorted_indicies = np.argsort(list_sum_error_rp)         #error: small->large
-        # sorted_indicies = np.argsort(list_sum_error_rp)[::-1]   #error: large->small
-        ## sort
-        self.list_samples = [self.list_samples[index] for index in sorted_indicies]
+        self.sorted_indicies = np.argsort(array_sum_error_rp)         #error: small->large
+        # self.sorted_indicies = np.argsort(array_sum_error_rp)[::-1]   #error: large->small
 
     def showResult(self):
-        visualize_gravity = True
-        plt.figure()
-        h = 2
-        w = 5
-        num_shown = h*w
-        if visualize_gravity:
-            h = 2*h
-        for i, sample in enumerate(self.list_samples):
-            sample.printData()
-            if i < num_shown:
-                ## gravity 
-                if visualize_gravity:
-                    i = i + w*(i//w)
-                    fig = plt.subplot(h, w, i+1+w)
-                    fig.set_xlim(-1, 1)
-                    fig.set_ylim(-1, 1)
-                    fig.tick_params(labelbottom=False, labelleft=False, bottom=False, left=False)
-                    fig.quiver(-0.5, 0, color='green', angles='xy', scale_units='xy', scale=1)
-                    fig.quiver(0, 0.5, color='blue', angles='xy', scale_units='xy', scale=1)
-                    fig.quiver(sample.label[1], -sample.label[2], color='deepskyblue', angles='xy', scale_units='xy', scale=1)
-                    fig.quiver(sample.mean[1], -sample.mean[2], color='magenta', angles='xy', scale_units='xy', scale=1)
-                ## image
-                plt.subplot(h, w, i+1)
-                plt.tick_params(labelbottom=False, labelleft=False, bottom=False, left=False)
-                plt.imshow(Image.open(sample.inputs_path[0]))
-                # plt.imshow(np.clip(sample.inputs.transpose((1, 2, 0)), 0, 1))
-                plt.title(str(sample.index))
+        ## print (opt-in)
+        self.reporter.printSamples([self.getSample(index) for index in self.sorted_indicies[:self.reporter.num_printed]])
+        ## table
+        list_header, list_columns = self.getResultTable()
+        self.reporter.saveTable("samples.csv", list_header, list_columns)
+        ## graph: first & last samples in the sorted order
+        num_shown = self.reporter.num_shown
+        self.reporter.saveGravityGraph("top.jpg", [self.getSample(index) for index in self.sorted_indicies[:num_shown]])
+        self.reporter.saveGravityGraph("bottom.jpg", [self.getSample(index) for index in self.sorted_indicies[::-1][:num_shown]])
+
+    def getResultTable(self):
+        list_header = [
+            "index", "inputs_path",
+            "label_x", "label_y", "label_z", "mean_x", "mean_y", "mean_z",
+            "error_r[deg]", "error_p[deg]", "error_g_angle[deg]"
+        ]
+        list_columns = [
+            range(len(self.array_labels)), self.dataloader.dataset.data_list.getPaths(),
+            *self.array_labels.T.tolist(), *self.array_est.T.tolist(),
+            *(self.array_error_rp/math.pi*180.0).T.tolist(), (self.array_error_g_angle/math.pi*180.0).tolist()
+        ]
+        return list_header, list_columns
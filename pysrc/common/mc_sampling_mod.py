@@ -0,0 +1,147 @@
+import torch
+
+class WelfordAccumulator:
+    ## running mean and covariance of (batch, dim) draws without storing them, merged chunk by chunk (Chan et al.)
+    def __init__(self, batch_size, dim, device):
+        self.count = torch.zeros(batch_size, device=device)
+        self.mean = torch.zeros(batch_size, dim, device=device)
+        self.m2 = torch.zeros(batch_size, dim, dim, device=device)
+
+    def update(self, indices, x):
+        ## x: (num_draws, len(indices), dim), draws of the rows in indices
+        x = x.float()
+        if x.size(0) == 1:
+            self.updateOne(indices, x[0])
+            return
+        count_b = x.size(0)
+        mean_b = x.mean(0)
+        diff = x - mean_b
+        m2_b = torch.einsum("nbi,nbj->bij", diff, diff)
+        count_a = self.count[indices]
+        count = count_a + count_b
+        delta = mean_b - self.mean[indices]
+        self.mean[indices] += delta * (count_b / count).unsqueeze(-1)
+        self.m2[indices] += m2_b + delta.unsqueeze(-1) * delta.unsqueeze(-2) * (count_a * count_b / count).view(-1, 1, 1)
+        self.count[indices] = count
+
+    def updateOne(self, indices, x):
+        ## classic Welford step: fewer kernels than the merge, for one draw at a time
+        count = self.count[indices] + 1
+        delta = x - self.mean[indices]
+        self.mean[indices] += delta / count.unsqueeze(-1)
+        self.m2[indices] += delta.unsqueeze(-1) * (x - self.mean[indices]).unsqueeze(-2)
+        self.count[indices] = count
+
+    def getCov(self, indices=None, ddof=0):
+        ## ddof=0: biased, like np.cov(bias=True)
+        if indices is None:
+            return self.m2 / (self.count - ddof).clamp(min=1).view(-1, 1, 1)
+        return self.m2[indices] / (self.count[indices] - ddof).clamp(min=1).view(-1, 1, 1)
+
+class McAccumulator(WelfordAccumulator):
+    ## + average of the per-draw covariance (e.g. mle) and sum of the loss, all on the device until getResult()
+    def __init__(self, batch_size, dim, device):
+        super(McAccumulator, self).__init__(batch_size, dim, device)
+        self.sum_cov_aux = None
+        self.loss_sum = torch.zeros((), device=device)
+
+    def updateDraws(self, indices, outputs, loss, cov_aux=None):
+        ## outputs: (num_draws, len(indices), dim_out), loss: mean over the draws, cov_aux: (num_draws*len(indices), 3, 3) or None
+        num_draws = outputs.size(0)
+        self.update(indices, outputs[:, :, :self.mean.size(1)])
+        self.loss_sum += loss.float() * num_draws * outputs.size(1)
+        if cov_aux is not None:
+            if self.sum_cov_aux is None:
+                self.sum_cov_aux = torch.zeros_like(self.m2)
+            self.sum_cov_aux[indices] += cov_aux.view(num_draws, -1, *self.m2.shape[1:]).float().sum(0)
+
+    def getCovAux(self, indices=None):
+        if self.sum_cov_aux is None:
+            return None
+        if indices is None:
+            return self.sum_cov_aux / self.count.view(-1, 1, 1)
+        return self.sum_cov_aux[indices] / self.count[indices].view(-1, 1, 1)
+
+    def getResult(self):
+        ## mean (batch, dim), covariance of the draws (batch, dim, dim), averaged per-draw covariance or None, loss sum
+        return self.mean, self.getCov(), self.getCovAux(), self.loss_sum
+
+class AdaptiveMcSampler:
+    ## MC dropout in chunks, each sample stops when its estimate has converged or its mul_std is clearly on one side of th_mul_std
+    def __init__(self, chunk_size=5, min_samples=10, max_samples=50, tol_mean=1e-3, tol_cov=0.05, th_mul_std=None, num_sigma=3.0):
+        self.chunk_size = chunk_size    #draws per chunk
+        self.min_samples = min_samples
+        self.max_samples = max_samples  #e.g. num_mcsampling of the fixed runs
+        self.tol_mean = tol_mean        #max change of the mean over a chunk
+        self.tol_cov = tol_cov          #max change of the covariance over a chunk, relative to its largest element
+        self.th_mul_std = th_mul_std    #None: only the convergence stops sampling
+        self.num_sigma = num_sigma      #margin of the th_mul_std decision in standard errors
+        ## statistics
+        self.num_draws = 0
+        self.num_samples = 0
+
+    def sample(self, net, inputs, labels, computeLossAndCov, use_cached_feature=True, features=None):
+        ## computeLossAndCov(outputs, labels) -> (mean loss, covariance per output or None)
+        batch_size = inputs.size(0)
+        device = inputs.device
+        ## True: dropout is only in Network.fc, the backbone runs once
+        if use_cached_feature and (features is None):
+            features = net.forwardCnn(inputs)
+        accumulator = McAccumulator(batch_size, 3, device)
+        active = torch.arange(batch_size, device=device)
+        last_mean = None
+        last_cov = None
+        while active.numel() > 0:
+            num_draws = min(self.chunk_size, self.max_samples - int(accumulator.count[active[0]].item()))
+            ## (num_draws, num_active, dim)
+            outputs = self.forwardChunk(net, inputs, features, active, num_draws)
+            loss, cov_aux = computeLossAndCov(outputs.reshape(-1, outputs.size(-1)), labels[active].repeat(num_draws, 1))
+            accumulator.updateDraws(active, outputs, loss, cov_aux)
+            ## judge
+            mean = accumulator.mean[active]
+            cov = accumulator.getCov(active)
+            ## unbiased for the decision: the biased one is too small with few draws
+            cov_unbiased = accumulator.getCov(active, ddof=1)
+            ## e.g. mle: the aleatoric covariance is averaged over the draws
+            cov_aux_mean = accumulator.getCovAux(active)
+            if cov_aux_mean is not None:
+                cov = cov + cov_aux_mean
+                cov_unbiased = cov_unbiased + cov_aux_mean
+            count = accumulator.count[active]
+            is_stop = self.isDecided(cov_unbiased, count)
+            if last_mean is not None:
+                is_stop = is_stop | self.isConverged(mean, cov, last_mean, last_cov)
+            is_done = (count >= self.max_samples) | ((count >= self.min_samples) & is_stop)
+            ## the rows still active keep their previous estimates for the next comparison
+            last_mean = mean[~is_done]
+            last_cov = cov[~is_done]
+            active = active[~is_done]
+        counts = accumulator.count
+        self.num_draws += int(counts.sum().item())
+        self.num_samples += batch_size
+        mean, cov_mc, cov_aux, loss_sum = accumulator.getResult()
+        return mean, cov_mc, cov_aux, counts, loss_sum
+
+    def forwardChunk(self, net, inputs, features, active, num_draws):
+        ## (num_draws, num_active, dim)
+        if features is not None:
+            return net.forwardFcMcSampling(features[active], num_draws)
+        return torch.stack([net(inputs[active]) for _ in range(num_draws)])
+
+    def isConverged(self, mean, cov, last_mean, last_cov):
+        diff_mean = (mean - last_mean).abs().amax(1)
+        scale_cov = cov.abs().amax((1, 2)).clamp(min=1e-12)
+        diff_cov = (cov - last_cov).abs().amax((1, 2)) / scale_cov
+        return (diff_mean < self.tol_mean) & (diff_cov < self.tol_cov)
+
+    def isDecided(self, cov, count):
+        if self.th_mul_std is None:
+            return torch.zeros_like(count, dtype=torch.bool)
+        mul_std = cov.diagonal(dim1=1, dim2=2).clamp(min=0).sqrt().prod(1)
+        ## relative standard error of a product of 3 standard deviations from count draws (fully correlated axes: conservative)
+        rel_error = 3.0 / torch.sqrt(2.0 * (count - 1).clamp(min=1))
+        log_ratio = torch.log(mul_std.clamp(min=1e-30) / self.th_mul_std).abs()
+        return log_ratio > self.num_sigma * rel_error
+
+    def getAverageDraws(self):
+        return self.num_draws / max(self.num_samples, 1)
@@ -2,14 +2,50 @@ import torch
 from torchvision import models
 import torch.nn as nn
 
+## backbone_name -> feature extractor (input: (batch, 3, resize, resize))
+def getVgg16(use_pretrained):
+    ## no pooling: fc sees the 512*(resize//32)**2 feature map
+    vgg = models.vgg16(pretrained=use_pretrained)
+    return vgg.features
+
+def getMobilenetV3Small(use_pretrained):
+    mobilenet = models.mobilenet_v3_small(pretrained=use_pretrained)
+    return nn.Sequential(mobilenet.features, mobilenet.avgpool)
+
+def getMobilenetV3Large(use_pretrained):
+    mobilenet = models.mobilenet_v3_large(pretrained=use_pretrained)
+    return nn.Sequential(mobilenet.features, mobilenet.avgpool)
+
+def getResnet18(use_pretrained):
+    resnet = models.resnet18(pretrained=use_pretrained)
+    return nn.Sequential(
+        resnet.conv1, resnet.bn1, resnet.relu, resnet.maxpool,
+        resnet.layer1, resnet.layer2, resnet.layer3, resnet.layer4,
+        resnet.avgpool
+    )
+
+def getEfficientnetB0(use_pretrained):
+    efficientnet = models.efficientnet_b0(pretrained=use_pretrained)
+    return nn.Sequential(efficientnet.features, efficientnet.avgpool)
+
+dict_backbone = {
+    "vgg16": getVgg16,
+    "mobilenet_v3_small": getMobilenetV3Small,
+    "mobilenet_v3_large": getMobilenetV3Large,
+    "resnet18": getResnet18,
+    "efficientnet_b0": getEfficientnetB0
+}
+
 class Network(nn.Module):
-    def __init__(self, resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=True):
+    def __init__(self, resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=True, backbone_name="vgg16"):
         super(Network, self).__init__()
 
-        vgg = models.vgg16(pretrained=use_pretrained_vgg)
-        self.cnn = vgg.features
+        if backbone_name not in dict_backbone:
+            raise ValueError("unknown backbone_name: " + backbone_name + " (" + ", ".join(dict_backbone.keys()) + ")")
+        self.backbone_name = backbone_name
+        self.cnn = dict_backbone[backbone_name](use_pretrained_vgg)   #use_pretrained_vgg: ImageNet weights of any backbone
 
-        dim_fc_in = 512*(resize//32)*(resize//32)
+        dim_fc_in = self.getDimCnnOut(resize)
         list_dim_fc_in = [dim_fc_in] + list_dim_fc_out
         list_fc = []
         for i in range(len(list_dim_fc_in) - 1):
@@ -20,6 +56,19 @@ class Network(nn.Module):
         self.fc = nn.Sequential(*list_fc)
         # self.initializeWeights()
 
+        ## inference options (see setInferenceMode)
+        self.is_channels_last = False
+        self.autocast_dtype = None
+
+    def getDimCnnOut(self, resize):
+        ## dummy forward in eval mode, so that BatchNorm statistics are untouched
+        is_training = self.cnn.training
+        self.cnn.eval()
+        with torch.set_grad_enabled(False):
+            dim_cnn_out = torch.flatten(self.cnn(torch.zeros(1, 3, resize, resize)), 1).size(1)
+        self.cnn.train(is_training)
+        return dim_cnn_out
+
     def initializeWeights(self):
         for m in self.fc.children():
             if isinstance(m, nn.Linear):
@@ -30,22 +79,76 @@ class Network(nn.Module):
         list_fc_param_value = []
         for param_name, param_value in self.named_parameters():
             param_value.requires_grad = True
-            if "cnn" in param_name:
+            ## by prefix: squeeze-excitation blocks in the backbones have their own "fc1", "fc2"
+            if param_name.startswith("cnn."):
                 # print("cnn: ", param_name)
                 list_cnn_param_value.append(param_value)
-            if "fc" in param_name:
+            if param_name.startswith("fc."):
                 # print("fc: ", param_name)
                 list_fc_param_value.append(param_value)
         # print("list_cnn_param_value: ",list_cnn_param_value)
         # print("list_fc_param_value: ",list_fc_param_value)
         return list_cnn_param_value, list_fc_param_value
 
+    def setInferenceMode(self, is_channels_last=False, autocast_dtype=None):
+        if is_channels_last:
+            self.to(memory_format=torch.channels_last)
+        else:
+            self.to(memory_format=torch.contiguous_format)
+        self.is_channels_last = is_channels_last
+        self.autocast_dtype = autocast_dtype    #e.g. torch.bfloat16, None: float32
+
+    def getAutocast(self, device_type):
+        return torch.autocast(device_type=device_type, dtype=self.autocast_dtype, enabled=self.autocast_dtype is not None)
+
     def forward(self, x):
-        x = self.cnn(x)
+        x = self.forwardCnn(x)
+        x = self.forwardFc(x)
+        return x
+
+    def forwardCnn(self, x):
+        if self.is_channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        with self.getAutocast(x.device.type):
+            x = self.cnn(x)
         x = torch.flatten(x, 1)
-        x = self.fc(x)
-        l2norm = torch.norm(x[:, :3].clone(), p=2, dim=1, keepdim=True)
-        x[:, :3] = torch.div(x[:, :3].clone(), l2norm)  #L2Norm, |(gx, gy, gz)| = 1
+        return x
+
+    def forwardFc(self, x):
+        with self.getAutocast(x.device.type):
+            x = self.fc(x)
+        x = self.normalizeOutputs(x)
+        return x
+
+    def normalizeOutputs(self, x):
+        ## always in float32, also under an outer autocast
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            x = x.float()
+            l2norm = torch.norm(x[:, :3].clone(), p=2, dim=1, keepdim=True)
+            x[:, :3] = torch.div(x[:, :3].clone(), l2norm)  #L2Norm, |(gx, gy, gz)| = 1
+        return x
+
+    def forwardMcSampling(self, x, num_mcsampling):
+        x = self.forwardCnn(x)
+        x = self.forwardFcMcSampling(x, num_mcsampling)
+        return x
+
+    def forwardFcMcSampling(self, features, num_mcsampling):
+        batch_size = features.size(0)
+        ## layers before the first dropout are deterministic -> computed once
+        index_first_dropout = len(self.fc)
+        for i, module in enumerate(self.fc):
+            if isinstance(module, nn.Dropout):
+                index_first_dropout = i
+                break
+        with self.getAutocast(features.device.type):
+            x = self.fc[:index_first_dropout](features)
+            ## (batch, dim) -> (num_mcsampling*batch, dim)
+            x = x.repeat(num_mcsampling, 1)
+            x = self.fc[index_first_dropout:](x)
+        x = self.normalizeOutputs(x)
+        ## (num_mcsampling*batch, dim) -> (num_mcsampling, batch, dim)
+        x = x.view(num_mcsampling, batch_size, -1)
         return x
 
 ##### test #####
@@ -66,7 +169,7 @@ class Network(nn.Module):
 # transform = data_transform_mod.DataTransform(resize, mean, std)
 # img_trans, _ = transform(img_pil, acc_numpy, phase="train")
 # ## network
-# net = Network(resize, dim_fc_out=3, use_pretrained_vgg=True)
+# net = Network(resize, list_dim_fc_out=[100, 18, 3], use_pretrained_vgg=True, backbone_name="vgg16")
 # print(net)
 # list_cnn_param_value, list_fc_param_value = net.getParamValueList()
 # ## prediction
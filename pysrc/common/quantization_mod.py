@@ -0,0 +1,100 @@
+import copy
+import io
+
+import torch
+import torch.nn as nn
+from torch.ao import quantization
+
+from common import dataloader_mod
+from common import benchmark_mod
+
+class Quantizer:
+    def __init__(self,
+            dataset,
+            net, weights_path,
+            batch_size, num_calibration_batches,
+            is_static=True, backend=None):
+        ## quantized kernels run on CPU
+        self.device = torch.device("cpu")
+        dataloader_config = dataloader_mod.DataloaderConfig()
+        self.calibration_dataloader = dataloader_config.getDataloader(dataset, batch_size, shuffle=True)
+        self.dataloader = dataloader_config.getDataloader(dataset, batch_size, shuffle=False)
+        self.net = self.getSetNetwork(net, weights_path)
+        self.num_calibration_batches = num_calibration_batches
+        self.is_static = is_static  #True: static INT8 backbone + dynamic INT8 fc, False: dynamic INT8 fc only
+        self.backend = backend if backend is not None else self.getDefaultBackend()
+        self.quantized_net = None
+
+    def getDefaultBackend(self):
+        list_engine = torch.backends.quantized.supported_engines
+        for backend in ["x86", "fbgemm", "qnnpack"]:
+            if backend in list_engine:
+                return backend
+        return list_engine[-1]
+
+    def getSetNetwork(self, net, weights_path):
+        net.to(self.device)
+        net.eval()
+        ## load
+        loaded_weights = torch.load(weights_path, map_location=self.device)
+        print("Loaded [-> CPU]: ", weights_path)
+        net.load_state_dict(loaded_weights)
+        return net
+
+    def quantize(self):
+        print("backend = ", self.backend)
+        torch.backends.quantized.engine = self.backend
+        net = copy.deepcopy(self.net)
+        net.setInferenceMode()
+        if self.is_static and net.backbone_name != "vgg16":
+            ## residual adds and hardswish/SE blocks need FX graph mode quantization
+            print("static INT8 backbone is supported only for vgg16 (", net.backbone_name, "): fc only")
+        elif self.is_static:
+            self.quantizeCnnStatic(net)
+        ## fc: weights in INT8, activations quantized on the fly
+        net = quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+        self.quantized_net = net
+        return net
+
+    def quantizeCnnStatic(self, net):
+        ## fuse Conv2d + ReLU
+        list_fused = []
+        for i in range(len(net.cnn) - 1):
+            if isinstance(net.cnn[i], nn.Conv2d) and isinstance(net.cnn[i+1], nn.ReLU):
+                list_fused.append([str(i), str(i+1)])
+        cnn = quantization.fuse_modules(net.cnn, list_fused)
+        ## float -> INT8 -> float around the backbone
+        net.cnn = nn.Sequential(quantization.QuantStub(), cnn, quantization.DeQuantStub())
+        net.cnn.qconfig = quantization.get_default_qconfig(self.backend)
+        quantization.prepare(net.cnn, inplace=True)
+        ## calibration
+        with torch.set_grad_enabled(False):
+            for i, (inputs, _) in enumerate(self.calibration_dataloader):
+                if i >= self.num_calibration_batches:
+                    break
+                net(inputs.to(self.device))
+        print("calibrated with ", min(self.num_calibration_batches, len(self.calibration_dataloader)), " batches")
+        quantization.convert(net.cnn, inplace=True)
+
+    def save(self, save_path):
+        ## TorchScript, so that Inference can load it without the float model definition
+        inputs, _ = next(iter(self.dataloader))
+        with torch.set_grad_enabled(False):
+            scripted_net = torch.jit.trace(self.quantized_net, inputs)
+        torch.jit.save(scripted_net, save_path)
+        print("Saved: ", save_path)
+
+    def report(self):
+        list_name = ["float32", "int8" if self.is_static else "int8(fc only)"]
+        list_dict_result = []
+        for net in [self.net, self.quantized_net]:
+            dict_result = benchmark_mod.evaluateNetwork(net, self.dataloader, self.device)
+            dict_result["size[MB]"] = self.getModelSize(net) / 1e6
+            list_dict_result.append(dict_result)
+        benchmark_mod.printTable(list_name, list_dict_result)
+        return list_dict_result
+
+    def getModelSize(self, net):
+        buffer = io.BytesIO()
+        torch.save(net.state_dict(), buffer)
+        return buffer.getbuffer().nbytes
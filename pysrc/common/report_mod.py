@@ -0,0 +1,78 @@
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import datetime
+import json
+import csv
+import os
+from PIL import Image
+
+class Reporter:
+    def __init__(self, save_rootpath="../../result", num_shown=10, num_printed=0, is_blocking=None):
+        self.save_path = os.path.join(save_rootpath, datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+        self.num_shown = num_shown      #samples rendered in each graph
+        self.num_printed = num_printed  #samples printed to stdout (opt-in)
+        self.is_blocking = is_blocking  #None: plt.show() only when a display is available
+
+    def getPath(self, file_name):
+        os.makedirs(self.save_path, exist_ok=True)
+        return os.path.join(self.save_path, file_name)
+
+    def saveMetrics(self, file_name, dict_metrics):
+        save_path = self.getPath(file_name)
+        with open(save_path, "w") as f:
+            json.dump(dict_metrics, f, indent=4, default=lambda x: np.asarray(x).tolist())
+        print("Saved: ", save_path)
+
+    def saveTable(self, file_name, list_header, list_columns):
+        save_path = self.getPath(file_name)
+        with open(save_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(list_header)
+            writer.writerows(zip(*list_columns))
+        print("Saved: ", save_path)
+
+    def printSamples(self, list_samples):
+        for sample in list_samples[:self.num_printed]:
+            sample.printData()
+
+    def saveGravityGraph(self, file_name, list_samples):
+        graph = plt.figure()
+        h = 2
+        w = 5
+        num_shown = h*w
+        h = 2*h
+        for i, sample in enumerate(list_samples[:num_shown]):
+            ## gravity
+            i = i + w*(i//w)
+            fig = plt.subplot(h, w, i+1+w)
+            fig.set_xlim(-1, 1)
+            fig.set_ylim(-1, 1)
+            fig.tick_params(labelbottom=False, labelleft=False, bottom=False, left=False)
+            fig.quiver(-0.5, 0, color='green', angles='xy', scale_units='xy', scale=1)
+            fig.quiver(0, 0.5, color='blue', angles='xy', scale_units='xy', scale=1)
+            fig.quiver(sample.label[1], -sample.label[2], color='deepskyblue', angles='xy', scale_units='xy', scale=1)
+            fig.quiver(sample.mean[1], -sample.mean[2], color='magenta', angles='xy', scale_units='xy', scale=1)
+            ## image
+            plt.subplot(h, w, i+1)
+            plt.tick_params(labelbottom=False, labelleft=False, bottom=False, left=False)
+            plt.imshow(Image.open(sample.inputs_path[0]))
+            plt.title(str(sample.index))
+        plt.tight_layout()
+        save_path = self.getPath(file_name)
+        graph.savefig(save_path)
+        print("Saved: ", save_path)
+
+    def show(self):
+        showFigures(self.is_blocking)
+
+def isDisplayAvailable():
+    return bool(os.environ.get("DISPLAY")) and matplotlib.get_backend().lower() != "agg"
+
+def showFigures(is_blocking=None):
+    if is_blocking is None:
+        is_blocking = isDisplayAvailable()
+    if is_blocking:
+        plt.show()
+    else:
+        plt.close("all")
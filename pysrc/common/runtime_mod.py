@@ -0,0 +1,81 @@
+## lightweight runtime for the files written by export_mod: no torchvision, no tensorboardX
+import numpy as np
+import json
+from PIL import Image
+
+from common import attitude_error_mod
+
+class RuntimeEstimator:
+    def __init__(self, model_path, num_threads=None):
+        if model_path.endswith(".onnx"):
+            self.model, self.config = self.loadOnnx(model_path, num_threads)
+            self.is_onnx = True
+        else:
+            self.model, self.config = self.loadTorchScript(model_path, num_threads)
+            self.is_onnx = False
+        print("Loaded: ", model_path)
+        self.resize = self.config["resize"]
+        self.mean = np.array(self.config["mean"], dtype=np.float32).reshape(3, 1, 1)
+        self.std = np.array(self.config["std"], dtype=np.float32).reshape(3, 1, 1)
+
+    def loadTorchScript(self, model_path, num_threads):
+        import torch
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        dict_extra_files = {"config.json": ""}
+        model = torch.jit.load(model_path, map_location="cpu", _extra_files=dict_extra_files)
+        model.eval()
+        config = json.loads(dict_extra_files["config.json"])
+        return model, config
+
+    def loadOnnx(self, model_path, num_threads):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        model = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        config = json.loads(model.get_modelmeta().custom_metadata_map["config.json"])
+        return model, config
+
+    def preprocess(self, img_pil):
+        ## same as transforms.Resize(resize) + transforms.CenterCrop(resize) + ToTensor + Normalize
+        img_pil = img_pil.convert("RGB")
+        (w, h) = img_pil.size
+        if w < h:
+            size = (self.resize, int(self.resize * h / w))
+        else:
+            size = (int(self.resize * w / h), self.resize)
+        img_pil = img_pil.resize(size, Image.BILINEAR)
+        left = int(round((size[0] - self.resize) / 2.0))
+        top = int(round((size[1] - self.resize) / 2.0))
+        img_pil = img_pil.crop((left, top, left + self.resize, top + self.resize))
+        img_numpy = np.asarray(img_pil, dtype=np.float32).transpose((2, 0, 1)) / 255.0
+        img_numpy = (img_numpy - self.mean) / self.std
+        return img_numpy
+
+    def __call__(self, list_img_pil):
+        inputs = np.stack([self.preprocess(img_pil) for img_pil in list_img_pil]).astype(np.float32)
+        list_outputs = self.forward(inputs)
+        mean = list_outputs[0]
+        cov = list_outputs[1] if self.config["has_cov"] else None
+        rp = attitude_error_mod.accToRP(mean)
+        return mean, cov, rp
+
+    def forward(self, inputs):
+        if self.is_onnx:
+            return self.model.run(None, {"inputs": inputs})
+        import torch
+        with torch.no_grad():
+            outputs = self.model(torch.from_numpy(inputs))
+        if not isinstance(outputs, tuple):
+            outputs = (outputs,)
+        return [output.numpy() for output in outputs]
+
+##### test #####
+# model_path = "../../weights/mle.onnx"
+# estimator = RuntimeEstimator(model_path)
+# img_pil = Image.open("../../../dataset_image_to_gravity/AirSim/example/camera_0.jpg")
+# mean, cov, rp = estimator([img_pil])
+# print("mean = ", mean)
+# print("cov = ", cov)
+# print("rp [deg] = ", rp/np.pi*180.0)
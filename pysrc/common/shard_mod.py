@@ -0,0 +1,232 @@
+import torch.utils.data as data
+from PIL import Image
+import numpy as np
+import multiprocessing
+import tarfile
+import json
+import time
+import io
+import os
+
+import torch
+
+from common import distributed_mod
+
+## shard layout (WebDataset style): <key>.jpg (the original file bytes) + <key>.json ({"acc": [x, y, z], "path": original path})
+## manifest.json: {"num_samples": N, "list_shard": [{"name": "shard-000000.tar", "num_samples": n}, ...]}
+
+def packShards(data_index, shard_dir, num_samples_per_shard=1000, seed=0):
+    ## data_index: data_index_mod.DataIndex, samples are mixed over the shards so that neighbors in a shard are not neighbors in the CSV
+    os.makedirs(shard_dir, exist_ok=True)
+    order = np.random.default_rng(seed).permutation(len(data_index))
+    list_shard = []
+    for shard_id, begin in enumerate(range(0, len(order), num_samples_per_shard)):
+        name = "shard-{:06d}.tar".format(shard_id)
+        list_index = order[begin:begin + num_samples_per_shard]
+        writeShard(os.path.join(shard_dir, name), data_index, list_index)
+        list_shard.append({"name": name, "num_samples": len(list_index)})
+        print("Packed: ", name, " (", begin + len(list_index), "/", len(order), ")")
+    ## the manifest last: an interrupted packing has no manifest
+    manifest = {"num_samples": len(order), "list_shard": list_shard}
+    tmp_path = os.path.join(shard_dir, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(shard_dir, "manifest.json"))
+    return manifest
+
+def writeShard(shard_path, data_index, list_index):
+    tmp_path = shard_path + ".tmp"
+    mtime = int(time.time())
+    ## ustar: one 512-byte header per member (no pax headers), see readShard
+    with tarfile.open(tmp_path, "w", format=tarfile.USTAR_FORMAT) as tar:
+        for index in list_index:
+            key = "{:09d}".format(index)
+            img_path = data_index.getPath(index)
+            with open(img_path, "rb") as f:
+                img_bytes = f.read()
+            label_bytes = json.dumps({"acc": data_index.labels[index].tolist(), "path": img_path}).encode()
+            extension = os.path.splitext(img_path)[1].lower() or ".jpg"
+            for member_name, member_bytes in [(key + extension, img_bytes), (key + ".json", label_bytes)]:
+                info = tarfile.TarInfo(member_name)
+                info.size = len(member_bytes)
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(member_bytes))
+    os.replace(tmp_path, shard_path)
+
+def readShard(shard_path):
+    ## (image bytes, label dict) in the order of the shard, read sequentially
+    ## only the ustar fields used here are parsed: tarfile decodes every field of every header and is several times slower
+    with open(shard_path, "rb", buffering=1 << 20) as f:
+        last_key = None
+        img_bytes = None
+        label = None
+        while True:
+            header = f.read(512)
+            ## end of the archive: zero blocks
+            if (len(header) < 512) or (header[257:262] != b"ustar"):
+                break
+            name = header[:100].split(b"\0", 1)[0].decode()
+            prefix = header[345:500].split(b"\0", 1)[0].decode()
+            if prefix:
+                name = prefix + "/" + name
+            size = int(header[124:136].split(b"\0", 1)[0].strip() or b"0", 8)
+            member_bytes = f.read(size)
+            f.seek(-size % 512, os.SEEK_CUR)
+            ## regular files only
+            if header[156:157] not in (b"0", b"\0"):
+                continue
+            key, extension = os.path.basename(name).split(".", 1)
+            if key != last_key:
+                last_key = key
+                img_bytes = None
+                label = None
+            if extension == "json":
+                label = json.loads(member_bytes)
+            else:
+                img_bytes = member_bytes
+            if (img_bytes is not None) and (label is not None):
+                yield img_bytes, label
+                img_bytes = None
+                label = None
+
+class ShardDataset(data.IterableDataset):
+    ## streams the shards of packShards: whole shards are read sequentially instead of one small file per sample
+    ## shards are split over the ranks and the DataLoader workers; "train" shuffles the shards and a buffer of samples
+    ## "train" is endless and cut to the same length on every worker and rank, so an epoch repeats some samples and skips others
+    ## other phases (val) see each sample exactly once: the last batch of a rank may be partial and the ranks may differ in length
+    def __init__(self, shard_dir, transform, phase, shuffle_buffer_size=1000, seed=0):
+        with open(os.path.join(shard_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        self.list_shard_path = [os.path.join(shard_dir, shard["name"]) for shard in manifest["list_shard"]]
+        self.list_shard_num_samples = [shard["num_samples"] for shard in manifest["list_shard"]]
+        self.num_samples = manifest["num_samples"]
+        self.transform = transform
+        self.phase = phase
+        self.shuffle_buffer_size = shuffle_buffer_size if phase == "train" else 0
+        self.seed = seed    #common to all ranks: they must split the same shard order
+        self.epoch = multiprocessing.Value("i", 0)  #shared with the (persistent) workers
+        self.batch_size = 1 #set by DataloaderConfig: the workers' shares are whole batches
+        self.prebuildTransform()
+
+    def prebuildTransform(self):
+        ## e.g. the homography table of DataTransform for the size of the first image
+        if (self.phase != "train") or (len(self.list_shard_path) == 0) or (not hasattr(self.transform, "prebuildHomographyTable")):
+            return
+        for img_bytes, _ in readShard(self.list_shard_path[0]):
+            with Image.open(io.BytesIO(img_bytes)) as img_pil:
+                self.transform.prebuildHomographyTable(*img_pil.size)
+            return
+
+    def setEpoch(self, epoch):
+        self.epoch.value = epoch
+
+    def setBatchSize(self, batch_size):
+        self.batch_size = batch_size
+
+    def __len__(self):
+        ## per rank
+        if self.phase == "train":
+            ## every rank yields the same number of samples (DDP needs the same number of batches)
+            return self.num_samples // distributed_mod.getWorldSize()
+        ## the samples of readUnitSamples(manifest order, rank, world_size)
+        rank = distributed_mod.getRank()
+        world_size = distributed_mod.getWorldSize()
+        if len(self.list_shard_num_samples) >= world_size:
+            return sum(self.list_shard_num_samples[rank::world_size])
+        return len(range(rank, self.num_samples, world_size))
+
+    def __iter__(self):
+        worker_info = torch.utils.data.get_worker_info()
+        num_workers = 1 if worker_info is None else worker_info.num_workers
+        worker_id = 0 if worker_info is None else worker_info.id
+        if self.phase != "train":
+            return self.iterateOnce(worker_id, num_workers)
+        return self.iterateTrain(worker_id, num_workers)
+
+    def iterateOnce(self, worker_id, num_workers):
+        ## the shards are split over the ranks only: every worker reads the shards of its rank and decodes its own batches
+        ## batches are taken from the workers in turn, so the batches are the ones of num_workers=0
+        samples = self.readUnitSamples(self.list_shard_path, distributed_mod.getRank(), distributed_mod.getWorldSize())
+        for index, (img_bytes, label) in enumerate(samples):
+            if (index // self.batch_size) % num_workers == worker_id:
+                yield self.transformSample(img_bytes, label)
+
+    def iterateTrain(self, worker_id, num_workers):
+        num_units = distributed_mod.getWorldSize() * num_workers
+        unit_id = distributed_mod.getRank() * num_workers + worker_id
+        epoch = self.epoch.value
+        rng = np.random.default_rng([self.seed, epoch, unit_id])
+        samples = self.getUnitSamples(unit_id, num_units, epoch)
+        if self.shuffle_buffer_size > 0:
+            samples = self.shuffleBuffer(samples, rng)
+        for _, (img_bytes, label) in zip(range(self.getWorkerQuota(worker_id, num_workers)), samples):
+            yield self.transformSample(img_bytes, label)
+
+    def getWorkerQuota(self, worker_id, num_workers):
+        ## batches are taken from the workers in turn: worker w makes the batches w, w + num_workers, ...
+        num_samples = len(self)
+        num_batches = -(-num_samples // self.batch_size)
+        num_worker_batches = num_batches // num_workers + (1 if worker_id < num_batches % num_workers else 0)
+        quota = num_worker_batches * self.batch_size
+        ## the last batch may be partial
+        if (num_batches > 0) and (worker_id == (num_batches - 1) % num_workers):
+            quota -= num_batches * self.batch_size - num_samples
+        return quota
+
+    def getUnitSamples(self, unit_id, num_units, epoch):
+        ## endless: a unit starts over when its shards are used up (the units may have different numbers of samples)
+        ## so with several units, an epoch repeats some samples and skips others
+        order = np.random.default_rng([self.seed, epoch]).permutation(len(self.list_shard_path))
+        list_path = [self.list_shard_path[i] for i in order]
+        is_empty = False
+        while not is_empty:
+            is_empty = True
+            for sample in self.readUnitSamples(list_path, unit_id, num_units):
+                is_empty = False
+                yield sample
+
+    def readUnitSamples(self, list_path, unit_id, num_units):
+        ## one pass over the samples of a unit
+        if len(list_path) >= num_units:
+            ## whole shards per unit
+            for shard_path in list_path[unit_id::num_units]:
+                for sample in readShard(shard_path):
+                    yield sample
+        else:
+            ## fewer shards than units: every unit reads all shards and keeps its own samples
+            count = 0
+            for shard_path in list_path:
+                for sample in readShard(shard_path):
+                    if count % num_units == unit_id:
+                        yield sample
+                    count += 1
+
+    def shuffleBuffer(self, samples, rng):
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(sample)
+                continue
+            i = rng.integers(len(buffer))
+            yield buffer[i]
+            buffer[i] = sample
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield sample
+
+    def transformSample(self, img_bytes, label):
+        img_pil = Image.open(io.BytesIO(img_bytes))
+        acc_numpy = np.array(label["acc"], dtype=np.float64)
+        img_trans, acc_trans = self.transform(img_pil, acc_numpy, phase=self.phase)
+        return img_trans, acc_trans
+
+##### test #####
+# import data_index_mod
+# import data_transform_mod
+# list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
+# csv_name = "imu_camera.csv"
+# packShards(data_index_mod.makeDataIndex(list_rootpath, csv_name), "../../shards/train")
+# dataset = ShardDataset("../../shards/train", data_transform_mod.DataTransform(224, [0.5, 0.5, 0.5], [0.5, 0.5, 0.5]), "train")
+# print("len(dataset) = ", len(dataset))
+# img_trans, acc_trans = next(iter(dataset))
+# print(img_trans.size(), acc_trans)
@@ -0,0 +1,348 @@
+import numpy as np
+import collections
+import threading
+import time
+import os
+from PIL import Image
+
+import torch
+
+from common import attitude_error_mod
+
+class Frame:
+    def __init__(self, timestamp, data):
+        self.timestamp = timestamp                  #[s] file mtime, video position or wall clock
+        self.arrival_clock = time.perf_counter()    #latency is measured from here
+        self.data = data                            #image path or BGR ndarray, decoded in the preprocessing thread
+        self.inputs = None                          #tensor (ch, h, w)
+
+class StreamResult:
+    def __init__(self, timestamp, gravity, cov, roll, pitch, latency):
+        self.timestamp = timestamp  #[s]
+        self.gravity = gravity      #ndarray (3,), |g| = 1
+        self.cov = cov              #ndarray (3, 3), None: regression
+        self.roll = roll            #[rad]
+        self.pitch = pitch          #[rad]
+        self.latency = latency      #[s] arrival -> estimate
+
+    def printData(self):
+        print("timestamp: ", self.timestamp)
+        print("gravity: ", self.gravity)
+        print("cov: ", self.cov)
+        print("roll [deg]: ", self.roll / np.pi * 180.0)
+        print("pitch [deg]: ", self.pitch / np.pi * 180.0)
+        print("latency [ms]: ", self.latency * 1000.0)
+
+class DropOldestQueue:
+    ## bounded: under overload the oldest item is dropped (or put() waits), so the newest frames are estimated
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.deque = collections.deque()
+        self.condition = threading.Condition()
+        self.num_dropped = 0
+        self.is_closed = False
+
+    def put(self, item, is_blocking=False):
+        with self.condition:
+            while is_blocking and (len(self.deque) >= self.maxsize) and (not self.is_closed):
+                self.condition.wait()
+            if len(self.deque) >= self.maxsize:
+                self.deque.popleft()
+                self.num_dropped += 1
+            self.deque.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        ## None: timeout, or closed and empty
+        end_clock = None if timeout is None else time.perf_counter() + timeout
+        with self.condition:
+            while not self.deque:
+                if self.is_closed:
+                    return None
+                if end_clock is None:
+                    self.condition.wait()
+                else:
+                    remaining = end_clock - time.perf_counter()
+                    if remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+            item = self.deque.popleft()
+            self.condition.notify_all()
+            return item
+
+    def getNowait(self):
+        ## None: empty
+        with self.condition:
+            if not self.deque:
+                return None
+            item = self.deque.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.is_closed = True
+            self.condition.notify_all()
+
+class DirectoryFrameSource:
+    ## image files appearing in dir_path, in name order (write them with a rename, so that no half-written file is read)
+    def __init__(self, dir_path, list_extension=[".jpg", ".jpeg", ".png"], poll_interval_sec=0.005, timeout_sec=None, is_existing_included=False):
+        self.dir_path = dir_path
+        self.list_extension = list_extension
+        self.poll_interval_sec = poll_interval_sec
+        self.timeout_sec = timeout_sec  #end of stream after this time without a new file, None: never
+        self.set_seen = set() if is_existing_included else set(self.listFiles())
+        self.deque_pending = collections.deque()
+        self.is_closed = False
+
+    def listFiles(self):
+        return sorted([entry.name for entry in os.scandir(self.dir_path) if os.path.splitext(entry.name)[1].lower() in self.list_extension])
+
+    def read(self):
+        ## None: end of stream
+        last_clock = time.perf_counter()
+        while not self.deque_pending:
+            if self.is_closed:
+                return None
+            if (self.timeout_sec is not None) and (time.perf_counter() - last_clock > self.timeout_sec):
+                return None
+            list_new = [name for name in self.listFiles() if name not in self.set_seen]
+            if list_new:
+                self.set_seen.update(list_new)
+                self.deque_pending.extend(list_new)
+            else:
+                time.sleep(self.poll_interval_sec)
+        path = os.path.join(self.dir_path, self.deque_pending.popleft())
+        try:
+            timestamp = os.path.getmtime(path)
+        except OSError:
+            timestamp = time.time()
+        return Frame(timestamp, path)
+
+    def close(self):
+        self.is_closed = True
+
+    def release(self):
+        pass
+
+class VideoFrameSource:
+    ## video file or camera device (int), needs opencv-python
+    def __init__(self, video_path, is_realtime=True):
+        import cv2
+        self.cv2 = cv2
+        self.capture = cv2.VideoCapture(video_path)
+        if not self.capture.isOpened():
+            raise IOError("cannot open: " + str(video_path))
+        self.is_camera = isinstance(video_path, int)
+        self.is_realtime = is_realtime  #video file: frames are read at the video fps, like a camera
+        self.start_clock = None
+        self.is_closed = False
+
+    def read(self):
+        ## None: end of stream
+        if self.is_closed:
+            return None
+        is_ok, img_bgr = self.capture.read()
+        if not is_ok:
+            return None
+        if self.is_camera:
+            return Frame(time.time(), img_bgr)
+        timestamp = self.capture.get(self.cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if self.is_realtime:
+            if self.start_clock is None:
+                self.start_clock = time.perf_counter() - timestamp
+            time.sleep(max(self.start_clock + timestamp - time.perf_counter(), 0.0))
+        return Frame(timestamp, img_bgr)
+
+    def close(self):
+        self.is_closed = True
+
+    def release(self):
+        self.capture.release()
+
+class StreamEstimator:
+    def __init__(self,
+            source,
+            net, weights_path, transform, criterion=None,
+            max_batch_size=4, max_batch_wait_sec=0.01, max_latency_sec=0.2, queue_size=4,
+            is_channels_last=False, autocast_dtype=None):
+        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        print("self.device = ", self.device)
+        self.source = source
+        self.net = self.getSetNetwork(net, weights_path)
+        self.net.setInferenceMode(is_channels_last, autocast_dtype)
+        self.transform = transform  #DataTransform, val path
+        self.criterion = criterion  #mle: covariance from the outputs, None: regression
+        self.max_batch_size = max_batch_size            #frames per forward
+        self.max_batch_wait_sec = max_batch_wait_sec    #a batch is closed this long after its first frame was dequeued
+        self.max_latency_sec = max_latency_sec          #older frames are dropped (the newest of a batch is kept when all are older)
+        ## overload: frames are dropped before decoding, the preprocessing thread waits for the estimation
+        self.frame_queue = DropOldestQueue(queue_size)          #capture -> preprocessing
+        self.inputs_queue = DropOldestQueue(max_batch_size)     #preprocessing -> estimation
+        self.list_thread = []
+        ## statistics
+        self.list_latency = []
+        self.num_frames = 0
+        self.num_stale = 0
+        self.num_failed = 0
+        self.start_clock = None
+
+    def getSetNetwork(self, net, weights_path):
+        net.to(self.device)
+        net.eval()
+        ## load
+        loaded_weights = torch.load(weights_path, map_location=self.device)
+        print("Loaded: ", weights_path)
+        net.load_state_dict(loaded_weights)
+        return net
+
+    def start(self):
+        self.warmUp()
+        self.start_clock = time.perf_counter()
+        self.list_thread = [
+            threading.Thread(target=self.captureLoop, daemon=True),
+            threading.Thread(target=self.preprocessLoop, daemon=True)
+        ]
+        for thread in self.list_thread:
+            thread.start()
+
+    def warmUp(self):
+        ## the first forward allocates buffers and is much slower than the others
+        inputs = torch.zeros(self.max_batch_size, 3, self.transform.resize, self.transform.resize, device=self.device)
+        with torch.set_grad_enabled(False):
+            self.net(inputs)
+
+    def stop(self):
+        self.source.close()
+        self.frame_queue.close()
+        self.inputs_queue.close()
+        for thread in self.list_thread:
+            thread.join()
+        self.list_thread = []
+
+    def captureLoop(self):
+        try:
+            while True:
+                frame = self.source.read()
+                if frame is None:
+                    break
+                self.num_frames += 1
+                self.frame_queue.put(frame)
+        finally:
+            self.source.release()
+            self.frame_queue.close()
+
+    def preprocessLoop(self):
+        ## decoding and preprocessing, in parallel with the forward pass
+        while True:
+            frame = self.frame_queue.get()
+            if frame is None:
+                break
+            try:
+                frame.inputs = self.transform.transformImage(self.decode(frame.data))
+            except (OSError, ValueError) as error:
+                print("failed to decode: ", error)
+                self.num_failed += 1
+                continue
+            frame.data = None
+            self.inputs_queue.put(frame, is_blocking=True)
+        self.inputs_queue.close()
+
+    def decode(self, data):
+        if isinstance(data, str):
+            with Image.open(data) as img_pil:
+                return img_pil.convert("RGB")
+        ## BGR (opencv) -> RGB
+        return Image.fromarray(np.ascontiguousarray(data[:, :, ::-1]))
+
+    def run(self):
+        ## generator of StreamResult, until the source ends or stop() is called
+        self.start()
+        try:
+            while True:
+                list_frame = self.getMicroBatch()
+                if list_frame is None:
+                    break
+                for result in self.estimate(list_frame):
+                    yield result
+        finally:
+            self.stop()
+
+    def getMicroBatch(self):
+        ## None: end of stream
+        first_frame = self.inputs_queue.get()
+        if first_frame is None:
+            return None
+        dequeue_clock = time.perf_counter()
+        list_frame = [first_frame]
+        ## backlog: the frames already waiting are taken at once
+        while len(list_frame) < self.max_batch_size:
+            frame = self.inputs_queue.getNowait()
+            if frame is None:
+                break
+            list_frame.append(frame)
+        ## then the rest of the window, from the dequeue of the first frame (the arrival of a frame that waited in the queue is already past)
+        deadline_clock = dequeue_clock + self.max_batch_wait_sec
+        while len(list_frame) < self.max_batch_size:
+            remaining = deadline_clock - time.perf_counter()
+            if remaining <= 0:
+                break
+            frame = self.inputs_queue.get(timeout=remaining)
+            if frame is None:
+                break
+            list_frame.append(frame)
+        ## overload: late frames are skipped; when all of them are late, only the newest one is estimated
+        now_clock = time.perf_counter()
+        list_fresh = [frame for frame in list_frame if now_clock - frame.arrival_clock <= self.max_latency_sec]
+        if not list_fresh:
+            list_fresh = list_frame[-1:]
+        self.num_stale += len(list_frame) - len(list_fresh)
+        return list_fresh
+
+    def estimate(self, list_frame):
+        inputs = torch.stack([frame.inputs for frame in list_frame]).to(self.device)
+        with torch.set_grad_enabled(False):
+            outputs = self.net(inputs)
+            cov = None if self.criterion is None else self.criterion.getCovMatrix(outputs).cpu().numpy()
+        gravity = outputs[:, :3].cpu().numpy()
+        rp = attitude_error_mod.accToRP(gravity)
+        now_clock = time.perf_counter()
+        list_result = []
+        for i, frame in enumerate(list_frame):
+            latency = now_clock - frame.arrival_clock
+            self.list_latency.append(latency)
+            list_result.append(StreamResult(
+                frame.timestamp, gravity[i], None if cov is None else cov[i], rp[i, 0], rp[i, 1], latency
+            ))
+        return list_result
+
+    def getStatistics(self):
+        array_latency = np.array(self.list_latency) * 1000.0
+        num_estimated = len(self.list_latency)
+        elapsed_time = time.perf_counter() - self.start_clock
+        dict_statistics = {
+            "num_frames": self.num_frames,
+            "num_estimated": num_estimated,
+            "num_dropped_queue": self.frame_queue.num_dropped + self.inputs_queue.num_dropped,
+            "num_dropped_stale": self.num_stale,
+            "num_failed": self.num_failed,
+            "fps": num_estimated / elapsed_time,
+            "latency_p50[ms]": np.percentile(array_latency, 50) if num_estimated > 0 else float("nan"),
+            "latency_p99[ms]": np.percentile(array_latency, 99) if num_estimated > 0 else float("nan")
+        }
+        return dict_statistics
+
+    def printStatistics(self):
+        for key, value in self.getStatistics().items():
+            print(key, ": ", value)
+
+##### test #####
+# from common import network_mod
+# from common import data_transform_mod
+# source = DirectoryFrameSource("../../../dataset_image_to_gravity/AirSim/example", timeout_sec=1.0, is_existing_included=True)
+# net = network_mod.Network(224, list_dim_fc_out=[100, 18, 3], use_pretrained_vgg=False)
+# transform = data_transform_mod.DataTransform(224, [0.5, 0.5, 0.5], [0.5, 0.5, 0.5])
+# estimator = StreamEstimator(source, net, "../../weights/regression.pth", transform)
+# for result in estimator.run():
+#     result.printData()
+# estimator.printStatistics()
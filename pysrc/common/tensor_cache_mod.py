@@ -0,0 +1,71 @@
+import numpy as np
+import hashlib
+import os
+from PIL import Image
+from tqdm import tqdm
+
+from torchvision import transforms
+
+class TensorCache:
+    def __init__(self, cache_rootpath, data_list, resize):
+        ## mean/std are applied when reading, so they do not change the stored bytes
+        self.cache_path = os.path.join(cache_rootpath, self.getKey(data_list, resize))
+        self.images_path = os.path.join(self.cache_path, "images.npy")
+        self.labels_path = os.path.join(self.cache_path, "labels.npy")
+        if not (os.path.isfile(self.images_path) and os.path.isfile(self.labels_path)):
+            self.build(data_list, resize)
+        ## opened lazily so that each DataLoader worker maps the files by itself
+        self.images = None
+        self.labels = None
+        print("TensorCache: ", self.cache_path)
+
+    def getKey(self, data_list, resize):
+        hasher = hashlib.sha1()
+        hasher.update(str(resize).encode())
+        data_list.updateHasher(hasher)
+        return hasher.hexdigest()
+
+    def build(self, data_list, resize):
+        os.makedirs(self.cache_path, exist_ok=True)
+        img_transform = transforms.Compose([
+            transforms.Resize(resize),
+            transforms.CenterCrop(resize)
+        ])
+        tmp_images_path = self.images_path + ".tmp"
+        tmp_labels_path = self.labels_path + ".tmp"
+        images = np.lib.format.open_memmap(tmp_images_path, mode="w+", dtype=np.uint8, shape=(len(data_list), resize, resize, 3))
+        labels = np.lib.format.open_memmap(tmp_labels_path, mode="w+", dtype=np.float32, shape=(len(data_list), 3))
+        labels[:] = data_list.labels
+        for i in tqdm(range(len(data_list))):
+            img_pil = Image.open(data_list.getPath(i)).convert("RGB")
+            images[i] = np.asarray(img_transform(img_pil))
+        images.flush()
+        labels.flush()
+        del images, labels
+        ## atomic: a killed build never leaves a half-written cache behind
+        os.replace(tmp_labels_path, self.labels_path)
+        os.replace(tmp_images_path, self.images_path)
+        print("Built: ", self.cache_path)
+
+    def open(self):
+        self.images = np.load(self.images_path, mmap_mode="r")
+        self.labels = np.load(self.labels_path, mmap_mode="r")
+
+    def __len__(self):
+        if self.labels is None:
+            self.open()
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        if self.images is None:
+            self.open()
+        img_numpy = self.images[index]      #(h, w, ch), uint8
+        acc_numpy = np.array(self.labels[index], dtype=np.float64)
+        return img_numpy, acc_numpy
+
+    def __getstate__(self):
+        ## do not pickle the mapped arrays into DataLoader workers
+        state = self.__dict__.copy()
+        state["images"] = None
+        state["labels"] = None
+        return state
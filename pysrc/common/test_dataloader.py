@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 
 import torch
 
-import make_datalist_mod
+import data_index_mod
 import data_transform_mod
 import dataset_mod
 
@@ -23,8 +23,8 @@ def show_inputs(inputs):
 list_train_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
 list_val_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
 csv_name = "imu_camera.csv"
-train_list = make_datalist_mod.makeDataList(list_train_rootpath, csv_name)
-val_list = make_datalist_mod.makeDataList(list_val_rootpath, csv_name)
+train_list = data_index_mod.makeDataIndex(list_train_rootpath, csv_name)
+val_list = data_index_mod.makeDataIndex(list_val_rootpath, csv_name)
 
 ## trans param
 resize = 224
@@ -2,52 +2,113 @@ from tqdm import tqdm
 import matplotlib.pyplot as plt
 import time
 import datetime
+import contextlib
 
 import torch
 from torchvision import models
 import torch.nn as nn
 import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
 from tensorboardX import SummaryWriter
 
+from common import dataloader_mod
+from common import batch_augmentation_mod
+from common import checkpoint_mod
+from common import distributed_mod
+from common import val_scheduler_mod
+from common import feature_cache_mod
+from common import shard_mod
+from common import report_mod
+
 class Trainer:
     def __init__(self,
             method_name,
             train_dataset, val_dataset,
             net, criterion,
             optimizer_name, lr_cnn, lr_fc,
-            batch_size, num_epochs):
+            batch_size, num_epochs,
+            dataloader_config=None,
+            resume_path=None, checkpoint_interval=1, num_kept_checkpoints=3,
+            autocast_dtype=None, num_accumulation_steps=1,
+            val_scheduler=None):
+        self.setDistributed()
         self.setRandomCondition()
-        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        self.device = distributed_mod.getDevice()
         print("self.device = ", self.device)
-        self.dataloaders_dict = self.getDataloader(train_dataset, val_dataset, batch_size)
+        self.num_accumulation_steps = num_accumulation_steps    #batch_size is split into micro-batches
+        self.dataloaders_dict = self.getDataloader(train_dataset, val_dataset, batch_size, dataloader_config)
         self.net = self.getSetNetwork(net)
+        self.setAutocast(autocast_dtype)
+        self.ddp_net = self.getDdpNetwork()
         self.criterion = criterion
         self.optimizer = self.getOptimizer(optimizer_name, lr_cnn, lr_fc)
         self.num_epochs = num_epochs
         self.str_hyperparameter  = self.getStrHyperparameter(method_name, train_dataset, optimizer_name, lr_cnn, lr_fc, batch_size)
+        self.setCheckpoint(resume_path, checkpoint_interval, num_kept_checkpoints)
+        self.val_scheduler = val_scheduler if val_scheduler is not None else val_scheduler_mod.ValScheduler()
+
+    def setDistributed(self):
+        ## DDP when launched by torchrun (WORLD_SIZE > 1)
+        distributed_mod.initProcessGroup(backend="gloo")
+        self.is_main_process = distributed_mod.isMainProcess()
 
     def setRandomCondition(self, keep_reproducibility=False):
         if keep_reproducibility:
-            torch.manual_seed(1234)
-            np.random.seed(1234)
-            random.seed(1234)
+            distributed_mod.seedRank(1234)
             torch.backends.cudnn.deterministic = True
             torch.backends.cudnn.benchmark = False
 
-    def getDataloader(self, train_dataset, val_dataset, batch_size):
-        train_dataloader = torch.utils.data.DataLoader(
-            train_dataset,
-            batch_size=batch_size,
-            shuffle=True
-        )
-        val_dataloader = torch.utils.data.DataLoader(
-            val_dataset,
-            batch_size=batch_size,
-            shuffle=False
+    def setCheckpoint(self, resume_path, checkpoint_interval, num_kept_checkpoints):
+        self.resume_path = resume_path  #e.g. "../../checkpoints/<str_hyperparameter>/epoch0010.pth"
+        self.checkpoint_manager = checkpoint_mod.CheckpointManager(
+            "../../checkpoints/" + self.str_hyperparameter,
+            checkpoint_interval, num_kept_checkpoints
         )
+
+    def getDataloader(self, train_dataset, val_dataset, batch_size, dataloader_config):
+        if dataloader_config is None:
+            dataloader_config = dataloader_mod.DataloaderConfig()
+        train_dataloader = dataloader_config.getDataloader(train_dataset, self.getMicroBatchSize(batch_size), shuffle=True)
+        val_dataloader = dataloader_config.getDataloader(val_dataset, max(batch_size // distributed_mod.getWorldSize(), 1), shuffle=False)
         dataloaders_dict = {"train": train_dataloader, "val": val_dataloader}
         return dataloaders_dict
 
+    def getMicroBatchSize(self, batch_size):
+        ## batch_size is the effective one over all ranks and micro-batches
+        num_divisions = self.num_accumulation_steps * distributed_mod.getWorldSize()
+        micro_batch_size = batch_size // num_divisions
+        if micro_batch_size * num_divisions != batch_size:
+            print("batch_size is not divisible by num_accumulation_steps * world_size: effective batch_size = ", micro_batch_size * num_divisions)
+        print("micro_batch_size = ", micro_batch_size)
+        return micro_batch_size
+
+    def setAutocast(self, autocast_dtype):
+        ## cnn/fc run in autocast_dtype inside Network, outputs (and so the loss) stay in float32
+        self.net.setInferenceMode(autocast_dtype=autocast_dtype)
+        ## float16 needs loss scaling, bfloat16 does not
+        self.scaler = torch.amp.GradScaler(self.device.type, enabled=(autocast_dtype == torch.float16))
+
+    def getForwardNetwork(self):
+        ## module called in the loop, e.g. overwritten to train only the head on cached features
+        return self.net
+
+    def getDdpNetwork(self):
+        ## self.net stays unwrapped for state_dict, getParamValueList etc.
+        net = self.getForwardNetwork()
+        if not distributed_mod.isInitialized():
+            return net
+        if self.device.type == "cuda":
+            return DistributedDataParallel(net, device_ids=[self.device.index])
+        return DistributedDataParallel(net)
+
+    def getFeatureDatasets(self, train_dataset, val_dataset, feature_cache_rootpath, num_feature_copies, batch_size):
+        ## frozen backbone: its outputs are computed once and memory-mapped
+        for param_value in self.net.cnn.parameters():
+            param_value.requires_grad = False
+        train_cache = feature_cache_mod.FeatureCache(feature_cache_rootpath, train_dataset, self.net, self.device, batch_size=batch_size, num_copies=num_feature_copies)
+        val_cache = feature_cache_mod.FeatureCache(feature_cache_rootpath, val_dataset, self.net, self.device, batch_size=batch_size)
+        return feature_cache_mod.FeatureDataset(train_cache), feature_cache_mod.FeatureDataset(val_cache)
+
     def getSetNetwork(self, net):
         print(net)
         net = net.to(self.device)
@@ -55,23 +116,25 @@ class Trainer:
 
     def getOptimizer(self, optimizer_name, lr_cnn, lr_fc):
         ## param
-        list_cnn_param_value, list_fc_param_value = self.net.getParamValueList()
+        list_param_group = self.getParamGroups(lr_cnn, lr_fc)
         ## optimizer
         if optimizer_name == "SGD":
-            optimizer = optim.SGD([
-                {"params": list_cnn_param_value, "lr": lr_cnn},
-                {"params": list_fc_param_value, "lr": lr_fc}
-            ], momentum=0.9)
+            optimizer = optim.SGD(list_param_group, momentum=0.9)
         elif optimizer_name == "Adam":
-            optimizer = optim.Adam([
-                {"params": list_cnn_param_value, "lr": lr_cnn},
-                {"params": list_fc_param_value, "lr": lr_fc}
-            ])
+            optimizer = optim.Adam(list_param_group)
         print(optimizer)
         return optimizer
 
+    def getParamGroups(self, lr_cnn, lr_fc):
+        list_cnn_param_value, list_fc_param_value = self.net.getParamValueList()
+        return [
+            {"params": list_cnn_param_value, "lr": lr_cnn},
+            {"params": list_fc_param_value, "lr": lr_fc}
+        ]
+
     def getStrHyperparameter(self, method_name, dataset, optimizer_name, lr_cnn, lr_fc, batch_size):
         str_hyperparameter = method_name \
+            + "_" + self.net.backbone_name + "_" \
             + str(len(self.dataloaders_dict["train"].dataset)) + "train" \
             + str(len(self.dataloaders_dict["val"].dataset)) + "val" \
             + str(dataset.transform.resize) + "resize" \
@@ -89,80 +152,187 @@ class Trainer:
         ## time
         start_clock = time.time()
         ## loss record
-        writer = SummaryWriter(logdir = "../../logs/" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + self.str_hyperparameter)
+        logdir = "../../logs/" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + self.str_hyperparameter
         record_loss_train = []
         record_loss_val = []
+        record_epoch_val = []
+        start_epoch = 0
+        ## resume
+        if self.resume_path is not None:
+            dict_state = self.loadCheckpoint(self.resume_path)
+            logdir = dict_state["logdir"]
+            record_loss_train = dict_state["record_loss_train"]
+            record_loss_val = dict_state["record_loss_val"]
+            record_epoch_val = dict_state["record_epoch_val"]
+            start_epoch = dict_state["epoch"] + 1
+        writer = SummaryWriter(logdir = logdir) if self.is_main_process else None
         ## loop
-        for epoch in range(self.num_epochs):
-            print("----------")
-            print("Epoch {}/{}".format(epoch+1, self.num_epochs))
+        for epoch in range(start_epoch, self.num_epochs):
+            if self.is_main_process:
+                print("----------")
+                print("Epoch {}/{}".format(epoch+1, self.num_epochs))
             ## phase
+            is_val = False
+            is_stop = False
             for phase in ["train", "val"]:
+                ## skip
+                if (epoch == 0) and (phase=="train"):
+                    continue
+                if phase == "val":
+                    is_val = self.val_scheduler.isValEpoch(epoch, self.num_epochs)
+                    if not is_val:
+                        continue
                 if phase == "train":
                     self.net.train()
                 else:
                     self.net.eval()
-                ## skip
-                if (epoch == 0) and (phase=="train"):
-                    continue
+                sampler = self.dataloaders_dict[phase].sampler
+                if isinstance(sampler, torch.utils.data.distributed.DistributedSampler):
+                    sampler.set_epoch(epoch)
+                dataset = self.dataloaders_dict[phase].dataset
+                if isinstance(dataset, shard_mod.ShardDataset):
+                    dataset.setEpoch(epoch)
                 ## data load
                 epoch_loss = 0.0
-                for inputs, labels in tqdm(self.dataloaders_dict[phase]):
-                    inputs = inputs.to(self.device)
-                    labels = labels.to(self.device)
-                    ## reset gradient
-                    self.optimizer.zero_grad()   #reset grad to zero (after .step())
+                num_samples = 0
+                self.optimizer.zero_grad()
+                for index, (inputs, labels) in enumerate(tqdm(self.dataloaders_dict[phase], disable=not self.is_main_process)):
+                    inputs = inputs.to(self.device, non_blocking=True)
+                    labels = labels.to(self.device, non_blocking=True)
+                    if phase == "train":
+                        inputs, labels = self.augmentBatch(inputs, labels)
                     ## compute gradient
                     with torch.set_grad_enabled(phase == "train"):  #compute grad only in "train"
-                        ## forward
-                        outputs = self.net(inputs)
-                        loss = self.computeLoss(outputs, labels)
-                        ## backward
+                        ## forward & backward (gradients are all-reduced only at the end of the accumulation)
+                        with self.getSyncContext(phase, index):
+                            ## val: the ranks may have different numbers of batches (dataloader_mod.UnpaddedSampler), no collective in the forward
+                            outputs = self.ddp_net(inputs) if phase == "train" else self.getForwardNetwork()(inputs)
+                            loss = self.computeLoss(outputs, labels)
+                            if phase == "train":
+                                ## weighted so that the accumulated gradient is the one of the mean over the whole batch
+                                weight = self.getAccumulationWeight(index, inputs.size(0))
+                                self.scaler.scale(loss * weight).backward()     #accumulate gradient to each Tensor
+                        ## update
                         if phase == "train":
-                            loss.backward()     #accumulate gradient to each Tensor
-                            self.optimizer.step()    #update param depending on current .grad
+                            if self.isAccumulationEnd(index):
+                                self.scaler.step(self.optimizer)    #update param depending on current .grad
+                                self.scaler.update()
+                                self.optimizer.zero_grad()   #reset grad to zero (after .step())
                         ## add loss
                         epoch_loss += loss.item() * inputs.size(0)
-                ## average loss
-                epoch_loss = epoch_loss / len(self.dataloaders_dict[phase].dataset)
-                print("{} Loss: {:.4f}".format(phase, epoch_loss))
+                        num_samples += inputs.size(0)
+                ## average loss over all ranks
+                epoch_loss, num_samples = distributed_mod.allReduceSum([epoch_loss, num_samples])
+                epoch_loss = epoch_loss / num_samples
+                if self.is_main_process:
+                    print("{} Loss: {:.4f}".format(phase, epoch_loss))
                 ## record
                 if phase == "train":
                     record_loss_train.append(epoch_loss)
-                    writer.add_scalar("Loss/train", epoch_loss, epoch)
+                    if self.is_main_process:
+                        writer.add_scalar("Loss/train", epoch_loss, epoch)
                     # for param_name, param_value in self.net.named_parameters():
                     #     # print(param_name, ": ", param_value.grad.abs().mean())
                     #     writer.add_scalar("Gradient/" + param_name, param_value.grad.abs().mean(), epoch)
                 else:
                     record_loss_val.append(epoch_loss)
-                    writer.add_scalar("Loss/val", epoch_loss, epoch)
-            if record_loss_train and record_loss_val:
+                    record_epoch_val.append(epoch)
+                    if self.is_main_process:
+                        writer.add_scalar("Loss/val", epoch_loss, epoch)
+                    is_stop = self.val_scheduler.update(epoch_loss)
+            if (epoch > 0) and is_val and self.is_main_process:
                 writer.add_scalars("Loss/train_and_val", {"train": record_loss_train[-1], "val": record_loss_val[-1]}, epoch)
+            ## checkpoint
+            if self.is_main_process:
+                self.saveCheckpoint(epoch, logdir, record_loss_train, record_loss_val, record_epoch_val, is_val)
+            if is_stop:
+                break
+        if not self.is_main_process:
+            distributed_mod.destroyProcessGroup()
+            return
         writer.close()
         ## save
         self.saveParam()
-        self.saveGraph(record_loss_train, record_loss_val)
+        self.saveGraph(record_loss_train, record_loss_val, record_epoch_val)
+        distributed_mod.destroyProcessGroup()
         ## training time
         mins = (time.time() - start_clock) // 60
         secs = (time.time() - start_clock) % 60
         print ("training_time: ", mins, " [min] ", secs, " [sec]")
 
+    def augmentBatch(self, inputs, labels):
+        ## BatchDataTransform: augmentation on the device, one warp per batch
+        transform = getattr(self.dataloaders_dict["train"].dataset, "transform", None)    #None: e.g. FeatureDataset
+        if isinstance(transform, batch_augmentation_mod.BatchDataTransform):
+            inputs, labels = transform.augmentBatch(inputs, labels)
+        return inputs, labels
+
+    def getSyncContext(self, phase, index):
+        if (phase == "train") and isinstance(self.ddp_net, DistributedDataParallel) and (not self.isAccumulationEnd(index)):
+            return self.ddp_net.no_sync()
+        return contextlib.nullcontext()
+
+    def getAccumulationWeight(self, index, num_samples):
+        dataloader = self.dataloaders_dict["train"]
+        group_begin = (index // self.num_accumulation_steps) * self.num_accumulation_steps * dataloader.batch_size
+        ## samples of this rank (IterableDataset: no sampler, the dataset has the length per rank)
+        num_samples_rank = len(dataloader.dataset) if isinstance(dataloader.dataset, torch.utils.data.IterableDataset) else len(dataloader.sampler)
+        group_end = min(group_begin + self.num_accumulation_steps * dataloader.batch_size, num_samples_rank)
+        return num_samples / (group_end - group_begin)
+
+    def isAccumulationEnd(self, index):
+        return ((index + 1) % self.num_accumulation_steps == 0) or (index + 1 == len(self.dataloaders_dict["train"]))
+
     def computeLoss(self, outputs, labels):
         loss = self.criterion(outputs, labels)
         return loss
 
+    def saveCheckpoint(self, epoch, logdir, record_loss_train, record_loss_val, record_epoch_val, is_val):
+        dict_state = {
+            "net": self.net.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "scaler": self.scaler.state_dict(),
+            "val_scheduler": self.val_scheduler.state_dict(),
+            "logdir": logdir,
+            "record_loss_train": record_loss_train,
+            "record_loss_val": record_loss_val,
+            "record_epoch_val": record_epoch_val
+        }
+        generator = self.dataloaders_dict["train"].generator
+        if generator is not None:
+            dict_state["generator"] = generator.get_state()
+        val_loss = record_loss_val[-1] if is_val else None
+        self.checkpoint_manager.save(dict_state, epoch, self.num_epochs, val_loss=val_loss)
+
+    def loadCheckpoint(self, load_path):
+        dict_state = self.checkpoint_manager.load(load_path)
+        self.net.load_state_dict(dict_state["net"])
+        self.optimizer.load_state_dict(dict_state["optimizer"])
+        self.scaler.load_state_dict(dict_state["scaler"])
+        self.val_scheduler.load_state_dict(dict_state["val_scheduler"])
+        generator = self.dataloaders_dict["train"].generator
+        if (generator is not None) and ("generator" in dict_state):
+            generator.set_state(dict_state["generator"])
+        ## DDP: the saved RNG states are the ones of rank 0
+        if distributed_mod.getRank() > 0:
+            distributed_mod.seedRank(int(torch.randint(2**31, (1,))))
+            if generator is not None:
+                generator.manual_seed(int(torch.randint(2**31, (1,))))
+        print("Resume from epoch ", dict_state["epoch"] + 2)
+        return dict_state
+
     def saveParam(self):
         save_path = "../../weights/" + self.str_hyperparameter + ".pth"
         torch.save(self.net.state_dict(), save_path)
         print("Saved: ", save_path)
 
-    def saveGraph(self, record_loss_train, record_loss_val):
+    def saveGraph(self, record_loss_train, record_loss_val, record_epoch_val):
         graph = plt.figure()
-        plt.plot(range(len(record_loss_train)), record_loss_train, label="Training")
-        plt.plot(range(len(record_loss_val)), record_loss_val, label="Validation")
+        plt.plot(range(1, len(record_loss_train) + 1), record_loss_train, label="Training")
+        plt.plot(record_epoch_val, record_loss_val, label="Validation")
         plt.legend()
         plt.xlabel("Epoch")
         plt.ylabel("Loss [m^2/s^4]")
         plt.title("loss: train=" + str(record_loss_train[-1]) + ", val=" + str(record_loss_val[-1]))
         graph.savefig("../../graph/" + self.str_hyperparameter + ".jpg")
-        plt.show()
+        report_mod.showFigures()
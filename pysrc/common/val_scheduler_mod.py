@@ -0,0 +1,46 @@
+import time
+
+from common import distributed_mod
+
+class ValScheduler:
+    def __init__(self, val_interval=1, val_time_interval_sec=None, is_initial_val=False, patience=None, min_delta=0.0):
+        self.val_interval = val_interval                    #[epoch], None: only by time
+        self.val_time_interval_sec = val_time_interval_sec  #validate when this time has passed since the last val, None: only by epoch
+        self.is_initial_val = is_initial_val                #val before training (epoch 0)
+        self.patience = patience                            #[val passes] without improvement before stopping, None: no early stopping
+        self.min_delta = min_delta                          #smaller improvements do not count
+        self.best_loss = float("inf")
+        self.num_bad_vals = 0
+        self.last_val_time = time.time()
+
+    def isValEpoch(self, epoch, num_epochs):
+        if epoch + 1 == num_epochs:
+            is_val = True
+        elif epoch == 0:
+            is_val = self.is_initial_val
+        else:
+            is_val = (self.val_interval is not None) and (epoch % self.val_interval == 0)
+            if self.val_time_interval_sec is not None:
+                is_val = is_val or (time.time() - self.last_val_time >= self.val_time_interval_sec)
+        ## DDP: the clocks of the ranks differ, validate if any rank says so
+        return distributed_mod.allReduceSum([float(is_val)])[0] > 0
+
+    def update(self, val_loss):
+        ## returns True when training should stop
+        self.last_val_time = time.time()
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.num_bad_vals = 0
+        else:
+            self.num_bad_vals += 1
+        if (self.patience is not None) and (self.num_bad_vals >= self.patience):
+            print("Early stopping: no improvement in ", self.num_bad_vals, " val passes (best = ", self.best_loss, ")")
+            return True
+        return False
+
+    def state_dict(self):
+        return {"best_loss": self.best_loss, "num_bad_vals": self.num_bad_vals}
+
+    def load_state_dict(self, dict_state):
+        self.best_loss = dict_state["best_loss"]
+        self.num_bad_vals = dict_state["num_bad_vals"]
@@ -6,29 +6,45 @@ import torch
 class Criterion:
     def __init__(self, device):
         self.device = device
+        ## (row, col) of the 6 elements: (0,0), (1,0), (1,1), (2,0), (2,1), (2,2)
+        self.tril_indices = torch.tril_indices(3, 3, device=device)
+        self.diag_mask = (self.tril_indices[0] == self.tril_indices[1]).float()
+        self.tril_flat_indices = self.tril_indices[0] * 3 + self.tril_indices[1]
 
     def __call__(self, outputs, labels):
-        mu = outputs[:, :3]
         L = self.getTriangularMatrix(outputs)
-        L = L.to(self.device)
-        dist = torch.distributions.MultivariateNormal(mu, scale_tril=L)
-        loss = -dist.log_prob(labels)
+        loss = self.computeNLL(outputs, labels, L)
+        return loss
+
+    def computeLossAndCov(self, outputs, labels):
+        L = self.getTriangularMatrix(outputs)
+        loss = self.computeNLL(outputs, labels, L)
+        LL = self.computeCovFromTriangular(L)
+        return loss, LL
+
+    def computeNLL(self, outputs, labels, L):
+        ## -log N(labels | mu, L*L^T) = 0.5*|L^-1 (labels - mu)|^2 + sum(log diag(L)) + 1.5*log(2*pi)
+        mu = outputs[:, :3]
+        diff = (labels - mu).unsqueeze(-1)
+        z = torch.linalg.solve_triangular(L, diff, upper=False).squeeze(-1)
+        log_det = (outputs[:, 3:9] * self.diag_mask).sum(1)  #log(exp(x)) on the diagonal
+        loss = 0.5 * z.pow(2).sum(1) + log_det + 1.5 * math.log(2 * math.pi)
         loss = loss.mean()
         return loss
 
     def getTriangularMatrix(self, outputs):
         elements = outputs[:, 3:9]
-        L = torch.zeros(outputs.size(0), elements.size(1)//2, elements.size(1)//2)
-        L[:, 0, 0] = torch.exp(elements[:, 0])
-        L[:, 1, 0] = elements[:, 1]
-        L[:, 1, 1] = torch.exp(elements[:, 2])
-        L[:, 2, 0] = elements[:, 3]
-        L[:, 2, 1] = elements[:, 4]
-        L[:, 2, 2] = torch.exp(elements[:, 5])
+        ## exp only on the diagonal (exp(0)=1 elsewhere, so no overflow in the masked branch)
+        values = elements * (1 - self.diag_mask) + torch.exp(elements * self.diag_mask) * self.diag_mask
+        L = values.new_zeros(values.size(0), 9).index_copy(1, self.tril_flat_indices, values)
+        L = L.view(-1, 3, 3)
         return L
 
     def getCovMatrix(self, outputs):
         L = self.getTriangularMatrix(outputs)
+        return self.computeCovFromTriangular(L)
+
+    def computeCovFromTriangular(self, L):
         Ltrans = torch.transpose(L, 1, 2)
         LL = torch.bmm(L, Ltrans)
         return LL
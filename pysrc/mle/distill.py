@@ -0,0 +1,90 @@
+import torch
+
+import sys
+sys.path.append('../')
+from common import distillation_mod
+from common import distributed_mod
+from common import val_scheduler_mod
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import network_mod
+import criterion_mod
+
+def main():
+    ## hyperparameters
+    method_name = "mle_distill"
+    list_train_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
+    list_val_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
+    csv_name = "imu_camera.csv"
+    cache_rootpath = "../../cache"  #preprocessed images and teacher outputs are memory-mapped from here
+    resize = 224
+    backbone_name = "mobilenet_v3_small"    #student, see network_mod.dict_backbone
+    teacher_backbone_name = "vgg16"
+    teacher_weights_path = "../../weights/mle.pth"
+    mean_element = 0.5
+    std_element = 0.5
+    hor_fov_deg = 70
+    alpha = 0.5 #weight of the teacher term (1 - alpha: ground truth)
+    optimizer_name = "Adam"  #"SGD" or "Adam"
+    lr_cnn = 1e-4
+    lr_fc = 1e-4
+    batch_size = 50
+    num_epochs = 50
+    autocast_dtype = None   #e.g. torch.bfloat16: mixed precision (also on CPU)
+    num_accumulation_steps = 1  #batch_size is processed in this many micro-batches
+    val_interval = 1    #[epoch]
+    early_stopping_patience = None  #e.g. 5: stop after 5 val passes without improvement
+    resume_path = None  #e.g. "../../checkpoints/<str_hyperparameter>/epoch0010.pth": continue an interrupted run
+    report_batch_size = 1   #latency of a single frame
+    ## dataset
+    ## the student is trained WITHOUT augmentation: the teacher outputs are cached per image, so train_dataset uses phase="val"
+    ## (the training set is seen unaugmented every epoch; fine_tune.py can continue from the student weights with augmentation)
+    train_dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_train_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element]),
+            hor_fov_deg=hor_fov_deg
+        ),
+        phase="val",   #no augmentation, see above
+        cache_rootpath=cache_rootpath
+    )
+    val_dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_val_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element]),
+            hor_fov_deg=hor_fov_deg
+        ),
+        phase="val",
+        cache_rootpath=cache_rootpath
+    )
+    ## network
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=True, backbone_name=backbone_name)
+    teacher_net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=teacher_backbone_name)
+    ## criterion (teacher term: KL divergence between the Gaussians)
+    device = distributed_mod.getDevice()
+    criterion = distillation_mod.GaussianDistillationCriterion(criterion_mod.Criterion(device), alpha=alpha)
+    ## train
+    trainer = distillation_mod.DistillationTrainer(
+        method_name,
+        train_dataset, val_dataset,
+        net, teacher_net, teacher_weights_path, criterion,
+        optimizer_name, lr_cnn, lr_fc,
+        batch_size, num_epochs,
+        resume_path=resume_path,
+        autocast_dtype=autocast_dtype,
+        num_accumulation_steps=num_accumulation_steps,
+        val_scheduler=val_scheduler_mod.ValScheduler(val_interval=val_interval, patience=early_stopping_patience),
+        teacher_cache_rootpath=cache_rootpath
+    )
+    trainer.train()
+    ## report
+    if distributed_mod.isMainProcess():
+        distillation_mod.compareWithTeacher(trainer.net, teacher_net, val_dataset, report_batch_size, trainer.device)
+
+if __name__ == '__main__':
+    main()
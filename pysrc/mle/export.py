@@ -0,0 +1,33 @@
+import torch
+
+import sys
+sys.path.append('../')
+from common import network_mod
+from common import export_mod
+import criterion_mod
+
+def main():
+    ## hyperparameters
+    resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
+    mean_element = 0.5
+    std_element = 0.5
+    weights_path = "../../weights/mle.pth"
+    torchscript_path = "../../weights/mle.pt"
+    onnx_path = "../../weights/mle.onnx"
+    ## network
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    ## criterion
+    criterion = criterion_mod.Criterion(torch.device("cpu"))
+    ## export
+    exporter = export_mod.Exporter(
+        net, weights_path, criterion,
+        resize,
+        ([mean_element, mean_element, mean_element]),
+        ([std_element, std_element, std_element])
+    )
+    exporter.exportTorchScript(torchscript_path)
+    exporter.exportOnnx(onnx_path)
+
+if __name__ == '__main__':
+    main()
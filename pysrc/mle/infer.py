@@ -11,20 +11,21 @@ import torch.nn as nn
 import sys
 sys.path.append('../')
 from common import inference_mod
-from common import make_datalist_mod
+from common import data_index_mod
 from common import data_transform_mod
 from common import dataset_mod
 from common import network_mod
+from common import attitude_error_mod
 import criterion_mod
 
 class Sample(inference_mod.Sample):
     def __init__(self,
             index,
-            inputs_path, inputs, label, mean, cov, mul_std,
+            inputs_path, label, mean, cov, mul_std,
             label_r, label_p, output_r, output_p, error_r, error_p):
         super(Sample, self).__init__(
             index,
-            inputs_path, inputs, label, mean,
+            inputs_path, label, mean,
             label_r, label_p, output_r, output_p, error_r, error_p
         )
         self.cov = cov          #ndarray
@@ -40,16 +41,18 @@ class Inference(inference_mod.Inference):
             dataset,
             net, weights_path, criterion,
             batch_size,
-            th_mul_std):
+            th_mul_std,
+            dataloader_config=None, reporter=None,
+            is_channels_last=False, autocast_dtype=None):
         super(Inference, self).__init__(
             dataset,
             net, weights_path, criterion,
-            batch_size
+            batch_size,
+            dataloader_config=dataloader_config, reporter=reporter,
+            is_channels_last=is_channels_last, autocast_dtype=autocast_dtype
         )
-        ## list
-        self.list_selected_samples = []
-        self.list_cov = []
-        self.list_mul_std = []
+        ## preallocated results
+        self.array_cov = np.empty((len(self.dataloader.dataset), 3, 3), dtype=np.float32)
         ## threshold
         self.th_mul_std = th_mul_std
 
@@ -59,22 +62,19 @@ class Inference(inference_mod.Inference):
         ## data load
         loss_all = 0.0
         for inputs, labels in tqdm(self.dataloader):
-            inputs = inputs.to(self.device)
-            labels = labels.to(self.device)
+            inputs = inputs.to(self.device, non_blocking=True)
+            labels = labels.to(self.device, non_blocking=True)
             ## compute gradient
             with torch.set_grad_enabled(False):
                 ## forward
                 outputs = self.net(inputs)
-                loss_batch = self.computeLoss(outputs, labels)
+                loss_batch, cov = self.computeLossAndCov(outputs, labels)
                 ## add loss
                 loss_all += loss_batch.item() * inputs.size(0)
                 # print("loss_batch.item() = ", loss_batch.item())
-            ## append
-            self.list_inputs += list(inputs.cpu().detach().numpy())
-            self.list_labels += labels.cpu().detach().numpy().tolist()
-            self.list_est += outputs.cpu().detach().numpy()[:, :3].tolist()
-            cov = self.criterion.getCovMatrix(outputs)
-            self.list_cov += list(cov.cpu().detach().numpy())
+            ## store
+            begin, end = self.storeBatch(labels.cpu().detach().numpy(), outputs.cpu().detach().numpy()[:, :3])
+            self.array_cov[begin:end] = cov.cpu().detach().numpy()
         ## compute error
         mae, var, ave_mul_std, selected_mae, selected_var, weighted_mae = self.computeAttitudeError()
         ## sort
@@ -96,79 +96,90 @@ class Inference(inference_mod.Inference):
         print("ave_mul_std [m^3/s^6] = ", ave_mul_std)
         ## selected MAE & Var
         print("th_mul_std = ", self.th_mul_std)
-        print("number of the selected samples = ", len(self.list_selected_samples), " / ", len(self.list_samples))
+        print("number of the selected samples = ", np.sum(self.array_is_selected), " / ", len(self.array_is_selected))
         print("selected mae [deg] = ", selected_mae)
         print("selected var [deg^2] = ", selected_var)
         print("weighted mae [deg] = ", weighted_mae)
+        ## save
+        self.reporter.saveMetrics("metrics.json", {
+            "loss": loss_all,
+            "mae[deg]": mae, "var[deg^2]": var,
+            "ave_mul_std[m^3/s^6]": ave_mul_std, "th_mul_std": self.th_mul_std,
+            "num_selected": np.sum(self.array_is_selected), "num_samples": len(self.array_is_selected),
+            "selected_mae[deg]": selected_mae, "selected_var[deg^2]": selected_var,
+            "weighted_mae[deg]": weighted_mae
+        })
         ## graph
-        plt.tight_layout()
-        plt.show()
+        self.reporter.show()
+
+    def computeLossAndCov(self, outputs, labels):
+        loss, cov = self.criterion.computeLossAndCov(outputs, labels)
+        return loss, cov
 
     def computeAttitudeError(self): #overwrite
-        list_errors = []
-        list_selected_errors = []
-        for i in range(len(self.list_labels)):
-            ## error
-            label_r, label_p = self.accToRP(self.list_labels[i])
-            output_r, output_p = self.accToRP(self.list_est[i])
-            error_r = self.computeAngleDiff(output_r, label_r)
-            error_p = self.computeAngleDiff(output_p, label_p)
-            list_errors.append([error_r, error_p])
-            ## multiplied sigma
-            mul_std = math.sqrt(self.list_cov[i][0, 0]) * math.sqrt(self.list_cov[i][1, 1]) * math.sqrt(self.list_cov[i][2, 2])
-            self.list_mul_std.append(mul_std)
-            ## register
-            sample = Sample(
-                i,
-                self.dataloader.dataset.data_list[i][3:], self.list_inputs[i], self.list_labels[i], self.list_est[i], self.list_cov[i], mul_std,
-                label_r, label_p, output_r, output_p, error_r, error_p
-            )
-            self.list_samples.append(sample)
-            ## judge
-            if mul_std < self.th_mul_std:
-                self.list_selected_samples.append(sample)
-                list_selected_errors.append([error_r, error_p])
-        mae = self.computeMAE(np.array(list_errors)/math.pi*180.0)
-        var = self.computeVar(np.array(list_errors)/math.pi*180.0)
-        ave_mul_std = np.mean(self.list_mul_std, axis=0)
-        selected_mae = self.computeMAE(np.array(list_selected_errors)/math.pi*180.0)
-        selected_var = self.computeVar(np.array(list_selected_errors)/math.pi*180.0)
-        list_weighted_error = list(np.array(list_errors)/math.pi*180.0 * (1/np.array(self.list_mul_std)[:, np.newaxis]))
-        weighted_mae = np.sum(np.abs(list_weighted_error), axis=0) / np.sum(1/np.array(self.list_mul_std))
+        mae, var, _, _ = super(Inference, self).computeAttitudeError()
+        ## multiplied sigma
+        self.array_mul_std = attitude_error_mod.computeMulStd(self.array_cov)
+        ## judge
+        self.array_is_selected = self.array_mul_std < self.th_mul_std
+        ave_mul_std = np.mean(self.array_mul_std, axis=0)
+        selected_mae = attitude_error_mod.computeMAE(self.array_error_rp[self.array_is_selected]/math.pi*180.0)
+        selected_var = attitude_error_mod.computeVar(self.array_error_rp[self.array_is_selected]/math.pi*180.0)
+        weighted_mae = attitude_error_mod.computeWeightedMAE(self.array_error_rp/math.pi*180.0, 1/self.array_mul_std)
         return mae, var, ave_mul_std, selected_mae, selected_var, weighted_mae
 
+    def getSample(self, index): #overwrite
+        sample = Sample(
+            index,
+            self.dataloader.dataset.data_list.getInputsPath(index), self.array_labels[index], self.array_est[index], self.array_cov[index], self.array_mul_std[index],
+            self.array_label_rp[index, 0], self.array_label_rp[index, 1],
+            self.array_output_rp[index, 0], self.array_output_rp[index, 1],
+            self.array_error_rp[index, 0], self.array_error_rp[index, 1]
+        )
+        return sample
+
+    def getResultTable(self):   #overwrite
+        list_header, list_columns = super(Inference, self).getResultTable()
+        list_header.append("mul_std")
+        list_columns.append(self.array_mul_std.tolist())
+        return list_header, list_columns
+
     def sortSamples(self):  #overwrite
-        list_sum_error_rp = [abs(sample.error_r) + abs(sample.error_p) for sample in self.list_samples]
+        array_sum_error_rp = np.sum(np.abs(self.array_error_rp), axis=1)
         ## get indicies
-        # sorted_indicies = np.argsort(list_sum_error_rp)         #error: small->large
-        # sorted_indicies = np.argsort(list_sum_error_rp)[::-1]   #error: large->small
-        sorted_indicies = np.argsort(self.list_mul_std)            #sigma: small->large
-        # sorted_indicies = np.argsort(self.list_mul_std)[::-1]      #sigma: large->small
-        ## sort
-        self.list_samples = [self.list_samples[index] for index in sorted_indicies]
+        # self.sorted_indicies = np.argsort(array_sum_error_rp)         #error: small->large
+        # self.sorted_indicies = np.argsort(array_sum_error_rp)[::-1]   #error: large->small
+        self.sorted_indicies = np.argsort(self.array_mul_std)            #sigma: small->large
+        # self.sorted_indicies = np.argsort(self.array_mul_std)[::-1]      #sigma: large->small
 
 def main():
     ## hyperparameters
     list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
     csv_name = "imu_camera.csv"
+    cache_rootpath = None   #e.g. "../../cache": preprocessed val images are memory-mapped from here
     resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
     mean_element = 0.5
     std_element = 0.5
     batch_size = 10
     weights_path = "../../weights/mle.pth"
     th_mul_std = 0.0001
+    is_channels_last = False
+    autocast_dtype = None   #e.g. torch.bfloat16
     ## dataset
     dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_rootpath, csv_name),
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
         transform=data_transform_mod.DataTransform(
             resize,
             ([mean_element, mean_element, mean_element]),
             ([std_element, std_element, std_element])
         ),
-        phase="val"
+        phase="val",
+        cache_rootpath=cache_rootpath
     )
     ## network
-    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=False)
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    # net = None  #weights_path is a TorchScript model, e.g. "../../weights/mle_int8.pt"
     ## criterion
     device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     criterion = criterion_mod.Criterion(device)
@@ -177,7 +188,8 @@ def main():
         dataset,
         net, weights_path, criterion,
         batch_size,
-        th_mul_std
+        th_mul_std,
+        is_channels_last=is_channels_last, autocast_dtype=autocast_dtype
     )
     inference.infer()
 
@@ -0,0 +1,48 @@
+import torch
+
+import sys
+sys.path.append('../')
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import network_mod
+from common import quantization_mod
+
+def main():
+    ## hyperparameters
+    list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
+    csv_name = "imu_camera.csv"
+    resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
+    mean_element = 0.5
+    std_element = 0.5
+    batch_size = 10
+    weights_path = "../../weights/mle.pth"
+    save_path = "../../weights/mle_int8.pt"
+    num_calibration_batches = 20
+    is_static = True
+    ## dataset
+    dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element])
+        ),
+        phase="val"
+    )
+    ## network
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    ## quantize
+    quantizer = quantization_mod.Quantizer(
+        dataset,
+        net, weights_path,
+        batch_size, num_calibration_batches,
+        is_static=is_static
+    )
+    quantizer.quantize()
+    quantizer.save(save_path)
+    quantizer.report()
+
+if __name__ == '__main__':
+    main()
@@ -12,23 +12,27 @@ from tensorboardX import SummaryWriter
 import sys
 sys.path.append('../')
 from common import trainer_mod
-from common import make_datalist_mod
+from common import data_index_mod
 from common import data_transform_mod
+from common import batch_augmentation_mod
 from common import dataset_mod
+from common import shard_mod
 from common import network_mod
+from common import val_scheduler_mod
+from common import report_mod
 import criterion_mod
 
 class Trainer(trainer_mod.Trainer):
-    def saveGraph(self, record_loss_train, record_loss_val):    #overwrite
+    def saveGraph(self, record_loss_train, record_loss_val, record_epoch_val):    #overwrite
         graph = plt.figure()
-        plt.plot(range(len(record_loss_train)), record_loss_train, label="Training")
-        plt.plot(range(len(record_loss_val)), record_loss_val, label="Validation")
+        plt.plot(range(1, len(record_loss_train) + 1), record_loss_train, label="Training")
+        plt.plot(record_epoch_val, record_loss_val, label="Validation")
         plt.legend()
         plt.xlabel("Epoch")
         plt.ylabel("Loss [m/s^2]")
         plt.title("loss: train=" + str(record_loss_train[-1]) + ", val=" + str(record_loss_val[-1]))
         graph.savefig("../../graph/" + self.str_hyperparameter + ".jpg")
-        plt.show()
+        report_mod.showFigures()
 
 def main():
     ## hyperparameters
@@ -36,7 +40,12 @@ def main():
     list_train_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
     list_val_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
     csv_name = "imu_camera.csv"
+    cache_rootpath = None   #e.g. "../../cache": preprocessed val images are memory-mapped from here
+    train_shard_dir = None  #e.g. "../../shards/train" (shard/pack_shards.py): tar shards are read sequentially instead of list_train_rootpath
+    val_shard_dir = None    #e.g. "../../shards/val"
+    shuffle_buffer_size = 1000  #samples shuffled within the shards of train_shard_dir
     resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
     mean_element = 0.5
     std_element = 0.5
     hor_fov_deg = 70
@@ -45,29 +54,43 @@ def main():
     lr_fc = 1e-4
     batch_size = 50
     num_epochs = 50
+    autocast_dtype = None   #e.g. torch.bfloat16: mixed precision (also on CPU)
+    num_accumulation_steps = 1  #batch_size is processed in this many micro-batches
+    val_interval = 1    #[epoch]
+    early_stopping_patience = None  #e.g. 5: stop after 5 val passes without improvement
+    resume_path = None  #e.g. "../../checkpoints/<str_hyperparameter>/epoch0010.pth": continue an interrupted run
     ## dataset
-    train_dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_train_rootpath, csv_name),
-        transform=data_transform_mod.DataTransform(
-            resize,
-            ([mean_element, mean_element, mean_element]),
-            ([std_element, std_element, std_element]),
-            hor_fov_deg=hor_fov_deg
-        ),
-        phase="train"
+    train_transform = batch_augmentation_mod.BatchDataTransform(  #data_transform_mod.DataTransform: per-image augmentation with PIL
+        resize,
+        ([mean_element, mean_element, mean_element]),
+        ([std_element, std_element, std_element]),
+        hor_fov_deg=hor_fov_deg
     )
-    val_dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_val_rootpath, csv_name),
-        transform=data_transform_mod.DataTransform(
-            resize,
-            ([mean_element, mean_element, mean_element]),
-            ([std_element, std_element, std_element]),
-            hor_fov_deg=hor_fov_deg
-        ),
-        phase="val"
+    val_transform = data_transform_mod.DataTransform(
+        resize,
+        ([mean_element, mean_element, mean_element]),
+        ([std_element, std_element, std_element]),
+        hor_fov_deg=hor_fov_deg
     )
+    if train_shard_dir is None:
+        train_dataset = dataset_mod.OriginalDataset(
+            data_list=data_index_mod.makeDataIndex(list_train_rootpath, csv_name),
+            transform=train_transform,
+            phase="train"
+        )
+    else:
+        train_dataset = shard_mod.ShardDataset(train_shard_dir, train_transform, "train", shuffle_buffer_size=shuffle_buffer_size)
+    if val_shard_dir is None:
+        val_dataset = dataset_mod.OriginalDataset(
+            data_list=data_index_mod.makeDataIndex(list_val_rootpath, csv_name),
+            transform=val_transform,
+            phase="val",
+            cache_rootpath=cache_rootpath
+        )
+    else:
+        val_dataset = shard_mod.ShardDataset(val_shard_dir, val_transform, "val")
     ## network
-    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=True)
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 9], dropout_rate=0.1, use_pretrained_vgg=True, backbone_name=backbone_name)
     ## criterion
     device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     criterion = criterion_mod.Criterion(device)
@@ -77,7 +100,11 @@ def main():
         train_dataset, val_dataset,
         net, criterion,
         optimizer_name, lr_cnn, lr_fc,
-        batch_size, num_epochs
+        batch_size, num_epochs,
+        resume_path=resume_path,
+        autocast_dtype=autocast_dtype,
+        num_accumulation_steps=num_accumulation_steps,
+        val_scheduler=val_scheduler_mod.ValScheduler(val_interval=val_interval, patience=early_stopping_patience)
     )
     trainer.train()
 
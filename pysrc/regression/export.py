@@ -0,0 +1,30 @@
+import torch
+
+import sys
+sys.path.append('../')
+from common import network_mod
+from common import export_mod
+
+def main():
+    ## hyperparameters
+    resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
+    mean_element = 0.5
+    std_element = 0.5
+    weights_path = "../../weights/regression.pth"
+    torchscript_path = "../../weights/regression.pt"
+    onnx_path = "../../weights/regression.onnx"
+    ## network
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    ## export
+    exporter = export_mod.Exporter(
+        net, weights_path, None,
+        resize,
+        ([mean_element, mean_element, mean_element]),
+        ([std_element, std_element, std_element])
+    )
+    exporter.exportTorchScript(torchscript_path)
+    exporter.exportOnnx(onnx_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import sys
+sys.path.append('../')
+from common import attitude_filter_mod
+from common import data_index_mod
+from common import data_transform_mod
+from common import dataset_mod
+from common import network_mod
+
+def main():
+    ## hyperparameters
+    list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]   #a sequence: frames in CSV order
+    csv_name = "imu_camera.csv" #acc_x, acc_y, acc_z, image, [timestamp, gyro_x, gyro_y, gyro_z]
+    resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
+    mean_element = 0.5
+    std_element = 0.5
+    weights_path = "../../weights/regression.pth"
+    camera_rate_hz = 10.0   #used when the CSV has no timestamps
+    gyro_noise = 0.01   #[rad/s/sqrt(Hz)]
+    random_walk_noise = 0.5 #[1/sqrt(s)] without gyro
+    measurement_var = 0.01  #variance of the network estimates (no covariance in regression)
+    th_skip_var = None  #e.g. 0.001: the network is skipped while trace(P) is below this
+    th_mahalanobis = None   #e.g. 11.34: outlier rejection (chi2, 3 dof, 99%)
+    ## dataset
+    dataset = dataset_mod.OriginalDataset(
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
+        transform=data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element])
+        ),
+        phase="val"
+    )
+    ## network
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    ## filter
+    ekf = attitude_filter_mod.GravityEKF(
+        gyro_noise=gyro_noise, random_walk_noise=random_walk_noise, measurement_var=measurement_var,
+        th_skip_var=th_skip_var, th_mahalanobis=th_mahalanobis
+    )
+    inference = attitude_filter_mod.FilteredInference(
+        dataset,
+        net, weights_path, None,
+        ekf,
+        camera_rate_hz=camera_rate_hz
+    )
+    inference.infer()
+
+if __name__ == '__main__':
+    main()
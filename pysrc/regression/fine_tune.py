@@ -12,10 +12,14 @@ from tensorboardX import SummaryWriter
 import sys
 sys.path.append('../')
 from common import trainer_mod
-from common import make_datalist_mod
+from common import distributed_mod
+from common import val_scheduler_mod
+from common import data_index_mod
 from common import data_transform_mod
+from common import batch_augmentation_mod
 from common import dataset_mod
 from common import network_mod
+from common import feature_cache_mod
 
 class FineTuner(trainer_mod.Trainer):
     def __init__(self,  #overwrite
@@ -23,16 +27,32 @@ class FineTuner(trainer_mod.Trainer):
             train_dataset, val_dataset,
             net, weights_path, criterion,
             optimizer_name, lr_cnn, lr_fc,
-            batch_size, num_epochs):
+            batch_size, num_epochs,
+            dataloader_config=None,
+            resume_path=None, checkpoint_interval=1, num_kept_checkpoints=3,
+            autocast_dtype=None, num_accumulation_steps=1,
+            val_scheduler=None,
+            is_head_only=False, feature_cache_rootpath="../../cache", num_feature_copies=1):
+        self.setDistributed()
         self.setRandomCondition()
-        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        self.device = distributed_mod.getDevice()
         print("self.device = ", self.device)
-        self.dataloaders_dict = self.getDataloader(train_dataset, val_dataset, batch_size)
+        self.num_accumulation_steps = num_accumulation_steps    #batch_size is split into micro-batches
         self.net = self.getSetNetwork(net, weights_path)
+        self.is_head_only = is_head_only    #True: Network.cnn is frozen and only Network.fc is trained on cached features
+        if self.is_head_only:
+            feature_train_dataset, feature_val_dataset = self.getFeatureDatasets(train_dataset, val_dataset, feature_cache_rootpath, num_feature_copies, batch_size)
+            self.dataloaders_dict = self.getDataloader(feature_train_dataset, feature_val_dataset, batch_size, dataloader_config)
+        else:
+            self.dataloaders_dict = self.getDataloader(train_dataset, val_dataset, batch_size, dataloader_config)
+        self.setAutocast(autocast_dtype)
+        self.ddp_net = self.getDdpNetwork()
         self.criterion = criterion
         self.optimizer = self.getOptimizer(optimizer_name, lr_cnn, lr_fc)
         self.num_epochs = num_epochs
         self.str_hyperparameter  = self.getStrHyperparameter(method_name, train_dataset, optimizer_name, lr_cnn, lr_fc, batch_size)
+        self.setCheckpoint(resume_path, checkpoint_interval, num_kept_checkpoints)
+        self.val_scheduler = val_scheduler if val_scheduler is not None else val_scheduler_mod.ValScheduler()
 
     def getSetNetwork(self, net, weights_path): #overwrite
         print(net)
@@ -47,8 +67,26 @@ class FineTuner(trainer_mod.Trainer):
         net.load_state_dict(loaded_weights)
         return net
 
+    def getForwardNetwork(self):    #overwrite
+        if self.is_head_only:
+            return feature_cache_mod.HeadNetwork(self.net)
+        return self.net
+
+    def getParamGroups(self, lr_cnn, lr_fc):    #overwrite
+        list_cnn_param_value, list_fc_param_value = self.net.getParamValueList()
+        if not self.is_head_only:
+            return [
+                {"params": list_cnn_param_value, "lr": lr_cnn},
+                {"params": list_fc_param_value, "lr": lr_fc}
+            ]
+        ## getParamValueList sets requires_grad of all params: Network.cnn is frozen again and left out of the optimizer
+        for param_value in list_cnn_param_value:
+            param_value.requires_grad = False
+        return [{"params": list_fc_param_value, "lr": lr_fc}]
+
     def getStrHyperparameter(self, method_name, dataset, optimizer_name, lr_cnn, lr_fc, batch_size):    #overwrite
         str_hyperparameter = method_name \
+            + "_" + self.net.backbone_name + "_" \
             + str(len(self.dataloaders_dict["train"].dataset)) + "tune" \
             + str(len(self.dataloaders_dict["val"].dataset)) + "val" \
             + str(dataset.transform.resize) + "resize" \
@@ -68,7 +106,9 @@ def main():
     list_train_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
     list_val_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
     csv_name = "imu_camera.csv"
+    cache_rootpath = None   #e.g. "../../cache": preprocessed val images are memory-mapped from here
     resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
     mean_element = 0.5
     std_element = 0.5
     hor_fov_deg = 69.4
@@ -77,11 +117,18 @@ def main():
     lr_fc = 1e-5
     batch_size = 50
     num_epochs = 50
+    autocast_dtype = None   #e.g. torch.bfloat16: mixed precision (also on CPU)
+    num_accumulation_steps = 1  #batch_size is processed in this many micro-batches
+    val_interval = 1    #[epoch]
+    early_stopping_patience = None  #e.g. 5: stop after 5 val passes without improvement
+    is_head_only = False    #True: freeze the backbone and train only the fc layers on cached features
+    feature_cache_rootpath = "../../cache"
+    resume_path = None  #e.g. "../../checkpoints/<str_hyperparameter>/epoch0010.pth": continue an interrupted run
     weights_path = "../../weights/regression.pth"
     ## dataset
     train_dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_train_rootpath, csv_name),
-        transform=data_transform_mod.DataTransform(
+        data_list=data_index_mod.makeDataIndex(list_train_rootpath, csv_name),
+        transform=batch_augmentation_mod.BatchDataTransform(  #data_transform_mod.DataTransform: per-image augmentation with PIL
             resize,
             ([mean_element, mean_element, mean_element]),
             ([std_element, std_element, std_element]),
@@ -90,17 +137,18 @@ def main():
         phase="train"
     )
     val_dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_val_rootpath, csv_name),
+        data_list=data_index_mod.makeDataIndex(list_val_rootpath, csv_name),
         transform=data_transform_mod.DataTransform(
             resize,
             ([mean_element, mean_element, mean_element]),
             ([std_element, std_element, std_element]),
             hor_fov_deg=hor_fov_deg
         ),
-        phase="val"
+        phase="val",
+        cache_rootpath=cache_rootpath
     )
     ## network
-    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False)
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
     ## criterion
     criterion = nn.MSELoss()
     ## train
@@ -109,7 +157,13 @@ def main():
         train_dataset, val_dataset,
         net, weights_path, criterion,
         optimizer_name, lr_cnn, lr_fc,
-        batch_size, num_epochs
+        batch_size, num_epochs,
+        resume_path=resume_path,
+        autocast_dtype=autocast_dtype,
+        num_accumulation_steps=num_accumulation_steps,
+        val_scheduler=val_scheduler_mod.ValScheduler(val_interval=val_interval, patience=early_stopping_patience),
+        is_head_only=is_head_only,
+        feature_cache_rootpath=feature_cache_rootpath
     )
     fine_tuner.train()
 
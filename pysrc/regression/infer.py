@@ -11,7 +11,7 @@ import torch.nn as nn
 import sys
 sys.path.append('../')
 from common import inference_mod
-from common import make_datalist_mod
+from common import data_index_mod
 from common import data_transform_mod
 from common import dataset_mod
 from common import network_mod
@@ -20,30 +20,37 @@ def main():
     ## hyperparameters
     list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
     csv_name = "imu_camera.csv"
+    cache_rootpath = None   #e.g. "../../cache": preprocessed val images are memory-mapped from here
     resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
     mean_element = 0.5
     std_element = 0.5
     batch_size = 10
     weights_path = "../../weights/regression.pth"
+    is_channels_last = False
+    autocast_dtype = None   #e.g. torch.bfloat16
     ## dataset
     dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_rootpath, csv_name),
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
         transform=data_transform_mod.DataTransform(
             resize,
             ([mean_element, mean_element, mean_element]),
             ([std_element, std_element, std_element])
         ),
-        phase="val"
+        phase="val",
+        cache_rootpath=cache_rootpath
     )
     ## network
-    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False)
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    # net = None  #weights_path is a TorchScript model, e.g. "../../weights/regression_int8.pt"
     ## criterion
     criterion = nn.MSELoss()
     ## infer
     inference = inference_mod.Inference(
         dataset,
         net, weights_path, criterion,
-        batch_size
+        batch_size,
+        is_channels_last=is_channels_last, autocast_dtype=autocast_dtype
     )
     inference.infer()
 
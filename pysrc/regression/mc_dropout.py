@@ -11,20 +11,22 @@ import torch.nn as nn
 import sys
 sys.path.append('../')
 from common import inference_mod
-from common import make_datalist_mod
+from common import data_index_mod
 from common import data_transform_mod
 from common import dataset_mod
 from common import network_mod
+from common import attitude_error_mod
+from common import mc_sampling_mod
 
 class Sample(inference_mod.Sample):
     def __init__(self,
             index,
-            inputs_path, inputs, label,
+            inputs_path, label,
             mean, cov, mul_std,
             label_r, label_p, output_r, output_p, error_r, error_p):
         super(Sample, self).__init__(
             index,
-            inputs_path, inputs, label, mean,
+            inputs_path, label, mean,
             label_r, label_p, output_r, output_p, error_r, error_p
         )
         self.cov = cov          #ndarray
@@ -40,19 +42,24 @@ class Inference(inference_mod.Inference):
             dataset,
             net, weights_path, criterion,
             batch_size,
-            num_mcsampling, th_mul_std):
+            num_mcsampling, th_mul_std,
+            use_cached_feature=True, adaptive_sampler=None,
+            dataloader_config=None, reporter=None,
+            is_channels_last=False, autocast_dtype=None):
         super(Inference, self).__init__(
             dataset,
             net, weights_path, criterion,
-            batch_size
+            batch_size,
+            dataloader_config=dataloader_config, reporter=reporter,
+            is_channels_last=is_channels_last, autocast_dtype=autocast_dtype
         )
         ## parameters
         self.num_mcsampling = num_mcsampling
         self.th_mul_std = th_mul_std
-        ## list
-        self.list_selected_samples = []
-        self.list_cov = []
-        self.list_mul_std = []
+        self.use_cached_feature = use_cached_feature   #True: compute self.net.cnn once and resample only self.net.fc
+        self.adaptive_sampler = adaptive_sampler    #mc_sampling_mod.AdaptiveMcSampler: draws until convergence (up to its max_samples), None: num_mcsampling draws
+        ## preallocated results
+        self.array_cov = np.empty((len(self.dataloader.dataset), 3, 3))
         ## set
         self.enable_dropout()
 
@@ -65,25 +72,18 @@ class Inference(inference_mod.Inference):
         ## time
         start_clock = time.time()
         ## data load
-        loss_all = 0.0
+        loss_all = torch.zeros((), device=self.device)
         for inputs, labels in tqdm(self.dataloader):
-            inputs = inputs.to(self.device)
-            labels = labels.to(self.device)
-            list_outputs = []
+            labels_numpy = labels.numpy()
+            inputs = inputs.to(self.device, non_blocking=True)
+            labels = labels.to(self.device, non_blocking=True)
             with torch.set_grad_enabled(False):
-                for _ in range(self.num_mcsampling):
-                    ## forward
-                    outputs = self.net(inputs)
-                    loss_batch = self.computeLoss(outputs, labels)
-                    ## add
-                    list_outputs.append(outputs.cpu().detach().numpy())
-                    loss_all += loss_batch.item() * inputs.size(0)
-            ## append
-            self.list_inputs += list(inputs.cpu().detach().numpy())
-            self.list_labels += labels.cpu().detach().numpy().tolist()
-            self.list_est += np.array(list_outputs).mean(0).tolist()
-            for outputs in list(np.array(list_outputs).transpose(1, 0, 2)):
-                self.list_cov.append(np.cov(outputs, rowvar=False, bias=True))
+                if self.adaptive_sampler is not None:
+                    mean, cov_mc, cov_aux, _, loss_sum = self.adaptive_sampler.sample(self.net, inputs, labels, self.computeLossAndCov, use_cached_feature=self.use_cached_feature)
+                else:
+                    mean, cov_mc, cov_aux, loss_sum = self.sampleFixed(inputs, labels)
+            loss_all += loss_sum
+            self.storeSampledBatch(labels_numpy, mean, cov_mc, cov_aux)
         ## compute error
         mae, var, ave_mul_std, selected_mae, selected_var, weighted_mae = self.computeAttitudeError()
         ## sort
@@ -96,88 +96,125 @@ class Inference(inference_mod.Inference):
         secs = (time.time() - start_clock) % 60
         print ("inference time: ", mins, " [min] ", secs, " [sec]")
         ## result
-        loss_all = loss_all / len(self.dataloader.dataset) / self.num_mcsampling
+        if self.adaptive_sampler is not None:
+            loss_all = loss_all.item() / self.adaptive_sampler.num_draws
+            average_draws = self.adaptive_sampler.getAverageDraws()
+        else:
+            loss_all = loss_all.item() / len(self.dataloader.dataset) / self.num_mcsampling
+            average_draws = self.num_mcsampling
         print("Loss: {:.4f}".format(loss_all))
+        print("average #draws = ", average_draws, " (", self.num_mcsampling / average_draws, " times fewer than num_mcsampling = ", self.num_mcsampling, ")")
         print("mae [deg] = ", mae)
         print("var [deg^2] = ", var)
         print("ave_mul_std [m^3/s^6] = ", ave_mul_std)
         print("th_mul_std = ", self.th_mul_std)
-        print("#selected samples = ", len(self.list_selected_samples), " / ", len(self.list_samples))
+        print("#selected samples = ", np.sum(self.array_is_selected), " / ", len(self.array_is_selected))
         print("selected mae [deg] = ", selected_mae)
         print("selected var [deg^2] = ", selected_var)
         print("weighted mae [deg] = ", weighted_mae)
+        ## save
+        self.reporter.saveMetrics("metrics.json", {
+            "loss": loss_all,
+            "mae[deg]": mae, "var[deg^2]": var,
+            "ave_mul_std[m^3/s^6]": ave_mul_std, "th_mul_std": self.th_mul_std,
+            "num_selected": np.sum(self.array_is_selected), "num_samples": len(self.array_is_selected),
+            "selected_mae[deg]": selected_mae, "selected_var[deg^2]": selected_var,
+            "weighted_mae[deg]": weighted_mae,
+            "average_draws": average_draws
+        })
         ## graph
-        plt.tight_layout()
-        plt.show()
+        self.reporter.show()
+
+    def sampleFixed(self, inputs, labels):
+        ## num_mcsampling draws, accumulated on the device without keeping them
+        accumulator = mc_sampling_mod.McAccumulator(inputs.size(0), 3, self.device)
+        if self.use_cached_feature:
+            ## (num_mcsampling, batch, dim) in one pass of self.net.fc
+            list_outputs_mc = [self.net.forwardMcSampling(inputs, self.num_mcsampling)]
+        else:
+            list_outputs_mc = (self.net(inputs).unsqueeze(0) for _ in range(self.num_mcsampling))
+        for outputs in list_outputs_mc:
+            num_draws = outputs.size(0)
+            loss, cov_aux = self.computeLossAndCov(outputs.reshape(-1, outputs.size(-1)), labels.repeat(num_draws, 1))
+            accumulator.updateDraws(slice(None), outputs, loss, cov_aux)
+        return accumulator.getResult()
+
+    def storeSampledBatch(self, labels_numpy, mean, cov_mc, cov_aux):
+        ## one transfer to the host per batch
+        results = torch.cat([mean, cov_mc.reshape(-1, 9)], 1).cpu().numpy()
+        begin, end = self.storeBatch(labels_numpy, results[:, :3])
+        self.array_cov[begin:end] = results[:, 3:].reshape(-1, 3, 3)
+
+    def computeLossAndCov(self, outputs, labels):
+        return self.computeLoss(outputs, labels), None
 
     def computeAttitudeError(self): #overwrite
-        list_errors = []
-        list_selected_errors = []
-        for i in range(len(self.list_labels)):
-            ## error
-            label_r, label_p = self.accToRP(self.list_labels[i])
-            output_r, output_p = self.accToRP(self.list_est[i])
-            error_r = self.computeAngleDiff(output_r, label_r)
-            error_p = self.computeAngleDiff(output_p, label_p)
-            list_errors.append([error_r, error_p])
-            ## std distance
-            mul_std = math.sqrt(self.list_cov[i][0, 0]) * math.sqrt(self.list_cov[i][1, 1]) * math.sqrt(self.list_cov[i][2, 2])
-            # std_dist = math.sqrt(self.list_cov[i][0, 0] + self.list_cov[i][1, 1] + self.list_cov[i][2, 2])
-            self.list_mul_std.append(mul_std)
-            ## register
-            sample = Sample(
-                i,
-                self.dataloader.dataset.data_list[i][3:], self.list_inputs[i], self.list_labels[i],
-                self.list_est[i], self.list_cov[i], mul_std,
-                label_r, label_p, output_r, output_p, error_r, error_p
-            )
-            self.list_samples.append(sample)
-            ## judge
-            if mul_std < self.th_mul_std:
-                self.list_selected_samples.append(sample)
-                list_selected_errors.append([error_r, error_p])
-        mae = self.computeMAE(np.array(list_errors)/math.pi*180.0)
-        var = self.computeVar(np.array(list_errors)/math.pi*180.0)
-        ave_mul_std = np.mean(self.list_mul_std, axis=0)
-        selected_mae = self.computeMAE(np.array(list_selected_errors)/math.pi*180.0)
-        selected_var = self.computeVar(np.array(list_selected_errors)/math.pi*180.0)
-        list_weighted_error = list(np.array(list_errors)/math.pi*180.0 * (1/np.array(self.list_mul_std)[:, np.newaxis]))
-        weighted_mae = np.sum(np.abs(list_weighted_error), axis=0) / np.sum(1/np.array(self.list_mul_std))
+        mae, var, _, _ = super(Inference, self).computeAttitudeError()
+        ## multiplied sigma
+        self.array_mul_std = attitude_error_mod.computeMulStd(self.array_cov)
+        ## judge
+        self.array_is_selected = self.array_mul_std < self.th_mul_std
+        ave_mul_std = np.mean(self.array_mul_std, axis=0)
+        selected_mae = attitude_error_mod.computeMAE(self.array_error_rp[self.array_is_selected]/math.pi*180.0)
+        selected_var = attitude_error_mod.computeVar(self.array_error_rp[self.array_is_selected]/math.pi*180.0)
+        weighted_mae = attitude_error_mod.computeWeightedMAE(self.array_error_rp/math.pi*180.0, 1/self.array_mul_std)
         return mae, var, ave_mul_std, selected_mae, selected_var, weighted_mae
 
+    def getSample(self, index): #overwrite
+        sample = Sample(
+            index,
+            self.dataloader.dataset.data_list.getInputsPath(index), self.array_labels[index],
+                self.array_est[index], self.array_cov[index], self.array_mul_std[index],
+            self.array_label_rp[index, 0], self.array_label_rp[index, 1],
+            self.array_output_rp[index, 0], self.array_output_rp[index, 1],
+            self.array_error_rp[index, 0], self.array_error_rp[index, 1]
+        )
+        return sample
+
+    def getResultTable(self):   #overwrite
+        list_header, list_columns = super(Inference, self).getResultTable()
+        list_header.append("mul_std")
+        list_columns.append(self.array_mul_std.tolist())
+        return list_header, list_columns
+
     def sortSamples(self):  #overwrite
-        list_sum_error_rp = [abs(sample.error_r) + abs(sample.error_p) for sample in self.list_samples]
+        array_sum_error_rp = np.sum(np.abs(self.array_error_rp), axis=1)
         ## get indicies
-        # sorted_indicies = np.argsort(list_sum_error_rp)         #error: small->large
-        # sorted_indicies = np.argsort(list_sum_error_rp)[::-1]   #error: large->small
-        sorted_indicies = np.argsort(self.list_mul_std)        #sigma: small->large
-        # sorted_indicies = np.argsort(self.list_mul_std)[::-1]  #sigma: large->small
-        ## sort
-        self.list_samples = [self.list_samples[index] for index in sorted_indicies]
+        # self.sorted_indicies = np.argsort(array_sum_error_rp)         #error: small->large
+        # self.sorted_indicies = np.argsort(array_sum_error_rp)[::-1]   #error: large->small
+        self.sorted_indicies = np.argsort(self.array_mul_std)        #sigma: small->large
+        # self.sorted_indicies = np.argsort(self.array_mul_std)[::-1]  #sigma: large->small
 
 def main():
     ## hyperparameters
     list_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
     csv_name = "imu_camera.csv"
+    cache_rootpath = None   #e.g. "../../cache": preprocessed val images are memory-mapped from here
     resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
     mean_element = 0.5
     std_element = 0.5
     batch_size = 10
     weights_path = "../../weights/regression.pth"
     num_mcsampling = 50
     th_mul_std = 0.001
+    use_cached_feature = True
+    is_adaptive = False #True: stop drawing per sample once its mean/covariance converged or mul_std is clearly on one side of th_mul_std
+    is_channels_last = False
+    autocast_dtype = None   #e.g. torch.bfloat16
     ## dataset
     dataset = dataset_mod.OriginalDataset(
-        data_list=make_datalist_mod.makeDataList(list_rootpath, csv_name),
+        data_list=data_index_mod.makeDataIndex(list_rootpath, csv_name),
         transform=data_transform_mod.DataTransform(
             resize,
             ([mean_element, mean_element, mean_element]),
             ([std_element, std_element, std_element])
         ),
-        phase="val"
+        phase="val",
+        cache_rootpath=cache_rootpath
     )
     ## network
-    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False)
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
     ## criterion
     criterion = nn.MSELoss()
     ## infer
@@ -185,7 +222,10 @@ def main():
         dataset,
         net, weights_path, criterion,
         batch_size,
-        num_mcsampling, th_mul_std
+        num_mcsampling, th_mul_std,
+        use_cached_feature=use_cached_feature,
+        adaptive_sampler=mc_sampling_mod.AdaptiveMcSampler(max_samples=num_mcsampling, th_mul_std=th_mul_std) if is_adaptive else None,
+        is_channels_last=is_channels_last, autocast_dtype=autocast_dtype
     )
     inference.infer()
 
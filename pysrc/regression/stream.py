@@ -0,0 +1,54 @@
+import math
+
+import sys
+sys.path.append('../')
+from common import stream_estimator_mod
+from common import data_transform_mod
+from common import network_mod
+
+def main():
+    ## hyperparameters
+    source_path = "../../../dataset_image_to_gravity/camera"   #directory to watch, or a video file / camera device (int) with is_video = True
+    is_video = False
+    resize = 224
+    backbone_name = "vgg16" #see network_mod.dict_backbone
+    mean_element = 0.5
+    std_element = 0.5
+    weights_path = "../../weights/regression.pth"
+    max_batch_size = 4
+    max_batch_wait_sec = 0.01   #deadline of a micro-batch after its first frame
+    max_latency_sec = 0.2   #older frames are dropped under overload
+    queue_size = 4
+    timeout_sec = None  #directory: stop after this time without a new file, None: Ctrl-C
+    is_channels_last = False
+    autocast_dtype = None   #e.g. torch.bfloat16
+    ## source
+    if is_video:
+        source = stream_estimator_mod.VideoFrameSource(source_path)
+    else:
+        source = stream_estimator_mod.DirectoryFrameSource(source_path, timeout_sec=timeout_sec)
+    ## network
+    net = network_mod.Network(resize, list_dim_fc_out=[100, 18, 3], dropout_rate=0.1, use_pretrained_vgg=False, backbone_name=backbone_name)
+    ## estimate
+    estimator = stream_estimator_mod.StreamEstimator(
+        source,
+        net, weights_path,
+        data_transform_mod.DataTransform(
+            resize,
+            ([mean_element, mean_element, mean_element]),
+            ([std_element, std_element, std_element])
+        ),
+        max_batch_size=max_batch_size, max_batch_wait_sec=max_batch_wait_sec, max_latency_sec=max_latency_sec, queue_size=queue_size,
+        is_channels_last=is_channels_last, autocast_dtype=autocast_dtype
+    )
+    try:
+        for result in estimator.run():
+            print("t = {:.3f} [s], r = {:.2f}, p = {:.2f} [deg], latency = {:.1f} [ms]".format(
+                result.timestamp, result.roll / math.pi * 180.0, result.pitch / math.pi * 180.0, result.latency * 1000.0
+            ))
+    except KeyboardInterrupt:
+        pass
+    estimator.printStatistics()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import sys
+sys.path.append('../')
+
+from common import data_index_mod
+from common import shard_mod
+
+def main():
+    ## hyperparameters
+    list_train_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/train"]
+    list_val_rootpath = ["../../../dataset_image_to_gravity/AirSim/1cam/val"]
+    csv_name = "imu_camera.csv"
+    train_shard_dir = "../../shards/train"
+    val_shard_dir = "../../shards/val"
+    num_samples_per_shard = 1000    #larger: longer sequential reads, coarser shuffling of the shards
+    seed = 0
+    ## pack
+    for list_rootpath, shard_dir in [(list_train_rootpath, train_shard_dir), (list_val_rootpath, val_shard_dir)]:
+        data_index = data_index_mod.makeDataIndex(list_rootpath, csv_name)
+        manifest = shard_mod.packShards(data_index, shard_dir, num_samples_per_shard=num_samples_per_shard, seed=seed)
+        print(shard_dir, ": ", manifest["num_samples"], " samples in ", len(manifest["list_shard"]), " shards")
+
+if __name__ == '__main__':
+    main()